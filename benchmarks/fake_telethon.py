@@ -0,0 +1,110 @@
+# benchmarks/fake_telethon.py
+"""A stand-in for telethon's TelegramClient that replays recorded message dicts
+(see synthetic.py), so the scraper can be benchmarked offline."""
+import asyncio
+import os
+import shutil
+from datetime import datetime
+from types import SimpleNamespace
+
+from telethon.tl.types import MessageMediaPhoto, PeerChannel, PhotoSize
+
+# The sizes Telegram keeps of a 1280x960 photo (type, width, height)
+PHOTO_SIZES = [('m', 320, 240), ('x', 800, 600), ('y', 1280, 960)]
+
+
+class FakeMessage(SimpleNamespace):
+    def to_dict(self):
+        return {
+            '_': 'Message',
+            'id': self.id,
+            'peer_id': {'_': 'PeerChannel', 'channel_id': self.peer_id.channel_id},
+            'date': self.date,
+            'message': self.message,
+            'views': self.views,
+            'forwards': self.forwards,
+            'post': self.post,
+        }
+
+
+def to_fake_message(record):
+    media = None
+    if record.get('media_present'):
+        sizes = [PhotoSize(type=kind, w=w, h=h, size=0) for kind, w, h in PHOTO_SIZES]
+        media = MessageMediaPhoto(photo=SimpleNamespace(id=record.get('photo_id') or record['message_id'],
+                                                        sizes=sizes))
+    return FakeMessage(
+        id=record['message_id'],
+        sender_id=record.get('sender_id'),
+        peer_id=PeerChannel(record['channel_id']),
+        date=datetime.fromisoformat(record['date']),
+        message=record.get('message_text'),
+        views=record.get('views'),
+        forwards=record.get('forwards'),
+        replies=None,
+        media=media,
+        post_author=record.get('post_author'),
+        grouped_id=record.get('grouped_id'),
+        post=record.get('is_channel_post', True),
+    )
+
+
+class FakeTelegramClient:
+    """Implements the parts of TelegramClient used by telegram_scraper.
+
+    `download_media` copies `sample_image` (if given) to the requested path
+    after `download_latency` seconds, standing in for the network. A `thumb`
+    gets the sample scaled to that size, and a latency scaled by its share of
+    the full image's bytes (downloads are bandwidth-bound).
+    """
+
+    def __init__(self, records, sample_image=None, download_latency=0.0):
+        self.messages = [to_fake_message(record) for record in records]
+        first = records[0] if records else {'channel_id': 1, 'channel_title': 'Benchmark'}
+        self.entity = SimpleNamespace(id=first['channel_id'], title=first.get('channel_title', 'Benchmark'),
+                                      username=None)
+        self.sample_image = sample_image
+        self.download_latency = download_latency
+        self.yield_times = []  # monotonic time each message was handed to the scraper
+        self.flood_sleep_threshold = 0
+        self._variants = {}  # thumb type -> scaled copy of sample_image
+
+    async def get_entity(self, channel_url):
+        return self.entity
+
+    async def iter_messages(self, entity, min_id=0, reverse=False, offset_date=None, wait_time=None):
+        loop = asyncio.get_running_loop()
+        messages = [m for m in self.messages if m.id > min_id]
+        if offset_date is not None:
+            messages = [m for m in messages if (m.date > offset_date if reverse else m.date < offset_date)]
+        if not reverse:
+            messages.reverse()
+        for index, message in enumerate(messages):
+            if index % 100 == 0:
+                await asyncio.sleep(0)  # A history page boundary: let other tasks run
+            self.yield_times.append(loop.time())
+            yield message
+
+    def _variant(self, thumb):
+        if thumb is None:
+            return self.sample_image
+        if thumb.type not in self._variants:
+            from PIL import Image
+
+            root, ext = os.path.splitext(self.sample_image)
+            path = f'{root}_{thumb.type}{ext}'
+            with Image.open(self.sample_image) as image:
+                image.resize((thumb.w, thumb.h)).save(path, 'JPEG', quality=85)
+            self._variants[thumb.type] = path
+        return self._variants[thumb.type]
+
+    async def download_media(self, message, file=None, thumb=None):
+        if self.sample_image is None:
+            if self.download_latency:
+                await asyncio.sleep(self.download_latency)
+            return None
+        source = self._variant(thumb)
+        if self.download_latency:
+            await asyncio.sleep(self.download_latency * os.path.getsize(source) / os.path.getsize(self.sample_image))
+        shutil.copyfile(source, file)
+        return file
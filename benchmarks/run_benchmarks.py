@@ -0,0 +1,704 @@
+# benchmarks/run_benchmarks.py
+"""Offline benchmarks for the pipeline hot paths.
+
+Usage (from the repository root):
+
+    python benchmarks/run_benchmarks.py                       # every benchmark
+    python benchmarks/run_benchmarks.py scrape lake_write     # a subset
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier>.json
+    python benchmarks/run_benchmarks.py --smoke scrape lake_write api   # tiny sizes, e.g. in CI
+
+Benchmarks:
+    scrape      scrape_channel over a FakeTelegramClient replaying synthetic (or --recording) messages
+    lake_write  PartitionedLakeSink, NDJSON and Parquet
+    raw_load    raw_loader COPY + merge of a synthetic lake
+    detect      YOLO over synthetic photos, batched and one image at a time
+    backends    torch vs ONNX vs INT8 ONNX: throughput, and agreement with torch's detections
+    api         the crud queries behind the report/search endpoints
+    startup     import time and memory of the entry points (python -X importtime), and the model load
+
+raw_load and api need a scratch Postgres database (--database-url or
+BENCH_DATABASE_URL): they drop and recreate the raw.* and mart tables in it.
+Without one, api runs against a SQLite fixture database with the in-memory
+search index (SEARCH_BACKEND=memory); that only shows the endpoints' queries
+still run, its numbers aren't comparable with Postgres ones.
+detect and backends need ultralytics and yolov8n.pt in --yolo-dir, backends
+also onnxruntime; point backends at real photos (--images-dir) for meaningful
+accuracy numbers. Benchmarks whose requirements are missing are reported as skipped.
+
+Each benchmark runs in a fresh process, so its peak RSS is its own. Results
+(throughput, p50/p99 latency, peak RSS) are written to a JSON file named after
+the current commit.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+BENCHMARKS = ('scrape', 'lake_write', 'raw_load', 'detect', 'backends', 'api', 'startup')
+
+
+class Skipped(Exception):
+    """A benchmark's requirements (database, model weights, packages) are missing."""
+
+
+def latency_stats(samples):
+    """p50/p99/max of durations in seconds, reported in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {'p50_ms': round(percentile(0.50), 3), 'p99_ms': round(percentile(0.99), 3),
+            'max_ms': round(ordered[-1] * 1000, 3)}
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds > 0 else None
+
+
+# --- Benchmarks (each runs in its own process, in a scratch working directory) ---
+
+def bench_scrape(options, workdir):
+    import synthetic
+    from fake_telethon import FakeTelegramClient
+    import telegram_scraper
+    from checkpoint_store import get_checkpoint_store
+    from rate_limiter import TokenBucket
+
+    if options['recording']:
+        records = synthetic.read_recording(options['recording'])
+    else:
+        records = list(synthetic.generate_messages(options['messages']))
+    sample_image = synthetic.make_image(os.path.join(workdir, 'sample.jpg'), seed=1)
+    client = FakeTelegramClient(records, sample_image=sample_image,
+                                download_latency=options['download_latency_ms'] / 1000)
+    # Effectively unlimited: measure our processing, not the request budget
+    limiter = TokenBucket(rate=1e9, capacity=1e9)
+
+    with get_checkpoint_store(backend='sqlite', state_path=os.path.join(workdir, '_state')) as store:
+        start = time.perf_counter()
+        result = asyncio.run(telegram_scraper.scrape_channel(client, 'https://t.me/benchmark',
+                                                             checkpoint_store=store, rate_limiter=limiter))
+        elapsed = time.perf_counter() - start
+
+    if result['status'] != 'success':
+        raise RuntimeError(f"scrape_channel failed: {result.get('error')}")
+    gaps = [b - a for a, b in zip(client.yield_times, client.yield_times[1:])]
+    image_bytes = sum(entry.stat().st_size for entry in os.scandir(
+        os.path.join(telegram_scraper.RAW_IMAGES_PATH, result['channel_name'])) if entry.is_file())
+    return {
+        'ingest_mode': telegram_scraper.MEDIA_INGEST_MODE,
+        'messages': result['messages_count'],
+        'images': result['images_downloaded_count'],
+        'image_mb': round(image_bytes / 1024 / 1024, 2),
+        'seconds': round(elapsed, 3),
+        'messages_per_second': rate(result['messages_count'], elapsed),
+        'per_message': latency_stats(gaps),
+    }
+
+
+def bench_lake_write(options, workdir):
+    import synthetic
+    from lake_writer import PartitionedLakeSink, get_lake_writer_class, pa
+
+    records = []
+    for record in synthetic.generate_messages(options['messages']):
+        record['raw_message_json'] = {'_': 'Message', 'id': record['message_id'], 'message': record['message_text']}
+        records.append(record)
+
+    results = {}
+    for lake_format in ('ndjson', 'parquet'):
+        if lake_format == 'parquet' and pa is None:
+            results[lake_format] = {'skipped': 'pyarrow is not installed'}
+            continue
+        block_times = []
+        sink = PartitionedLakeSink(os.path.join(workdir, lake_format), 'chemed', 'bench',
+                                   writer_class=get_lake_writer_class(lake_format))
+        start = block_start = time.perf_counter()
+        for index, record in enumerate(records, 1):
+            sink.write(record)
+            if index % 1000 == 0:
+                now = time.perf_counter()
+                block_times.append((now - block_start) / 1000)
+                block_start = now
+        sink.close()
+        elapsed = time.perf_counter() - start
+        results[lake_format] = {
+            'messages': len(records),
+            'files': len(sink.completed_files),
+            'seconds': round(elapsed, 3),
+            'messages_per_second': rate(len(records), elapsed),
+            'per_message': latency_stats(block_times),
+        }
+    return results
+
+
+def bench_raw_load(options, workdir):
+    if not options['database_url']:
+        raise Skipped('no --database-url / BENCH_DATABASE_URL')
+    import psycopg2
+    import synthetic
+    from lake_writer import PartitionedLakeSink
+    import raw_loader
+
+    messages = list(synthetic.generate_messages(options['messages']))
+    with PartitionedLakeSink(raw_loader.RAW_MESSAGES_PATH, 'chemed', 'bench') as sink:
+        for record in messages:
+            sink.write(record)
+    with PartitionedLakeSink(raw_loader.RAW_MEDIA_RESULTS_PATH, 'chemed', 'bench') as sink:
+        for record in messages:
+            if record['media_present']:
+                sink.write({'message_id': record['message_id'], 'channel_id': record['channel_id'],
+                            'date': record['date'], 'media_type': 'photo',
+                            'media_file_path': f"/bench/{record['message_id']}.jpg",
+                            'media_status': 'downloaded'})
+
+    conn = psycopg2.connect(options['database_url'])
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS raw.telegram_messages, raw.telegram_media, raw.loaded_files")
+        conn.commit()
+        raw_loader.ensure_tables(conn)
+        file_times, rows = [], 0
+        start = time.perf_counter()
+        for kind, path in raw_loader.discover_lake_files():
+            file_start = time.perf_counter()
+            rows += raw_loader.load_file(conn, kind, path)
+            file_times.append(time.perf_counter() - file_start)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+    return {
+        'rows': rows,
+        'files': len(file_times),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': rate(rows, elapsed),
+        'per_file': latency_stats(file_times),
+    }
+
+
+def bench_detect(options, workdir):
+    weights = os.path.join(options['yolo_dir'], 'yolov8n.pt')
+    if not os.path.exists(weights):
+        raise Skipped(f'{weights} not found')
+    try:
+        import ultralytics  # noqa: F401
+    except ImportError:
+        raise Skipped('ultralytics is not installed')
+    import synthetic
+
+    images = synthetic.make_images(os.path.join(workdir, 'images'), options['images'])
+    os.environ['YOLO_MODEL_PATH'] = weights
+    import image_processor
+
+    items = list(enumerate(images))
+    load_start = time.perf_counter()
+    image_processor.get_model()  # Load and warm up outside the timed loops
+    model_load_seconds = time.perf_counter() - load_start
+
+    batch_size = image_processor.YOLO_BATCH_SIZE
+    batch_times = []
+    start = batch_start = time.perf_counter()
+    for index, _ in enumerate(image_processor.process_images_batched(items), 1):
+        if index % batch_size == 0 or index == len(items):
+            now = time.perf_counter()
+            batch_times.append(now - batch_start)
+            batch_start = now
+    batched_elapsed = time.perf_counter() - start
+
+    single = images[:max(1, len(images) // 4)]
+    single_times = []
+    for path in single:
+        image_start = time.perf_counter()
+        image_processor.process_image(path)
+        single_times.append(time.perf_counter() - image_start)
+
+    return {
+        'images': len(images),
+        'batch_size': batch_size,
+        'model_load_seconds': round(model_load_seconds, 3),
+        'batched': {'seconds': round(batched_elapsed, 3), 'images_per_second': rate(len(images), batched_elapsed),
+                    'per_batch': latency_stats(batch_times)},
+        'single': {'images': len(single), 'images_per_second': rate(len(single), sum(single_times)),
+                   'per_image': latency_stats(single_times)},
+    }
+
+
+def _box_iou(a, b):
+    """IoU of two normalized xywh boxes"""
+    ax1, ay1, ax2, ay2 = a[0] - a[2] / 2, a[1] - a[3] / 2, a[0] + a[2] / 2, a[1] + a[3] / 2
+    bx1, by1, bx2, by2 = b[0] - b[2] / 2, b[1] - b[3] / 2, b[0] + b[2] / 2, b[1] + b[3] / 2
+    overlap = max(0.0, min(ax2, bx2) - max(ax1, bx1)) * max(0.0, min(ay2, by2) - max(ay1, by1))
+    union = a[2] * a[3] + b[2] * b[3] - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def _agreement(reference, candidate, iou_threshold=0.5):
+    """How closely `candidate` detections reproduce `reference` ones, over all images.
+
+    A candidate detection matches the highest-IoU unmatched reference detection of
+    the same class with IoU >= iou_threshold (greedy, most confident first).
+    """
+    matched, ious, confidence_deltas = 0, [], []
+    reference_count = sum(len(detections) for detections in reference)
+    candidate_count = sum(len(detections) for detections in candidate)
+    for expected, actual in zip(reference, candidate):
+        unmatched = list(expected)
+        for detection in sorted(actual, key=lambda d: d['confidence'], reverse=True):
+            scored = [(_box_iou(detection['bbox'], other['bbox']), index) for index, other in enumerate(unmatched)
+                      if other['class_id'] == detection['class_id']]
+            iou, index = max(scored, default=(0.0, None))
+            if iou >= iou_threshold:
+                matched += 1
+                ious.append(iou)
+                confidence_deltas.append(abs(detection['confidence'] - unmatched.pop(index)['confidence']))
+    return {
+        'detections': candidate_count,
+        'recall': round(matched / reference_count, 4) if reference_count else None,
+        'precision': round(matched / candidate_count, 4) if candidate_count else None,
+        'mean_iou': round(sum(ious) / len(ious), 4) if ious else None,
+        'mean_confidence_delta': round(sum(confidence_deltas) / len(confidence_deltas), 4) if ious else None,
+    }
+
+
+def bench_backends(options, workdir):
+    """Speed and accuracy of every inference backend, relative to torch.
+
+    The ONNX export and INT8 calibration (on a sample of the images) happen in
+    `prepare_seconds` and are cached in the scratch directory. Accuracy is the
+    agreement with the torch backend's detections on the same images, not with
+    ground truth; pass --images-dir with real lake photos for meaningful numbers.
+    """
+    weights = os.path.join(options['yolo_dir'], 'yolov8n.pt')
+    if not os.path.exists(weights):
+        raise Skipped(f'{weights} not found')
+    try:
+        import ultralytics  # noqa: F401
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise Skipped(f'{e.name} is not installed')
+    import synthetic
+
+    if options['images_dir']:
+        images_dir = options['images_dir']
+    else:
+        images_dir = os.path.join(workdir, 'images')
+        synthetic.make_images(images_dir, options['images'])
+    os.environ['YOLO_EXPORT_DIR'] = os.path.join(workdir, 'models')
+    import detection_backends
+    import image_processor
+
+    paths = sorted(os.path.join(directory, name) for directory, _, names in os.walk(images_dir)
+                   for name in names if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))[:options['images']]
+    images = [image_processor.load_image(path) for path in paths]
+    batch_size = image_processor.YOLO_BATCH_SIZE
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+
+    results, reference = {'images': len(images), 'batch_size': batch_size}, None
+    for backend in detection_backends.BACKENDS:
+        start = time.perf_counter()
+        model_file = detection_backends.model_file(
+            backend, weights, image_processor.YOLO_IMAGE_SIZE,
+            calibration_images=lambda: image_processor.sample_calibration_images(images_dir))
+        prepare_seconds = time.perf_counter() - start
+        model = detection_backends.load_backend(backend, weights, image_processor.YOLO_IMAGE_SIZE)
+        model.detect(batches[0][:1])  # Warm-up
+
+        detections, batch_times = [], []
+        for batch in batches:
+            batch_start = time.perf_counter()
+            detections.extend(model.detect(batch))
+            batch_times.append(time.perf_counter() - batch_start)
+        elapsed = sum(batch_times)
+
+        results[backend] = {
+            'model_mb': round(os.path.getsize(model_file) / 1e6, 1),
+            'prepare_seconds': round(prepare_seconds, 3),
+            'images_per_second': rate(len(images), elapsed),
+            'per_batch': latency_stats(batch_times),
+        }
+        if reference is None:
+            reference, reference_seconds = detections, elapsed
+            results[backend]['detections'] = sum(len(image_detections) for image_detections in detections)
+        else:
+            results[backend]['speedup'] = round(reference_seconds / elapsed, 2) if elapsed else None
+            results[backend]['vs_torch'] = _agreement(reference, detections)
+        del model
+    return results
+
+
+def _seed_marts(engine, options):
+    """Recreates the mart tables the API reads and fills them with synthetic data."""
+    import models
+    import synthetic
+    from psycopg2.extras import execute_values
+
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("""
+            INSERT INTO dim_dates (date, year, month, day, quarter, day_of_week, day_of_year, is_weekend)
+            SELECT d, EXTRACT(YEAR FROM d), EXTRACT(MONTH FROM d), EXTRACT(DAY FROM d), EXTRACT(QUARTER FROM d),
+                   EXTRACT(DOW FROM d), EXTRACT(DOY FROM d), EXTRACT(DOW FROM d) IN (0, 6)
+            FROM generate_series('2020-01-01'::date, '2030-12-31'::date, '1 day') AS d
+            """)
+        rows = []
+        per_channel = max(1, options['messages'] // len(synthetic.CHANNELS))
+        for channel_index, channel in enumerate(synthetic.CHANNELS):
+            cur.execute("INSERT INTO dim_channels (channel_key, channel_name) VALUES (%s, %s)", (channel, channel))
+            for record in synthetic.generate_messages(per_channel, channel=channel, seed=channel_index):
+                rows.append((f"{channel}:{record['message_id']}", record['message_id'], channel,
+                             record['date'][:10], record['message_text'], record['views'], record['media_present']))
+        execute_values(cur, """
+            INSERT INTO fct_messages (message_key, message_id, channel_key, date_key, message_text, view_count, has_media)
+            VALUES %s""", rows, page_size=5000)
+        cur.execute(f"""
+            UPDATE fct_messages SET
+                search_vector = to_tsvector('simple', COALESCE(message_text, '')),
+                message_length = LENGTH(message_text),
+                contains_drug_mention = message_text ~* '\\m({'|'.join(synthetic.DRUG_NAMES)})\\M';
+            CREATE INDEX ON fct_messages USING GIN (search_vector);
+            CREATE INDEX ON fct_messages (channel_key, date_key);
+            CREATE INDEX ON fct_messages (date_key DESC, message_key DESC);
+            INSERT INTO fct_image_detections (detection_id, message_key, class_id, class_name, confidence, bbox, detection_category)
+            SELECT row_number() OVER (), message_key, 39, (ARRAY['bottle', 'pill', 'person'])[1 + message_id % 3],
+                   0.8, '[0.5, 0.5, 0.2, 0.2]', CASE WHEN message_id % 3 < 2 THEN 'medical' ELSE 'other' END
+            FROM fct_messages WHERE has_media;
+            INSERT INTO agg_product_mentions (product_name, mention_count, message_count, channel_count)
+            SELECT match[1], COUNT(*), COUNT(DISTINCT message_key), COUNT(DISTINCT channel_key)
+            FROM fct_messages, LATERAL regexp_matches(LOWER(message_text), '\\m({'|'.join(synthetic.DRUG_NAMES)})\\M', 'g') AS match
+            GROUP BY match[1];
+            INSERT INTO agg_channel_activity (channel_key, granularity, period_start, channel_name, message_count,
+                                              view_count, media_count, drug_mention_count)
+            SELECT m.channel_key, g.granularity, DATE_TRUNC(g.granularity, m.date_key)::date, MIN(c.channel_name),
+                   COUNT(*), SUM(m.view_count), COUNT(*) FILTER (WHERE m.has_media),
+                   COUNT(*) FILTER (WHERE m.contains_drug_mention)
+            FROM fct_messages m
+            JOIN dim_channels c ON c.channel_key = m.channel_key
+            CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS g(granularity)
+            GROUP BY 1, 2, 3;
+            ANALYZE;
+            """)
+        raw.commit()
+    finally:
+        raw.close()
+    return len(rows)
+
+
+def _seed_fixture_marts(engine, options):
+    """Fills the mart tables of a non-Postgres (SQLite) database with the same
+    synthetic data as _seed_marts, computing the dbt-built columns in Python."""
+    import re
+    from collections import defaultdict
+    from datetime import date, timedelta
+    from sqlalchemy.dialects.postgresql import TSVECTOR
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.orm import Session
+    import models
+    import synthetic
+
+    compiles(TSVECTOR, engine.dialect.name)(lambda element, compiler, **kw: 'TEXT')  # Unused without Postgres FTS
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    drug_pattern = re.compile(rf"\b({'|'.join(synthetic.DRUG_NAMES)})\b")
+    messages, dates = [], set()
+    mentions = defaultdict(lambda: {'mention_count': 0, 'messages': set(), 'channels': set()})
+    activity = defaultdict(lambda: {'message_count': 0, 'view_count': 0, 'media_count': 0, 'drug_mention_count': 0})
+    per_channel = max(1, options['messages'] // len(synthetic.CHANNELS))
+    for channel_index, channel in enumerate(synthetic.CHANNELS):
+        for record in synthetic.generate_messages(per_channel, channel=channel, seed=channel_index):
+            message_key = f"{channel}:{record['message_id']}"
+            date_key = date.fromisoformat(record['date'][:10])
+            found = drug_pattern.findall(record['message_text'].lower())
+            messages.append(dict(message_key=message_key, message_id=record['message_id'], channel_key=channel,
+                                 date_key=date_key, message_text=record['message_text'], view_count=record['views'],
+                                 has_media=record['media_present'], message_length=len(record['message_text']),
+                                 contains_drug_mention=bool(found)))
+            dates.add(date_key)
+            for product in found:
+                mentions[product]['mention_count'] += 1
+                mentions[product]['messages'].add(message_key)
+                mentions[product]['channels'].add(channel)
+            periods = {'day': date_key, 'week': date_key - timedelta(days=date_key.weekday()),
+                       'month': date_key.replace(day=1)}
+            for granularity, period_start in periods.items():
+                totals = activity[(channel, granularity, period_start)]
+                totals['message_count'] += 1
+                totals['view_count'] += record['views']
+                totals['media_count'] += record['media_present']
+                totals['drug_mention_count'] += bool(found)
+
+    with Session(engine) as session:
+        session.execute(models.Date.__table__.insert(), [
+            dict(date=d, year=d.year, month=d.month, day=d.day, quarter=(d.month - 1) // 3 + 1,
+                 day_of_week=d.isoweekday() % 7, day_of_year=d.timetuple().tm_yday, is_weekend=d.weekday() >= 5)
+            for d in sorted(dates)])
+        session.execute(models.Channel.__table__.insert(),
+                        [dict(channel_key=channel, channel_name=channel) for channel in synthetic.CHANNELS])
+        session.execute(models.Message.__table__.insert(), messages)
+        session.execute(models.Detection.__table__.insert(), [
+            dict(detection_id=index, message_key=m['message_key'], class_id=39,
+                 class_name=('bottle', 'pill', 'person')[m['message_id'] % 3], confidence=0.8,
+                 bbox=[0.5, 0.5, 0.2, 0.2], detection_category='medical' if m['message_id'] % 3 < 2 else 'other')
+            for index, m in enumerate((m for m in messages if m['has_media']), start=1)])
+        session.execute(models.ProductMention.__table__.insert(), [
+            dict(product_name=product, mention_count=totals['mention_count'],
+                 message_count=len(totals['messages']), channel_count=len(totals['channels']))
+            for product, totals in mentions.items()])
+        session.execute(models.ChannelActivity.__table__.insert(), [
+            dict(channel_key=channel, granularity=granularity, period_start=period_start, channel_name=channel,
+                 **totals)
+            for (channel, granularity, period_start), totals in activity.items()])
+        session.commit()
+    return len(messages)
+
+
+def bench_api(options, workdir):
+    import crud
+    from database import SessionLocal, engine
+
+    if engine.dialect.name == 'postgresql':
+        message_count = _seed_marts(engine, options)
+    else:
+        message_count = _seed_fixture_marts(engine, options)
+    queries = {
+        'top_products': lambda db: crud.get_top_products(db, 10),
+        'channel_activity_day': lambda db: crud.get_channel_activity(db, 'chemed', 'day'),
+        'channel_activity_month': lambda db: crud.get_channel_activity(db, 'chemed', 'month'),
+        'search_fts': lambda db: crud.search_messages(db, 'paracetamol delivery', limit=50),
+        'search_substring': lambda db: crud.search_messages(db, 'tablets', mode='substring', limit=50),
+        'visual_content': lambda db: crud.get_visual_content_stats(db),
+    }
+    results = {'database': engine.dialect.name, 'messages': message_count}
+    db = SessionLocal()
+    try:
+        for name, query in queries.items():
+            query(db)  # Warm-up
+            times = []
+            for _ in range(options['api_iterations']):
+                query_start = time.perf_counter()
+                query(db)
+                times.append(time.perf_counter() - query_start)
+            results[name] = {'queries_per_second': rate(len(times), sum(times)), **latency_stats(times)}
+    finally:
+        db.close()
+    return results
+
+
+STARTUP_TARGETS = {
+    # name: (directory the entry point runs from, code to time)
+    'image_processor_import': ('src', 'import image_processor'),
+    'image_processor_model': ('src', 'import image_processor; image_processor.get_model()'),
+    'raw_loader_import': ('src', 'import raw_loader'),
+    'detection_runner_import': ('src', 'import detection_runner'),
+    'api_import': (os.path.join('src', 'app'), 'import main2'),
+}
+
+
+def _parse_importtime(stderr, max_depth=1):
+    """[(module, cumulative ms)] from `python -X importtime` output, down to `max_depth`
+    (0: imported by the entry point, 1: imported by those modules)."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= max_depth:
+            imports.append((name.strip(), int(cumulative) / 1000))
+    return imports
+
+
+def bench_startup(options, workdir):
+    weights = os.path.join(options['yolo_dir'], 'yolov8n.pt')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(ROOT_DIR, 'src'),
+                                                       os.path.join(ROOT_DIR, 'src', 'scraping')]),
+               YOLO_MODEL_PATH=weights,
+               # Only needs to parse: creating the engine doesn't connect
+               DATABASE_URL=os.environ.get('DATABASE_URL', 'postgresql+psycopg2://bench@localhost/bench'))
+    report_rss = ("; import resource, sys; "
+                  "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.__stdout__)")
+    # Modules every interpreter imports at startup aren't ours to fix
+    bare = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'], capture_output=True, text=True)
+    interpreter_modules = {module for module, _ in _parse_importtime(bare.stderr, max_depth=99)}
+
+    results = {}
+    for name, (directory, code) in STARTUP_TARGETS.items():
+        if 'get_model' in code and not os.path.exists(weights):
+            results[name] = {'skipped': f'{weights} not found'}
+            continue
+        target_env = dict(env, PYTHONPATH=os.pathsep.join([os.path.join(ROOT_DIR, directory), env['PYTHONPATH']]))
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code + report_rss],
+                                   cwd=workdir, env=target_env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if completed.returncode != 0:
+            results[name] = {'error': completed.stderr.strip().splitlines()[-1]}
+            continue
+        imports = [(module, ms) for module, ms in _parse_importtime(completed.stderr)
+                   if module not in interpreter_modules and module != 'resource']
+        divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        results[name] = {
+            'seconds': round(elapsed, 3),
+            'peak_rss_mb': round(int(completed.stdout.split()[-1]) / divisor, 1),
+            'slowest_imports_ms': {module: round(ms, 1) for module, ms in
+                                   sorted(imports, key=lambda item: item[1], reverse=True)[:6]},
+        }
+    return results
+
+
+def run_benchmark(name, options):
+    """Entry point of the benchmark process."""
+    workdir = tempfile.mkdtemp(prefix=f'bench_{name}_')
+    os.environ.update({
+        'DATA_LAKE_PATH': os.path.join(workdir, 'lake'),
+        'SCRAPER_STATE_PATH': os.path.join(workdir, '_state'),
+        'MEDIA_CACHE_ENABLED': 'false',
+        'MEDIA_INGEST_MODE': options['ingest_mode'],
+    })
+    if options['database_url']:
+        # The same database for psycopg2 (raw_loader) and SQLAlchemy (the API), which needs the driver spelled out
+        scheme, rest = options['database_url'].split('://', 1)
+        os.environ['DATABASE_URL'] = f'postgresql+psycopg2://{rest}' if scheme in ('postgres', 'postgresql') else options['database_url']
+    elif name == 'api':
+        # No Postgres: a SQLite fixture database, searched through the in-memory index
+        os.environ.update({'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'api.db')}",
+                           'SEARCH_BACKEND': 'memory'})
+    for path in (BENCH_DIR, os.path.join(ROOT_DIR, 'src', 'app'), os.path.join(ROOT_DIR, 'src', 'scraping'),
+                 os.path.join(ROOT_DIR, 'src')):
+        sys.path.insert(0, path)
+    os.makedirs(os.path.join(workdir, 'logs'))
+    os.chdir(workdir)  # Modules create log files and directories relative to the working directory
+
+    import logging
+    logging.disable(logging.INFO)  # Progress logging would dominate the hot paths
+
+    try:
+        result = globals()[f'bench_{name}'](options, workdir)
+    except Skipped as e:
+        return {'skipped': str(e)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def flatten(results, prefix=''):
+    """{'scrape': {'per_message': {'p50_ms': 1}}} -> {'scrape.per_message.p50_ms': 1}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(baseline_path, results):
+    with open(baseline_path) as f:
+        baseline = flatten(json.load(f)['results'])
+    current = flatten(results)
+    print(f"\n{'metric':<50} {'baseline':>12} {'current':>12} {'change':>8}")
+    for metric in sorted(set(baseline) & set(current)):
+        old, new = baseline[metric], current[metric]
+        change = f'{(new - old) / old:+.1%}' if old else ''
+        print(f'{metric:<50} {old:>12} {new:>12} {change:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--messages', type=int, default=20000, help='Synthetic messages per benchmark')
+    parser.add_argument('--images', type=int, default=64, help='Synthetic images for detect and backends')
+    parser.add_argument('--images-dir', help='Photos for backends instead of synthetic ones (e.g. the lake telegram_images)')
+    parser.add_argument('--recording', help='NDJSON of recorded message dicts for scrape (see synthetic.py)')
+    parser.add_argument('--download-latency-ms', type=float, default=0.0,
+                        help='Simulated download time of a full-size photo (smaller variants take proportionally less)')
+    parser.add_argument('--ingest-mode', default=os.getenv('MEDIA_INGEST_MODE', 'original'),
+                        choices=['original', 'thumb', 'resize'], help='MEDIA_INGEST_MODE for scrape')
+    parser.add_argument('--api-iterations', type=int, default=200, help='Timed calls per API query')
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL'),
+                        help='Scratch Postgres database for raw_load and api (its tables are replaced; '
+                             'api falls back to a SQLite fixture database)')
+    parser.add_argument('--yolo-dir', default=os.getcwd(), help='Directory containing yolov8n.pt')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<timestamp>_<commit>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--smoke', action='store_true',
+                        help='Tiny sizes: only checks that the benchmarks run (e.g. in CI), the numbers mean little')
+    args = parser.parse_args()
+    if args.smoke:
+        args.messages, args.images, args.api_iterations = 300, 2, 3
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    options = {key: getattr(args, key) for key in
+               ('messages', 'images', 'images_dir', 'recording', 'download_latency_ms', 'ingest_mode',
+                'api_iterations', 'database_url', 'yolo_dir', 'smoke')}
+    if options['recording']:
+        options['recording'] = os.path.abspath(options['recording'])
+    if options['images_dir']:
+        options['images_dir'] = os.path.abspath(options['images_dir'])
+    options['yolo_dir'] = os.path.abspath(options['yolo_dir'])
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in args.benchmarks or BENCHMARKS:
+        print(f'Running {name}...', flush=True)
+        with context.Pool(1) as pool:
+            try:
+                results[name] = pool.apply(run_benchmark, (name, options))
+            except Exception as e:
+                results[name] = {'error': f'{type(e).__name__}: {e}'}
+        print(json.dumps(results[name], indent=2), flush=True)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': {key: value for key, value in options.items() if key != 'database_url'},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d%H%M%S}_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
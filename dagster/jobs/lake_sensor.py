@@ -0,0 +1,118 @@
+# dagster/jobs/lake_sensor.py
+"""Micro-batches: load and detect lake files as soon as the scraper completes them.
+
+`lake_files_sensor` lists completed chunks under RAW_MESSAGES_PATH and
+RAW_MEDIA_RESULTS_PATH that appeared since its cursor and launches a small
+`lake_microbatch_job` run for them. The run loads just those files into raw.*
+and runs YOLO on just the photos listed in the media files. Photos are found
+through the media outcome records, which are written once a batch's downloads
+finish, rather than by watching RAW_IMAGES_PATH. Detection therefore no longer
+waits for a full scrape and a dbt run to expose them in stg_telegram_messages.
+
+Nothing is processed twice: the loader skips files already in raw.loaded_files,
+and detection only claims photos whose job in raw.detection_jobs is still open.
+"""
+import hashlib
+import json
+import os
+from typing import List
+
+from dagster import Config, DefaultSensorStatus, Failure, RunRequest, SkipReason, job, op, sensor
+
+from jobs.telegram_pipeline import detect_lake_media, metrics_metadata, pipeline_executor
+
+LAKE_SENSOR_INTERVAL_SECONDS = int(os.getenv("LAKE_SENSOR_INTERVAL_SECONDS", 60))
+# Files per micro-batch run; a burst of new files is split over several runs
+LAKE_SENSOR_MAX_FILES = int(os.getenv("LAKE_SENSOR_MAX_FILES", 50))
+
+
+class LoadLakeFilesConfig(Config):
+    files: List[List[str]] = []  # [kind, path] pairs, as from raw_loader.discover_lake_files
+
+
+class DetectLakeImagesConfig(Config):
+    media_files: List[str] = []
+
+
+@op
+def load_lake_files(context, config: LoadLakeFilesConfig):
+    """COPY + merge the batch's lake files into raw.telegram_messages / raw.telegram_media"""
+    import raw_loader
+
+    stats = raw_loader.load_raw_to_postgres(files=[tuple(pair) for pair in config.files])
+    if stats["files_failed"]:
+        raise Failure(description=f"{stats['files_failed']} lake file(s) failed to load")
+    context.add_output_metadata({**stats, **metrics_metadata()})
+    return stats
+
+
+@op(pool="yolo")
+def detect_lake_images(context, config: DetectLakeImagesConfig):
+    """YOLO over the photos listed in the batch's media outcome files"""
+    stats = detect_lake_media(config.media_files)
+    context.add_output_metadata({**stats, **metrics_metadata()})
+    return stats
+
+
+@job(executor_def=pipeline_executor)
+def lake_microbatch_job():
+    # Independent: loading and detection run side by side
+    load_lake_files()
+    detect_lake_images()
+
+
+def find_new_lake_files(cursor):
+    """Completed lake files that changed after `cursor`, as (ctime, kind, path), oldest first.
+
+    Chunks are renamed into place when complete, and a rename updates ctime but
+    not mtime. So ctime orders files by when they became complete, and a chunk
+    written early but finalised late is still seen. `cursor` holds the newest
+    ctime seen and the files at exactly that ctime. Only partition directories
+    modified since the cursor are listed, so a tick doesn't stat the whole lake.
+    """
+    import raw_loader
+
+    seen_at_cursor = set(cursor["paths"])
+    found = []
+    for kind, path in raw_loader.discover_lake_files(changed_since=cursor["ctime"]):
+        try:
+            changed = os.stat(path).st_ctime
+        except FileNotFoundError:
+            continue  # Removed since it was listed
+        if changed > cursor["ctime"] or (changed == cursor["ctime"] and path not in seen_at_cursor):
+            found.append((changed, kind, path))
+    return sorted(found)
+
+
+def advance_cursor(cursor, files):
+    newest = max(changed for changed, _, _ in files)
+    paths = [path for changed, _, path in files if changed == newest]
+    if newest == cursor["ctime"]:
+        paths += cursor["paths"]
+    return {"ctime": newest, "paths": paths}
+
+
+def microbatch_run_config(files):
+    return {"ops": {
+        "load_lake_files": {"config": {"files": [[kind, path] for _, kind, path in files]}},
+        "detect_lake_images": {"config": {"media_files": [path for _, kind, path in files if kind == "media"]}},
+    }}
+
+
+@sensor(job=lake_microbatch_job, minimum_interval_seconds=LAKE_SENSOR_INTERVAL_SECONDS,
+        default_status=DefaultSensorStatus.RUNNING)
+def lake_files_sensor(context):
+    """Launches a lake_microbatch_job run for every LAKE_SENSOR_MAX_FILES new lake files."""
+    cursor = json.loads(context.cursor) if context.cursor else {"ctime": 0, "paths": []}
+    new_files = find_new_lake_files(cursor)
+    if not new_files:
+        return SkipReason("No new lake files")
+
+    run_requests = []
+    for start in range(0, len(new_files), LAKE_SENSOR_MAX_FILES):
+        batch = new_files[start:start + LAKE_SENSOR_MAX_FILES]
+        # Stable key: if the cursor update is lost, the same batch isn't launched twice
+        run_key = hashlib.sha1("\n".join(path for _, _, path in batch).encode()).hexdigest()
+        run_requests.append(RunRequest(run_key=run_key, run_config=microbatch_run_config(batch)))
+    context.update_cursor(json.dumps(advance_cursor(cursor, new_files)))
+    return run_requests
@@ -1,7 +1,8 @@
 # dagster/repository.py
 from dagster import repository
-from jobs.telegram_pipeline import telegram_pipeline
+from jobs.telegram_pipeline import pipeline_assets, pipeline_jobs, pipeline_schedules
+from jobs.lake_sensor import lake_microbatch_job, lake_files_sensor
 
 @repository
 def telegram_repository():
-    return [telegram_pipeline]
\ No newline at end of file
+    return [*pipeline_assets, *pipeline_jobs, *pipeline_schedules, lake_microbatch_job, lake_files_sensor]
@@ -1,115 +1,276 @@
 # dagster/jobs/telegram_pipeline.py
-from dagster import job, op, get_dagster_logger
-import subprocess
+"""The pipeline as software-defined assets, partitioned by channel and by day.
+
+    raw_telegram_messages  (channel x date)  scrape one channel's day into the lake
+      ├─ raw_telegram_tables  (channel x date)  COPY that day's lake files into raw.*
+      └─ image_detections     (channel x date)  YOLO over that day's downloaded photos
+    dbt_marts                                   dbt run over everything loaded so far
+
+The scraper, loader and detector run in-process (src/ is put on sys.path), so a
+step pays no interpreter start-up and the model loads once per step process.
+Within a run, loading and detection of a partition run side by side on the
+multiprocess executor; across runs, partitions of different channels and days
+run in parallel, bounded by the instance's run queue and the `telegram_api` and
+`yolo` concurrency pools (see dagster.yaml). Runs of the same channel are queued
+one at a time (a tag concurrency limit on the channel partition dimension), and
+the scraper also holds a per-channel lock while it writes the lake.
+"""
+import asyncio
+import json
 import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+from dagster import (
+    AssetSelection,
+    Backoff,
+    DailyPartitionsDefinition,
+    Failure,
+    MultiPartitionKey,
+    MultiPartitionsDefinition,
+    RetryPolicy,
+    RetryRequested,
+    RunRequest,
+    StaticPartitionsDefinition,
+    asset,
+    define_asset_job,
+    get_dagster_logger,
+    multiprocess_executor,
+    schedule,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
 logger = get_dagster_logger()
 
-@op
-def scrape_telegram_data(context):
-    """Scrape data from Telegram channels"""
-    logger.info("Starting Telegram scraping")
-    try:
-        result = subprocess.run(
-            ["python", "telegram_scraper.py"],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            logger.error(f"Scraping failed: {result.stderr}")
-            raise Exception("Telegram scraping failed")
-        
-        logger.info("Telegram scraping completed successfully")
-        return True
-    
-    except Exception as e:
-        logger.error(f"Error in scraping: {str(e)}")
-        raise
-
-@op
-def load_raw_to_postgres(context, scrape_success):
-    """Load raw data into PostgreSQL"""
-    if not scrape_success:
-        raise Exception("Skipping load due to previous failure")
-    
-    logger.info("Loading raw data to PostgreSQL")
+# The assets import the pipeline modules the same way the scripts run: src/ for the
+# loader and detector, src/scraping for the scraper and its siblings
+SRC_PATH = os.path.abspath(os.getenv("PIPELINE_SRC_PATH",
+                                     os.path.join(os.path.dirname(__file__), "..", "..", "src")))
+for path in (SRC_PATH, os.path.join(SRC_PATH, "scraping")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+DBT_PROJECT_DIR = os.getenv("DBT_PROJECT_DIR", "dbt")
+
+# Same channel handles as telegram_scraper.TELEGRAM_CHANNELS (TELEGRAM_CHANNELS env var)
+CHANNELS = [handle.strip() for handle in
+            os.getenv("TELEGRAM_CHANNELS", "chemed_chem,lobelia4cosmetics,tikvahpharma").split(",")]
+PIPELINE_START_DATE = os.getenv("PIPELINE_START_DATE", "2024-01-01")
+# Steps run at the same time within one run
+PIPELINE_MAX_CONCURRENT_STEPS = int(os.getenv("PIPELINE_MAX_CONCURRENT_STEPS", 4))
+# Channels scraped at the same time across runs; set the `telegram_api` pool limit to the same
+# value. Each scrape gets an equal share of TELEGRAM_REQUESTS_PER_SECOND.
+PIPELINE_TELEGRAM_CONCURRENCY = int(os.getenv("PIPELINE_TELEGRAM_CONCURRENCY", 3))
+PIPELINE_SCRAPE_CRON = os.getenv("PIPELINE_SCRAPE_CRON", "0 * * * *")
+PIPELINE_DBT_CRON = os.getenv("PIPELINE_DBT_CRON", "45 * * * *")
+
+channel_date_partitions = MultiPartitionsDefinition({
+    "channel": StaticPartitionsDefinition(CHANNELS),
+    # end_offset=1: today's partition exists (and is re-scraped) while the day is in progress
+    "date": DailyPartitionsDefinition(start_date=PIPELINE_START_DATE, end_offset=1),
+})
+
+
+def partition_window(context):
+    """(channel handle, 'YYYY-MM-DD', start, end) of the run's partition, in UTC."""
+    keys = context.partition_key.keys_by_dimension
+    start = datetime.strptime(keys["date"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return keys["channel"], keys["date"], start, start + timedelta(days=1)
+
+
+def metrics_metadata():
+    """The step process's metrics snapshot (see src/scraping/metrics.py), as output metadata."""
+    from scraping import metrics
+
+    # Metadata values must not be None (e.g. a quantile of an empty histogram)
+    return {key: value for key, value in metrics.snapshot().items() if value is not None}
+
+
+def invalidate_api_cache():
+    """Tell the API its cached reports are stale. A failure only delays freshness (TTL), so it isn't fatal."""
+    request = urllib.request.Request(f"{API_BASE_URL}/api/cache/invalidate", method="POST",
+                                     headers={"X-Cache-Token": os.getenv("API_CACHE_INVALIDATE_TOKEN", "")})
     try:
-        # Here you would implement the actual loading logic
-        # For example, using psycopg2 to load JSON files into the database
-        logger.info("Data loaded successfully")
-        return True
-    
+        with urllib.request.urlopen(request, timeout=10) as response:
+            logger.info(f"API cache invalidated: {response.read().decode()}")
     except Exception as e:
-        logger.error(f"Error loading data: {str(e)}")
-        raise
-
-@op
-def run_dbt_transformations(context, load_success):
-    """Run dbt transformations"""
-    if not load_success:
-        raise Exception("Skipping dbt due to previous failure")
-    
-    logger.info("Running dbt transformations")
+        logger.warning(f"Could not invalidate API cache at {API_BASE_URL}: {str(e)}")
+
+
+def run_with_metrics(context, command, **kwargs):
+    """Run a pipeline script and attach its metrics snapshot (see src/scraping/metrics.py)
+    and wall time to the op's output metadata."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, "metrics.json")
+        env = dict(os.environ, METRICS_SNAPSHOT_PATH=snapshot_path)
+        start = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True, env=env, **kwargs)
+        metadata = {"duration_seconds": round(time.perf_counter() - start, 3)}
+        try:
+            with open(snapshot_path) as f:
+                metadata.update(json.load(f))
+        except (OSError, ValueError):
+            pass  # The script failed before writing its snapshot, or doesn't write one
+    # Metadata values must not be None (e.g. a quantile of an empty histogram)
+    context.add_output_metadata({key: value for key, value in metadata.items() if value is not None})
+    return result
+
+
+def detect_lake_media(media_files):
+    """Runs YOLO over the downloaded photos listed in media outcome lake files and saves the
+    detections. The photos are queued in raw.detection_jobs and only their jobs are claimed,
+    so photos already processed (with or without detections) or leased by another detector
+    are skipped. Returns counts."""
+    import raw_loader
+    import image_processor
+    from scraping.media_cache import get_media_cache
+
+    items = []
+    for path in media_files:
+        # Message ids are only unique per channel; raw.telegram_media takes it from the path too
+        channel = raw_loader.channel_from_path(path)
+        for record in raw_loader.iter_lake_records(path):
+            if (record.get("media_status") == "downloaded" and record.get("media_type") == "photo"
+                    and record.get("media_file_path") and os.path.exists(record["media_file_path"])):
+                items.append((channel, record["message_id"], record["media_file_path"]))
+
+    queued = image_processor.enqueue_detection_jobs(items)
+    media_cache = get_media_cache()
     try:
-        result = subprocess.run(
-            ["dbt", "run", "--profiles-dir", "."],
-            cwd="dbt",
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            logger.error(f"dbt run failed: {result.stderr}")
-            raise Exception("dbt transformation failed")
-        
-        logger.info("dbt transformations completed successfully")
-        return True
-    
-    except Exception as e:
-        logger.error(f"Error in dbt: {str(e)}")
-        raise
-
-@op
-def run_yolo_enrichment(context, dbt_success):
-    """Run YOLO image processing"""
-    if not dbt_success:
-        raise Exception("Skipping YOLO due to previous failure")
-    
-    logger.info("Running YOLO image processing")
+        stats = image_processor.drain_detection_jobs(
+            media_cache=media_cache, jobs=[(channel, message_id) for channel, message_id, _ in items])
+    finally:
+        if media_cache:
+            media_cache.close()
+    return {"images": len(items), "queued": queued, **stats}
+
+
+@asset(
+    partitions_def=channel_date_partitions,
+    pool="telegram_api",
+    group_name="ingestion",
+    retry_policy=RetryPolicy(max_retries=2, delay=60, backoff=Backoff.EXPONENTIAL),
+)
+def raw_telegram_messages(context):
+    """One channel's messages and photos for one day, written to the data lake.
+
+    The scrape resumes from the partition's checkpoint, so the hourly runs of today's
+    partition only fetch what was posted since the previous one.
+    Returns the lake channel directory name, which the downstream assets use to find the files.
+    """
+    import telegram_scraper
+    from checkpoint_store import get_checkpoint_store
+    from media_cache import get_media_cache
+    from rate_limiter import TokenBucket, TELEGRAM_REQUESTS_PER_SECOND
+
+    channel, day, start, end = partition_window(context)
+    # Parallel scrapes share the account's request budget
+    rate_limiter = TokenBucket(rate=TELEGRAM_REQUESTS_PER_SECOND / max(1, PIPELINE_TELEGRAM_CONCURRENCY))
+    media_cache = get_media_cache()
+    checkpoint_store = get_checkpoint_store()
     try:
-        result = subprocess.run(
-            ["python", "image_processor.py"],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            logger.error(f"YOLO processing failed: {result.stderr}")
-            raise Exception("YOLO processing failed")
-        
-        logger.info("YOLO processing completed successfully")
-        return True
-    
-    except Exception as e:
-        logger.error(f"Error in YOLO processing: {str(e)}")
-        raise
-
-@op
-def run_fastapi(context, yolo_success):
-    """Start FastAPI server"""
-    if not yolo_success:
-        raise Exception("Skipping API due to previous failure")
-    
-    logger.info("Starting FastAPI server")
-    # In production, you might want to run this as a separate service
-    logger.info("API is ready at http://localhost:8000")
-    return True
-
-@job
-def telegram_pipeline():
-    """End-to-end pipeline for Telegram data processing"""
-    scrape_result = scrape_telegram_data()
-    load_result = load_raw_to_postgres(scrape_result)
-    dbt_result = run_dbt_transformations(load_result)
-    yolo_result = run_yolo_enrichment(dbt_result)
-    api_result = run_fastapi(yolo_result)
\ No newline at end of file
+        result = asyncio.run(telegram_scraper.scrape_channel_range(
+            f"https://t.me/{channel}", start, end, checkpoint_store=checkpoint_store,
+            rate_limiter=rate_limiter, media_cache=media_cache))
+    finally:
+        checkpoint_store.close()
+        if media_cache:
+            media_cache.close()
+
+    if result["status"] == "flood_wait":
+        # Telegram told us how long to back off; the whole partition is retried after that
+        raise RetryRequested(max_retries=3, seconds_to_wait=result["wait_seconds"])
+    if result["status"] != "success":
+        raise Failure(description=f"Scraping {channel} for {day} failed: {result.get('error')}")
+
+    context.add_output_metadata({
+        "messages": result["messages_count"],
+        "images": result["images_downloaded_count"],
+        **metrics_metadata(),
+    })
+    return result["channel_name"]
+
+
+@asset(partitions_def=channel_date_partitions, group_name="ingestion")
+def raw_telegram_tables(context, raw_telegram_messages):
+    """The partition's lake files loaded into raw.telegram_messages / raw.telegram_media."""
+    import raw_loader
+
+    _, day, _, _ = partition_window(context)
+    files = raw_loader.discover_partition_files(raw_telegram_messages, day)
+    stats = raw_loader.load_raw_to_postgres(files=files)
+    if stats["files_failed"]:
+        raise Failure(description=f"{stats['files_failed']} lake file(s) of {raw_telegram_messages}/{day} failed to load")
+    context.add_output_metadata({**stats, **metrics_metadata()})
+    return stats
+
+
+@asset(partitions_def=channel_date_partitions, pool="yolo", group_name="enrichment")
+def image_detections(context, raw_telegram_messages):
+    """YOLO detections in raw.image_detections for the partition's downloaded photos.
+
+    Reads the media outcome records from the lake, so it doesn't wait for the raw
+    load or dbt. Photos that were already processed are skipped.
+    """
+    import raw_loader
+
+    _, day, _, _ = partition_window(context)
+    media_files = [path for kind, path in raw_loader.discover_partition_files(raw_telegram_messages, day)
+                   if kind == "media"]
+    stats = detect_lake_media(media_files)
+    context.add_output_metadata({**stats, **metrics_metadata()})
+    return stats["detections_saved"]
+
+
+@asset(deps=[raw_telegram_tables, image_detections], group_name="marts")
+def dbt_marts(context):
+    """The dbt models, rebuilt (incrementally) from everything loaded so far."""
+    logger.info("Running dbt transformations")
+    result = run_with_metrics(context, ["dbt", "run", "--profiles-dir", "."], cwd=DBT_PROJECT_DIR)
+    if result.returncode != 0:
+        logger.error(f"dbt run failed: {result.stderr}")
+        raise Failure(description="dbt transformation failed")
+    logger.info("dbt transformations completed successfully")
+    invalidate_api_cache()
+
+
+pipeline_executor = multiprocess_executor.configured({"max_concurrent": PIPELINE_MAX_CONCURRENT_STEPS})
+
+# One run per (channel, day) partition: scrape, then load and detect side by side
+telegram_pipeline = define_asset_job(
+    "telegram_pipeline",
+    selection=AssetSelection.assets(raw_telegram_messages, raw_telegram_tables, image_detections),
+    partitions_def=channel_date_partitions,
+    executor_def=pipeline_executor,
+)
+
+dbt_job = define_asset_job("dbt_marts_job", selection=AssetSelection.assets(dbt_marts))
+
+
+@schedule(job=telegram_pipeline, cron_schedule=PIPELINE_SCRAPE_CRON)
+def telegram_pipeline_schedule(context):
+    """Every channel's partition for today; in the first hour of a day also yesterday's,
+    to pick up its last messages (its detections then overlap with today's scrape)."""
+    now = context.scheduled_execution_time
+    days = [now.date()]
+    if now.hour == 0:
+        days.insert(0, (now - timedelta(days=1)).date())
+    for day in days:
+        for channel in CHANNELS:
+            yield RunRequest(partition_key=MultiPartitionKey({"channel": channel, "date": day.isoformat()}))
+
+
+@schedule(job=dbt_job, cron_schedule=PIPELINE_DBT_CRON)
+def dbt_marts_schedule(context):
+    return RunRequest()
+
+
+pipeline_assets = [raw_telegram_messages, raw_telegram_tables, image_detections, dbt_marts]
+pipeline_jobs = [telegram_pipeline, dbt_job]
+pipeline_schedules = [telegram_pipeline_schedule, dbt_marts_schedule]
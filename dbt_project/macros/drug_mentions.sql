@@ -0,0 +1,23 @@
+-- dbt/macros/drug_mentions.sql
+
+{# Whole-word, case-insensitive (with ~* or a lowercased input) pattern for every
+   spelling in the drug_dictionary var. \m and \M are Postgres word boundaries. #}
+{% macro drug_mention_regex() -%}
+    {%- set spellings = [] -%}
+    {%- for aliases in var('drug_dictionary').values() -%}
+        {%- do spellings.extend(aliases) -%}
+    {%- endfor -%}
+    '\m({{ spellings | join('|') }})\M'
+{%- endmacro %}
+
+{# Maps a matched spelling to its canonical product name #}
+{% macro normalize_drug_name(column) -%}
+    CASE {{ column }}
+    {%- for product, aliases in var('drug_dictionary').items() %}
+        {%- for alias in aliases %}
+        WHEN '{{ alias }}' THEN '{{ product }}'
+        {%- endfor %}
+    {%- endfor %}
+        ELSE {{ column }}
+    END
+{%- endmacro %}
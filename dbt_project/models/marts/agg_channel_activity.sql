@@ -0,0 +1,51 @@
+-- dbt/models/marts/agg_channel_activity.sql
+-- Message activity per channel and period, at day, week (ISO, Monday start) and month grain.
+-- Incremental: only the periods containing messages loaded since the last run are recomputed.
+{{
+  config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['channel_key', 'granularity', 'period_start'],
+    post_hook=[
+      "CREATE UNIQUE INDEX IF NOT EXISTS {{ this.name }}_channel_period_idx ON {{ this }} (channel_key, granularity, period_start)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_channel_name_period_idx ON {{ this }} (channel_name, granularity, period_start)"
+    ]
+  )
+}}
+
+WITH changed_days AS (
+    SELECT DISTINCT channel_key, date_key
+    FROM {{ ref('fct_messages') }}
+    WHERE channel_key IS NOT NULL AND date_key IS NOT NULL
+    {% if is_incremental() %}
+      AND loaded_at > (SELECT COALESCE(MAX(loaded_at), '-infinity') FROM {{ this }})
+    {% endif %}
+),
+
+periods AS (
+    SELECT DISTINCT
+        d.channel_key,
+        g.granularity,
+        DATE_TRUNC(g.granularity, d.date_key)::date as period_start,
+        (DATE_TRUNC(g.granularity, d.date_key) + ('1 ' || g.granularity)::interval)::date as period_end
+    FROM changed_days d
+    CROSS JOIN (VALUES ('day'), ('week'), ('month')) as g(granularity)
+)
+
+SELECT
+    p.channel_key,
+    c.channel_name,
+    p.granularity,
+    p.period_start,
+    COUNT(*) as message_count,
+    COALESCE(SUM(m.view_count), 0) as view_count,
+    COUNT(*) FILTER (WHERE m.has_media) as media_count,
+    COUNT(*) FILTER (WHERE m.contains_drug_mention) as drug_mention_count,
+    MAX(m.loaded_at) as loaded_at
+FROM periods p
+JOIN {{ ref('fct_messages') }} m
+    ON m.channel_key = p.channel_key
+    AND m.date_key >= p.period_start
+    AND m.date_key < p.period_end
+JOIN {{ ref('dim_channels') }} c ON c.channel_key = p.channel_key
+GROUP BY p.channel_key, c.channel_name, p.granularity, p.period_start
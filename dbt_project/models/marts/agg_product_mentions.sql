@@ -0,0 +1,21 @@
+-- dbt/models/marts/agg_product_mentions.sql
+-- Per-product rollup served by /api/reports/top-products. Its size is the size of the
+-- drug dictionary, so the endpoint's cost doesn't grow with the message corpus.
+{{
+  config(
+    materialized='table',
+    post_hook=[
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_mention_count_idx ON {{ this }} (mention_count DESC)"
+    ]
+  )
+}}
+
+SELECT
+    product_name,
+    SUM(mention_count) as mention_count,
+    COUNT(DISTINCT message_key) as message_count,
+    COUNT(DISTINCT channel_name) as channel_count,
+    MIN(mention_date) as first_mentioned_date,
+    MAX(mention_date) as last_mentioned_date
+FROM {{ ref('fct_product_mentions') }}
+GROUP BY product_name
@@ -1,13 +1,26 @@
 -- dbt/models/marts/fct_image_detections.sql
+-- Incremental: detections written since the last run, with a lookback (var incremental_lookback)
+-- because concurrent detectors commit out of order; delete+insert on detection_id makes the
+-- overlap idempotent. message_key is computed, not joined, so a detection written before its
+-- message reached fct_messages still gets its key.
 {{
   config(
-    materialized='table'
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key='detection_id',
+    on_schema_change='append_new_columns',
+    post_hook=[
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_detection_id_idx ON {{ this }} (detection_id)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_message_key_idx ON {{ this }} (message_key)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_detected_at_idx ON {{ this }} (detected_at)"
+    ]
   )
 }}
 
 SELECT
     d.detection_id,
-    m.message_key,
+    -- Same key as fct_messages: message ids are only unique per channel
+    {{ dbt_utils.generate_surrogate_key(['d.message_id', 'd.channel']) }} as message_key,
     d.class_id,
     d.class_name,
     d.confidence,
@@ -15,6 +28,10 @@ SELECT
     CASE 
         WHEN d.class_name IN ('pill', 'medicine', 'bottle') THEN 'medical'
         ELSE 'other'
-    END as detection_category
+    END as detection_category,
+    d.detected_at
 FROM {{ source('raw', 'image_detections') }} d
-LEFT JOIN {{ ref('fct_messages') }} m ON d.message_id = m.message_id
\ No newline at end of file
+{% if is_incremental() %}
+WHERE d.detected_at > (SELECT COALESCE(MAX(detected_at), '-infinity') FROM {{ this }})
+    - INTERVAL '{{ var("incremental_lookback") }}'
+{% endif %}
@@ -1,7 +1,23 @@
 -- dbt/models/marts/fct_messages.sql
+-- Incremental: only messages loaded (or whose media finished) since the last run, less the
+-- incremental_lookback var for loads that committed late, are rebuilt; a reloaded message
+-- replaces its row. Use --full-refresh to rebuild everything.
 {{
   config(
-    materialized='table'
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key='message_key',
+    post_hook=[
+      "CREATE UNIQUE INDEX IF NOT EXISTS {{ this.name }}_message_key_idx ON {{ this }} (message_key)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_channel_key_idx ON {{ this }} (channel_key)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_date_key_idx ON {{ this }} (date_key)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_channel_key_date_key_idx ON {{ this }} (channel_key, date_key)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_message_id_idx ON {{ this }} (message_id)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_loaded_at_idx ON {{ this }} (loaded_at)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_search_vector_idx ON {{ this }} USING GIN (search_vector)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_message_text_trgm_idx ON {{ this }} USING GIN (message_text gin_trgm_ops)",
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_date_key_message_key_idx ON {{ this }} (date_key DESC, message_key DESC)"
+    ]
   )
 }}
 
@@ -17,9 +33,16 @@ SELECT
     m.media_path,
     LENGTH(m.message_text) as message_length,
     CASE 
-        WHEN m.message_text ~* '(?i)\b(paracetamol|amoxicillin|insulin|ventolin)\b' THEN TRUE
+        WHEN m.message_text ~* {{ drug_mention_regex() }} THEN TRUE
         ELSE FALSE
-    END as contains_drug_mention
+    END as contains_drug_mention,
+    -- 'simple' config: no English stemming, so drug names and Amharic text are indexed as written
+    to_tsvector('simple', COALESCE(m.message_text, '')) as search_vector,
+    m.loaded_at
 FROM {{ ref('stg_telegram_messages') }} m
 LEFT JOIN {{ ref('dim_channels') }} c ON m.channel_name = c.channel_name
-LEFT JOIN {{ ref('dim_dates') }} d ON DATE(m.message_date) = d.date
\ No newline at end of file
+LEFT JOIN {{ ref('dim_dates') }} d ON DATE(m.message_date) = d.date
+{% if is_incremental() %}
+WHERE m.loaded_at > (SELECT COALESCE(MAX(loaded_at), '-infinity') FROM {{ this }})
+    - INTERVAL '{{ var("incremental_lookback") }}'
+{% endif %}
\ No newline at end of file
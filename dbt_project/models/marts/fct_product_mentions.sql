@@ -0,0 +1,72 @@
+-- dbt/models/marts/fct_product_mentions.sql
+-- One row per (message, product): drug names from the drug_dictionary var found in the text.
+-- Only messages loaded since the last run (less the incremental_lookback var, for loads that
+-- committed late) are scanned. Their previous rows are deleted first
+-- (pre_hook), so an edited message that no longer mentions a drug loses its rows too.
+-- Already scanned messages are not re-matched: after changing the drug_dictionary var,
+-- run with --full-refresh.
+{{
+  config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key='message_key',
+    pre_hook=[
+      "{% if is_incremental() %}
+       DELETE FROM {{ this }} WHERE message_key IN (
+           SELECT {{ dbt_utils.generate_surrogate_key(['message_id', 'channel_name']) }}
+           FROM {{ ref('stg_telegram_messages') }}
+           WHERE loaded_at > (SELECT COALESCE(MAX(loaded_at), '-infinity') FROM {{ this }})
+               - INTERVAL '{{ var('incremental_lookback') }}'
+       )
+       {% endif %}"
+    ],
+    post_hook=[
+      "CREATE INDEX IF NOT EXISTS {{ this.name }}_product_name_idx ON {{ this }} (product_name)"
+    ]
+  )
+}}
+
+WITH candidates AS (
+    -- Chosen by the watermark alone, like the rows the pre_hook cleared (their deletion can
+    -- only lower the watermark, so every cleared message is rescanned)
+    SELECT
+        {{ dbt_utils.generate_surrogate_key(['message_id', 'channel_name']) }} as message_key,
+        message_id,
+        channel_name,
+        DATE(message_date) as mention_date,
+        message_text,
+        loaded_at
+    FROM {{ ref('stg_telegram_messages') }}
+    {% if is_incremental() %}
+    WHERE loaded_at > (SELECT COALESCE(MAX(loaded_at), '-infinity') FROM {{ this }})
+        - INTERVAL '{{ var("incremental_lookback") }}'
+    {% endif %}
+),
+
+messages AS (
+    SELECT * FROM candidates
+    WHERE message_text ~* {{ drug_mention_regex() }}
+),
+
+matches AS (
+    SELECT
+        message_key,
+        message_id,
+        channel_name,
+        mention_date,
+        loaded_at,
+        {{ normalize_drug_name('match[1]') }} as product_name
+    FROM messages,
+    LATERAL regexp_matches(LOWER(message_text), {{ drug_mention_regex() }}, 'g') as match
+)
+
+SELECT
+    message_key,
+    message_id,
+    channel_name,
+    mention_date,
+    product_name,
+    COUNT(*) as mention_count,
+    MAX(loaded_at) as loaded_at
+FROM matches
+GROUP BY message_key, message_id, channel_name, mention_date, product_name
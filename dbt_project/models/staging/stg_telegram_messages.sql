@@ -6,12 +6,18 @@
 }}
 
 SELECT
-    id as message_id,
-    channel as channel_name,
-    date::timestamp as message_date,
-    message as message_text,
-    views as view_count,
-    media as has_media,
-    media_type,
-    media_path
-FROM {{ source('raw', 'telegram_messages') }}
+    m.id as message_id,
+    m.channel as channel_name,
+    m.date::timestamp as message_date,
+    m.message as message_text,
+    m.views as view_count,
+    m.media as has_media,
+    -- Downloads finish after the message text is saved; prefer their recorded outcome
+    COALESCE(md.media_type, m.media_type) as media_type,
+    COALESCE(md.media_path, m.media_path) as media_path,
+    md.media_width,
+    md.media_height,
+    GREATEST(m.loaded_at, md.loaded_at) as loaded_at
+FROM {{ source('raw', 'telegram_messages') }} m
+LEFT JOIN {{ source('raw', 'telegram_media') }} md
+    ON m.channel = md.channel AND m.id = md.id
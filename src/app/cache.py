@@ -0,0 +1,159 @@
+# app/cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import redis
+except ImportError:  # Optional: only needed when REDIS_URL is set
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+API_CACHE_ENABLED = os.getenv("API_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+API_CACHE_TTL_SECONDS = int(os.getenv("API_CACHE_TTL_SECONDS", 3600))
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", 1024))
+# Shared secret for POST /api/cache/invalidate (X-Cache-Token header); unset disables the endpoint
+API_CACHE_INVALIDATE_TOKEN = os.getenv("API_CACHE_INVALIDATE_TOKEN")
+
+# GET responses under these paths are cached: they only change when the pipeline runs
+CACHED_PATH_PREFIXES = ("/api/reports/", "/api/channels/")
+GENERATION_KEY = "api-cache:generation"
+
+
+class LocalCache:
+    """In-process LRU cache with per-key TTL.
+
+    Implements the subset of the redis-py client used here (get, set with
+    `ex`, delete, incr), so a Redis client can be swapped in unchanged.
+    Counters (incr) are kept apart from the LRU and never evicted.
+    """
+
+    def __init__(self, max_entries=API_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._counters = {}  # key -> int
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            expires_at = self._clock() + ex if ex else None
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum((self._entries.pop(key, None) is not None) + (self._counters.pop(key, None) is not None)
+                       for key in keys)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            return self._counters[key]
+
+
+def get_cache_backend():
+    """Redis when REDIS_URL is set (and redis-py is installed), otherwise a LocalCache.
+
+    With several API worker processes use Redis: a LocalCache is per process,
+    so an invalidation request only reaches one of them. Give Redis a volatile-*
+    maxmemory-policy (e.g. volatile-lru): responses are stored with a TTL and the
+    generation counter without one, so only responses are evicted.
+    """
+    if REDIS_URL:
+        if redis is not None:
+            return redis.Redis.from_url(REDIS_URL)
+        logger.warning("REDIS_URL is set but the redis package is not installed; using the in-process cache")
+    return LocalCache()
+
+
+class ResponseCache:
+    """Caches GET responses by path and query string, with ETag revalidation.
+
+    Keys include a generation number; `invalidate()` bumps it, which orphans
+    every cached response at once (old entries age out through TTL/LRU).
+
+    The middleware runs on the event loop, so calls to a network backend (Redis)
+    go through the threadpool; the in-process LocalCache is called directly.
+    """
+
+    def __init__(self, backend=None, ttl=API_CACHE_TTL_SECONDS):
+        self.backend = backend if backend is not None else get_cache_backend()
+        self.ttl = ttl
+        self._blocking = not isinstance(self.backend, LocalCache)
+
+    async def _run(self, function, *args, **kwargs):
+        if self._blocking:
+            return await run_in_threadpool(function, *args, **kwargs)
+        return function(*args, **kwargs)
+
+    def generation(self):
+        return int(self.backend.get(GENERATION_KEY) or 0)
+
+    def invalidate(self):
+        generation = self.backend.incr(GENERATION_KEY)
+        logger.info(f"API response cache invalidated (generation {generation})")
+        return generation
+
+    def key_for(self, request: Request):
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"api-cache:{self.generation()}:{request.url.path}?{query}"
+
+    @staticmethod
+    def _not_modified(request: Request, etag):
+        return etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+
+    async def __call__(self, request: Request, call_next):
+        """HTTP middleware: serves cached responses and stores new 200 responses."""
+        if request.method != "GET" or not request.url.path.startswith(CACHED_PATH_PREFIXES):
+            return await call_next(request)
+
+        key = await self._run(self.key_for, request)
+        cached = await self._run(self.backend.get, key)
+        if cached is not None:
+            entry = json.loads(cached)
+            headers = {"ETag": entry["etag"], "X-Cache": "HIT"}
+            if self._not_modified(request, entry["etag"]):
+                return Response(status_code=304, headers=headers)
+            return Response(content=entry["body"], media_type=entry["media_type"], headers=headers)
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        media_type = response.headers.get("content-type", "application/json")
+        await self._run(self.backend.set, key,
+                        json.dumps({"etag": etag, "media_type": media_type, "body": body.decode()}), ex=self.ttl)
+
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in ("content-length", "content-type")}
+        headers.update({"ETag": etag, "X-Cache": "MISS"})
+        if self._not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, status_code=200, media_type=media_type, headers=headers)
@@ -1,95 +1,198 @@
 # app/crud.py
+import base64
+import json
+import os
+from datetime import date
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import select, func, tuple_, literal, cast, REAL
+from starlette.concurrency import run_in_threadpool
 import models
 import schemas
-from typing import List
+import search_index
+from typing import List, Optional, Tuple
 
-def get_top_products(db: Session, limit: int = 10) -> List[schemas.TopProduct]:
-    # Common drug names to look for
-    drug_names = [
-        'paracetamol', 'amoxicillin', 'insulin', 'ventolin',
-        'metformin', 'atenolol', 'losartan', 'simvastatin',
-        'omeprazole', 'diclofenac'
-    ]
-    
-    conditions = []
-    for drug in drug_names:
-        conditions.append(
-            func.lower(models.Message.message_text).like(f'%{drug}%')
-        )
-    
-    query = db.query(
-        func.unnest(func.string_to_array(
-            func.array_to_string(
-                func.array_agg(models.Message.message_text), 
-                ' '
-            ), 
-            ' '
-        )).label('word'),
-        func.count().label('count')
-    ).filter(
-        or_(*conditions)
-    ).group_by(
-        'word'
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession
+except ImportError:  # Optional: needs greenlet, only used with DB_ASYNC
+    AsyncSession = None
+
+# 'postgres' uses the tsvector/trigram indexes on fct_messages; 'memory' keeps an
+# in-process inverted index for local/dev databases without them
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'postgres')
+SEARCH_INDEX_MAX_AGE_SECONDS = float(os.getenv('SEARCH_INDEX_MAX_AGE_SECONDS', 300))
+SEARCH_MODES = ('fts', 'substring')
+ACTIVITY_GRANULARITIES = ('day', 'week', 'month')
+
+async def execute(db, statement):
+    """Runs a statement on an AsyncSession, or on a sync Session in the threadpool"""
+    if AsyncSession is not None and isinstance(db, AsyncSession):
+        return await db.execute(statement)
+    return await run_in_threadpool(db.execute, statement)
+
+def top_products_statement(limit: int):
+    """Most mentioned products, from the agg_product_mentions rollup built by dbt"""
+    return select(
+        models.ProductMention.product_name,
+        models.ProductMention.mention_count
     ).order_by(
-        func.count().desc()
+        models.ProductMention.mention_count.desc(),
+        models.ProductMention.product_name
     ).limit(limit)
-    
-    results = query.all()
-    
-    # Filter to only include actual drug names
-    top_products = []
-    for word, count in results:
-        lower_word = word.lower()
-        for drug in drug_names:
-            if drug in lower_word and len(word) > 3:  # Basic filtering
-                top_products.append(schemas.TopProduct(
-                    product_name=word,
-                    mention_count=count
-                ))
-                break
-    
-    return top_products[:limit]
-
-def get_channel_activity(db: Session, channel_name: str) -> List[schemas.ChannelActivity]:
-    return db.query(
-        models.Date.date,
-        func.count(models.Message.message_key).label('message_count')
-    ).join(
-        models.Message,
-        models.Message.date_key == models.Date.date
-    ).join(
-        models.Channel,
-        models.Message.channel_key == models.Channel.channel_key
+
+def get_top_products(db: Session, limit: int = 10) -> List[schemas.TopProduct]:
+    return db.execute(top_products_statement(limit)).all()
+
+async def get_top_products_async(db, limit: int = 10) -> List[schemas.TopProduct]:
+    return (await execute(db, top_products_statement(limit))).all()
+
+def channel_activity_statement(channel_name: str, granularity: str = 'day',
+                               start: Optional[date] = None, end: Optional[date] = None):
+    """Activity per period from the agg_channel_activity rollup built by dbt.
+
+    `start` and `end` are inclusive; the periods containing them are returned whole.
+    """
+    if granularity not in ACTIVITY_GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}', expected one of {', '.join(ACTIVITY_GRANULARITIES)}")
+    statement = select(
+        models.ChannelActivity.period_start.label('date'),
+        models.ChannelActivity.message_count,
+        models.ChannelActivity.view_count,
+        models.ChannelActivity.media_count,
+        models.ChannelActivity.drug_mention_count
     ).filter(
-        models.Channel.channel_name == channel_name
-    ).group_by(
-        models.Date.date
-    ).order_by(
-        models.Date.date
-    ).all()
+        models.ChannelActivity.channel_name == channel_name,
+        models.ChannelActivity.granularity == granularity
+    )
+    if start:
+        statement = statement.filter(models.ChannelActivity.period_start >= func.date_trunc(granularity, start))
+    if end:
+        statement = statement.filter(models.ChannelActivity.period_start <= end)
+    return statement.order_by(models.ChannelActivity.period_start)
 
-def search_messages(db: Session, query: str) -> List[schemas.SearchResult]:
-    return db.query(
+def get_channel_activity(db: Session, channel_name: str, granularity: str = 'day',
+                         start: Optional[date] = None, end: Optional[date] = None) -> List[schemas.ChannelActivity]:
+    return db.execute(channel_activity_statement(channel_name, granularity, start, end)).all()
+
+async def get_channel_activity_async(db, channel_name: str, granularity: str = 'day',
+                                     start: Optional[date] = None, end: Optional[date] = None) -> List[schemas.ChannelActivity]:
+    return (await execute(db, channel_activity_statement(channel_name, granularity, start, end))).all()
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for a cursor we didn't issue."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
+
+def _search_columns():
+    return [
+        models.Message.message_key,
         models.Message.message_id,
         models.Channel.channel_name,
         models.Date.date.label('message_date'),
-        models.Message.message_text
-    ).join(
+        models.Message.message_text,
+    ]
+
+def search_statement(query: str, mode: str, limit: int, after: Optional[list]):
+    """One page of `fts` or `substring` matches, plus one row to tell whether more follow"""
+    if mode == 'fts':
+        ts_query = func.websearch_to_tsquery('simple', query)
+        rank = func.ts_rank_cd(models.Message.search_vector, ts_query)
+        sort_key = (rank, models.Message.message_key)
+        statement = select(*_search_columns(), rank.label('rank')).filter(models.Message.search_vector.op('@@')(ts_query))
+        if after:
+            statement = statement.filter(tuple_(*sort_key) < tuple_(literal(after[0], REAL), after[1]))
+    else:
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sort_key = (models.Message.date_key, models.Message.message_key)
+        statement = select(*_search_columns(), cast(None, REAL).label('rank')).filter(models.Message.message_text.ilike(pattern))
+        if after:
+            statement = statement.filter(tuple_(*sort_key) < tuple_(date.fromisoformat(after[0]), after[1]))
+
+    return statement.join_from(
+        models.Message,
         models.Channel,
         models.Message.channel_key == models.Channel.channel_key
     ).join(
         models.Date,
         models.Message.date_key == models.Date.date
-    ).filter(
-        func.lower(models.Message.message_text).like(f'%{query.lower()}%')
     ).order_by(
-        models.Date.date.desc()
-    ).limit(100).all()
+        *(column.desc() for column in sort_key)
+    ).limit(limit + 1)
 
-def get_visual_content_stats(db: Session):
-    return db.query(
+def _search_page(rows, mode: str, limit: int):
+    results = [schemas.SearchResult(**row._asdict()) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor([last.rank if mode == 'fts' else last.message_date.isoformat(), last.message_key])
+    return results, next_cursor
+
+def _check_search_args(mode: str, cursor: Optional[str]):
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {', '.join(SEARCH_MODES)}")
+    return decode_cursor(cursor) if cursor else None
+
+def search_messages(db: Session, query: str, mode: str = 'fts', limit: int = 50,
+                    cursor: Optional[str] = None) -> Tuple[List[schemas.SearchResult], Optional[str]]:
+    """Search message text, one page at a time.
+
+    `fts` matches words (websearch syntax: "quoted phrases", OR, -exclude) and
+    orders by relevance; `substring` matches any part of the text, newest first.
+    Returns the page and the cursor of the next page (None on the last page).
+    """
+    after = _check_search_args(mode, cursor)
+    if SEARCH_BACKEND == 'memory' and mode == 'fts':
+        return _search_messages_in_memory(db, query, limit, after)
+    rows = db.execute(search_statement(query, mode, limit, after)).all()
+    return _search_page(rows, mode, limit)
+
+async def search_messages_async(db, query: str, mode: str = 'fts', limit: int = 50,
+                                cursor: Optional[str] = None) -> Tuple[List[schemas.SearchResult], Optional[str]]:
+    after = _check_search_args(mode, cursor)
+    if SEARCH_BACKEND == 'memory' and mode == 'fts':
+        if AsyncSession is not None and isinstance(db, AsyncSession):
+            return await db.run_sync(_search_messages_in_memory, query, limit, after)
+        return await run_in_threadpool(_search_messages_in_memory, db, query, limit, after)
+    rows = (await execute(db, search_statement(query, mode, limit, after))).all()
+    return _search_page(rows, mode, limit)
+
+def _search_index_rows(db: Session):
+    def load_rows():
+        rows = db.execute(
+            select(*_search_columns()).join_from(
+                models.Message,
+                models.Channel,
+                models.Message.channel_key == models.Channel.channel_key
+            ).join(
+                models.Date,
+                models.Message.date_key == models.Date.date
+            ).execution_options(yield_per=10000)
+        )
+        for row in rows:
+            yield row.message_key, row.message_text, row
+    return load_rows
+
+def _search_messages_in_memory(db: Session, query: str, limit: int, after: Optional[list]):
+    index = search_index.get_index(_search_index_rows(db), SEARCH_INDEX_MAX_AGE_SECONDS)
+    hits = index.search(query, limit=limit + 1, after=after)
+    results = []
+    for rank, message_key, row in hits[:limit]:
+        results.append(schemas.SearchResult(**row._asdict(), rank=rank))
+    next_cursor = None
+    if len(hits) > limit:
+        rank, message_key, _ = hits[limit - 1]
+        next_cursor = encode_cursor([rank, message_key])
+    return results, next_cursor
+
+def visual_content_stats_statement():
+    return select(
         models.Detection.class_name,
         func.count().label('count'),
         models.Channel.channel_name
@@ -106,4 +209,10 @@ def get_visual_content_stats(db: Session):
         models.Channel.channel_name
     ).order_by(
         func.count().desc()
-    ).all()
\ No newline at end of file
+    )
+
+def get_visual_content_stats(db: Session):
+    return db.execute(visual_content_stats_statement()).all()
+
+async def get_visual_content_stats_async(db):
+    return (await execute(db, visual_content_stats_statement())).all()
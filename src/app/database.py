@@ -1,5 +1,6 @@
 # app/database.py
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -9,7 +10,41 @@ load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Connection pool settings (per API worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))       # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))     # Replace connections older than this
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))  # 0 disables
+# Create missing ORM tables when the API starts. Off by default: the marts come from dbt,
+# and ORM-created tables lack the columns (loaded_at, search_vector) its incremental models need
+DB_CREATE_TABLES = os.getenv("DB_CREATE_TABLES", "false").lower() in ("1", "true", "yes")
+
+# Async access: routes run on the event loop with asyncpg instead of the threadpool
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+def engine_options(url, is_async=False):
+    """Pool and statement_timeout settings for a Postgres URL. Other databases (sqlite
+    for local development) don't take them and get SQLAlchemy's defaults."""
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    if is_async:
+        connect_args = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    else:
+        connect_args = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return dict(connect_args=connect_args, **POOL_OPTIONS)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -19,4 +54,26 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def to_async_url(url):
+    """postgresql[+driver]://... -> postgresql+asyncpg://..."""
+    scheme, rest = url.split("://", 1)
+    return f"postgresql+asyncpg://{rest}" if scheme.startswith("postgres") else url
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_url = ASYNC_DATABASE_URL or to_async_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(async_url, **engine_options(async_url, is_async=True))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependency for routes that work with either kind of session (see crud.execute)
+get_session = get_async_db if DB_ASYNC else get_db
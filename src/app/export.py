@@ -0,0 +1,162 @@
+# app/export.py
+import csv
+import importlib.util
+import io
+import json
+import os
+from datetime import date
+
+from sqlalchemy import select, types
+
+import models
+from database import SessionLocal
+
+# Optional: only needed for format=arrow. Imported on first use, as it adds
+# ~100 ms and tens of MB to every API worker's startup.
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# Rows fetched from the server-side cursor (and encoded) per batch
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+
+def messages_statement(channel=None, start_date=None, end_date=None):
+    statement = select(
+        models.Message.message_key,
+        models.Message.message_id,
+        models.Channel.channel_name,
+        models.Message.date_key.label("message_date"),
+        models.Message.message_text,
+        models.Message.view_count,
+        models.Message.has_media,
+        models.Message.media_type,
+        models.Message.media_path,
+        models.Message.contains_drug_mention
+    ).join(
+        models.Channel,
+        models.Message.channel_key == models.Channel.channel_key
+    )
+    return _filter(statement, channel, start_date, end_date)
+
+
+def detections_statement(channel=None, start_date=None, end_date=None, class_name=None):
+    statement = select(
+        models.Detection.detection_id,
+        models.Detection.message_key,
+        models.Message.message_id,
+        models.Channel.channel_name,
+        models.Message.date_key.label("message_date"),
+        models.Detection.class_id,
+        models.Detection.class_name,
+        models.Detection.confidence,
+        models.Detection.bbox,
+        models.Detection.detection_category
+    ).join(
+        models.Message,
+        models.Detection.message_key == models.Message.message_key
+    ).join(
+        models.Channel,
+        models.Message.channel_key == models.Channel.channel_key
+    )
+    if class_name:
+        statement = statement.filter(models.Detection.class_name == class_name)
+    return _filter(statement, channel, start_date, end_date)
+
+
+def _filter(statement, channel, start_date, end_date):
+    if channel:
+        statement = statement.filter(models.Channel.channel_name == channel)
+    if start_date:
+        statement = statement.filter(models.Message.date_key >= start_date)
+    if end_date:
+        statement = statement.filter(models.Message.date_key <= end_date)
+    return statement
+
+
+def arrow_schema(statement):
+    """Arrow schema for the columns of a select(); JSON columns are exported as strings."""
+    import pyarrow as pa
+
+    arrow_types = [
+        (types.Boolean, pa.bool_()),
+        (types.Integer, pa.int64()),
+        (types.Float, pa.float64()),
+        (types.Date, pa.date32()),
+    ]
+    fields = []
+    for column in statement.selected_columns:
+        arrow_type = next((t for sql_type, t in arrow_types if isinstance(column.type, sql_type)), pa.string())
+        fields.append(pa.field(column.key, arrow_type))
+    return pa.schema(fields)
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def encode_batches(batches, fmt, columns, schema=None):
+    """Encode batches of row dicts as a stream of `fmt` chunks (one chunk per batch)."""
+    if fmt == "ndjson":
+        for batch in batches:
+            yield "".join(json.dumps(row, default=_json_default) + "\n" for row in batch).encode()
+
+    elif fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for batch in batches:
+            for row in batch:
+                writer.writerow(json.dumps(value) if isinstance(value, (dict, list)) else value
+                                for value in row.values())
+            yield _drain(buffer).encode()
+        if buffer.tell():  # Header of an empty export
+            yield _drain(buffer).encode()
+
+    elif fmt == "arrow":
+        # IPC stream format; the buffer is drained after every batch so memory stays flat
+        import pyarrow as pa
+
+        buffer = io.BytesIO()
+        with pa.ipc.new_stream(buffer, schema) as writer:
+            for batch in batches:
+                for row in batch:
+                    for name, value in row.items():
+                        if isinstance(value, (dict, list)):
+                            row[name] = json.dumps(value)
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                yield _drain(buffer)
+        yield _drain(buffer)  # End-of-stream marker
+
+    else:
+        raise ValueError(f"Unknown export format '{fmt}'")
+
+
+def stream_export(statement, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Yields the encoded rows of `statement`, read through a server-side cursor.
+
+    Uses its own session: the request's session is closed before a streaming
+    response finishes. Only `batch_size` rows are held in memory at a time.
+    """
+    columns = [column.key for column in statement.selected_columns]
+    schema = arrow_schema(statement) if fmt == "arrow" else None
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+        batches = ([row._asdict() for row in partition] for partition in result.partitions())
+        yield from encode_batches(batches, fmt, columns, schema)
+    finally:
+        db.close()
@@ -1,21 +1,51 @@
 # app/main.py
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from starlette.routing import Match
+from datetime import date
+import os
+import secrets
+import sys
+import time
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import crud
+import export
 import schemas
 import models
-from database import engine, get_db
+from database import engine, get_db, get_session, DB_CREATE_TABLES
+from cache import ResponseCache, API_CACHE_ENABLED, API_CACHE_INVALIDATE_TOKEN
+
+# Run from src/app (`uvicorn main2:app`), only the app's directory is on sys.path. The
+# metrics registry is shared with the pipeline scripts, so put src/ on it as well.
+_SRC_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _SRC_PATH not in sys.path:
+    sys.path.append(_SRC_PATH)
+from scraping import metrics
 from fastapi.middleware.cors import CORSMiddleware
 
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app):
+    # At startup rather than import, so importing the app (tests, CLI helpers) doesn't touch the database
+    if DB_CREATE_TABLES:
+        await run_in_threadpool(models.Base.metadata.create_all, bind=engine)
+    yield
 
 app = FastAPI(
     title="Ethiopian Medical Data API",
     description="API for analyzing Telegram medical business data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Report responses only change when the pipeline runs; serve repeats from the cache.
+# Registered before CORS so cached responses still get CORS headers.
+response_cache = ResponseCache()
+if API_CACHE_ENABLED:
+    app.middleware("http")(response_cache)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,29 +55,111 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    'http_request_seconds', 'API request latency (until the response starts)', ['method', 'route', 'status'])
+
+def route_template(request):
+    """The matched route's path template, so /api/channels/x/activity is one series, not one per channel"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+# Registered last, so it is the outermost middleware and cache hits are measured too
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                     route=route_template(request), status=status)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus metrics of this API process"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/api/reports/top-products", response_model=List[schemas.TopProduct])
-def get_top_products(limit: int = 10, db: Session = Depends(get_db)):
+async def get_top_products(limit: int = 10, db=Depends(get_session)):
     """Get top mentioned medical products"""
-    return crud.get_top_products(db, limit)
+    return await crud.get_top_products_async(db, limit)
 
 @app.get("/api/channels/{channel_name}/activity", response_model=List[schemas.ChannelActivity])
-def get_channel_activity(channel_name: str, db: Session = Depends(get_db)):
-    """Get posting activity for a specific channel"""
-    return crud.get_channel_activity(db, channel_name)
+async def get_channel_activity(channel_name: str, granularity: str = 'day',
+                               start: Optional[date] = None, end: Optional[date] = None,
+                               db=Depends(get_session)):
+    """Get posting activity for a specific channel per day, week or month"""
+    try:
+        return await crud.get_channel_activity_async(db, channel_name, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/search/messages", response_model=List[schemas.SearchResult])
-def search_messages(query: str, db: Session = Depends(get_db)):
-    """Search messages containing a specific keyword"""
-    return crud.search_messages(db, query)
+async def search_messages(response: Response, query: str, mode: str = 'fts',
+                          limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                          db=Depends(get_session)):
+    """Search messages by keyword, ranked by relevance (mode=fts) or as a substring (mode=substring).
+
+    When more results exist, the `X-Next-Cursor` response header holds the
+    `cursor` to pass for the next page.
+    """
+    try:
+        results, next_cursor = await crud.search_messages_async(db, query, mode=mode, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return results
 
 @app.get("/api/reports/visual-content")
-def get_visual_content_stats(db: Session = Depends(get_db)):
+async def get_visual_content_stats(db=Depends(get_session)):
     """Get statistics about visual content in channels"""
-    return crud.get_visual_content_stats(db)
+    return await crud.get_visual_content_stats_async(db)
 
 @app.get("/api/reports/price-variation")
 def get_price_variation(product: str, db: Session = Depends(get_db)):
     """Get price variation for a specific product"""
     # This is a placeholder - you would need to implement actual price extraction
     # from messages which is complex without structured price data
-    return {"message": "Price analysis would require more sophisticated NLP to extract prices from messages"}
\ No newline at end of file
+    return {"message": "Price analysis would require more sophisticated NLP to extract prices from messages"}
+
+def export_response(statement, format: str, name: str):
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}', expected one of {', '.join(export.EXPORT_FORMATS)}")
+    if format == "arrow" and not export.ARROW_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow")
+    media_type, extension = export.EXPORT_FORMATS[format]
+    return StreamingResponse(
+        export.stream_export(statement, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'}
+    )
+
+@app.get("/api/export/messages")
+def export_messages(format: str = "ndjson", channel: Optional[str] = None,
+                    start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Stream messages as NDJSON, CSV or Arrow IPC, optionally filtered by channel and date range"""
+    return export_response(export.messages_statement(channel, start_date, end_date), format, "messages")
+
+@app.get("/api/export/detections")
+def export_detections(format: str = "ndjson", channel: Optional[str] = None,
+                      start_date: Optional[date] = None, end_date: Optional[date] = None,
+                      class_name: Optional[str] = None):
+    """Stream image detections as NDJSON, CSV or Arrow IPC, filtered by channel, date range and class"""
+    return export_response(export.detections_statement(channel, start_date, end_date, class_name),
+                           format, "detections")
+
+@app.post("/api/cache/invalidate")
+def invalidate_cache(x_cache_token: Optional[str] = Header(None)):
+    """Drop all cached report responses; called by the pipeline after dbt runs.
+    Disabled unless API_CACHE_INVALIDATE_TOKEN is set."""
+    if not API_CACHE_INVALIDATE_TOKEN:
+        raise HTTPException(status_code=404, detail="Cache invalidation is disabled")
+    if not secrets.compare_digest(x_cache_token or "", API_CACHE_INVALIDATE_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid cache token")
+    return {"generation": response_cache.invalidate()}
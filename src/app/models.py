@@ -1,6 +1,8 @@
 # app/models.py
 from sqlalchemy import Column, Integer, String, Float, JSON, Date, ForeignKey
 from sqlalchemy.sql.sqltypes import Boolean
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.types import Date as DateType  # `Date` below is the dim_dates model
 from database import Base
 
 class Channel(Base):
@@ -30,7 +32,7 @@ class Message(Base):
     message_key = Column(String, primary_key=True, index=True)
     message_id = Column(Integer)
     channel_key = Column(String, ForeignKey("dim_channels.channel_key"))
-    date_key = Column(Date, ForeignKey("dim_dates.date"))
+    date_key = Column(DateType, ForeignKey("dim_dates.date"))
     message_text = Column(String)
     view_count = Column(Integer)
     has_media = Column(Boolean)
@@ -38,6 +40,29 @@ class Message(Base):
     media_path = Column(String)
     message_length = Column(Integer)
     contains_drug_mention = Column(Boolean)
+    search_vector = Column(TSVECTOR)  # GIN-indexed, built by dbt
+
+class ProductMention(Base):
+    __tablename__ = "agg_product_mentions"
+
+    product_name = Column(String, primary_key=True, index=True)
+    mention_count = Column(Integer)
+    message_count = Column(Integer)
+    channel_count = Column(Integer)
+    first_mentioned_date = Column(DateType)
+    last_mentioned_date = Column(DateType)
+
+class ChannelActivity(Base):
+    __tablename__ = "agg_channel_activity"
+
+    channel_key = Column(String, primary_key=True)
+    granularity = Column(String, primary_key=True)  # day, week or month
+    period_start = Column(DateType, primary_key=True)
+    channel_name = Column(String, index=True)
+    message_count = Column(Integer)
+    view_count = Column(Integer)
+    media_count = Column(Integer)
+    drug_mention_count = Column(Integer)
 
 class Detection(Base):
     __tablename__ = "fct_image_detections"
@@ -47,11 +47,15 @@ class TopProduct(BaseModel):
     mention_count: int
 
 class ChannelActivity(BaseModel):
-    date: date
+    date: date  # Start of the day, week or month
     message_count: int
+    view_count: Optional[int] = None
+    media_count: Optional[int] = None
+    drug_mention_count: Optional[int] = None
 
 class SearchResult(BaseModel):
     message_id: int
     channel_name: str
     message_date: date
-    message_text: str
\ No newline at end of file
+    message_text: str
+    rank: Optional[float] = None  # Relevance, for full-text searches
\ No newline at end of file
@@ -0,0 +1,86 @@
+# app/search_index.py
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercased word tokens; \\w also matches Ge'ez (Amharic) letters."""
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+class InvertedIndex:
+    """In-process full-text index for local/dev runs without the Postgres search indexes.
+
+    Documents match when they contain every query term, and are ranked by
+    TF-IDF. Results are paged with the same (rank, message_key) keyset as the
+    Postgres backend.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # term -> {message_key: term frequency}
+        self._documents = {}                # message_key -> payload
+        self._lengths = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, message_key, text, payload):
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            self._postings[term][message_key] = count
+        self._documents[message_key] = payload
+        self._lengths[message_key] = max(1, sum(terms.values()))
+
+    def search(self, query, limit=50, after=None):
+        """Returns [(rank, message_key, payload)] ordered by rank desc, key desc.
+
+        `after` is the (rank, message_key) of the last result of the previous page.
+        """
+        terms = set(tokenize(query))
+        if not terms or any(term not in self._postings for term in terms):
+            return []
+
+        # Intersect from the rarest term so the candidate set stays small
+        ordered = sorted(terms, key=lambda term: len(self._postings[term]))
+        candidates = set(self._postings[ordered[0]])
+        for term in ordered[1:]:
+            candidates.intersection_update(self._postings[term])
+
+        total = len(self._documents)
+        scored = []
+        for message_key in candidates:
+            rank = 0.0
+            for term in terms:
+                postings = self._postings[term]
+                idf = math.log(1 + total / len(postings))
+                rank += postings[message_key] / self._lengths[message_key] * idf
+            if after is None or (rank, message_key) < tuple(after):
+                scored.append((rank, message_key))
+
+        scored.sort(reverse=True)
+        return [(rank, message_key, self._documents[message_key]) for rank, message_key in scored[:limit]]
+
+
+_index = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_index(load_rows, max_age_seconds):
+    """Returns the shared index, rebuilding it from `load_rows()` once it is older than `max_age_seconds`.
+
+    `load_rows` yields (message_key, message_text, payload) tuples.
+    """
+    global _index, _index_built_at
+    with _index_lock:
+        if _index is None or time.monotonic() - _index_built_at > max_age_seconds:
+            index = InvertedIndex()
+            for message_key, text, payload in load_rows():
+                index.add(message_key, text, payload)
+            _index, _index_built_at = index, time.monotonic()
+        return _index
@@ -0,0 +1,336 @@
+# detection_backends.py
+"""Inference backends for the YOLO detector.
+
+    torch      the ultralytics model as-is (default)
+    onnx       the model exported to ONNX and run by onnxruntime
+    onnx-int8  the ONNX model with INT8 weights and activations, calibrated on
+               a sample of our own photos (static quantization)
+
+Every backend takes a batch of decoded RGB images and returns one list of
+detection dicts per image, in the format stored in raw.image_detections:
+{'class_id', 'class_name', 'confidence', 'bbox'} with a normalized xywh bbox.
+
+The ONNX files are exported (and quantized) on first use and cached next to
+the weights, or in YOLO_EXPORT_DIR; they are rebuilt when the weights change.
+The onnxruntime backends need neither torch nor ultralytics once the files
+exist: pre-processing (letterbox) and post-processing (NMS) are done here
+with numpy, with ultralytics' default thresholds.
+"""
+import ast
+import fcntl
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+# Where exported models are cached; empty means next to the weights
+YOLO_EXPORT_DIR = os.getenv('YOLO_EXPORT_DIR', '')
+# onnxruntime execution providers, in order of preference. Unavailable ones are
+# skipped, e.g. 'OpenVINOExecutionProvider,CPUExecutionProvider' uses OpenVINO
+# when onnxruntime-openvino is installed.
+YOLO_ONNX_PROVIDERS = [name.strip() for name in
+                       os.getenv('YOLO_ONNX_PROVIDERS', 'CPUExecutionProvider').split(',') if name.strip()]
+
+# Post-processing, the same for every backend (ultralytics' predict defaults)
+YOLO_CONFIDENCE_THRESHOLD = float(os.getenv('YOLO_CONFIDENCE_THRESHOLD', 0.25))
+YOLO_IOU_THRESHOLD = float(os.getenv('YOLO_IOU_THRESHOLD', 0.7))
+YOLO_MAX_DETECTIONS = int(os.getenv('YOLO_MAX_DETECTIONS', 300))
+
+LETTERBOX_FILL = (114, 114, 114)
+MAX_BOX_SIZE = 7680  # Per-class NMS offset, as in ultralytics
+
+
+def result_to_detections(result):
+    """Convert one ultralytics result into our list of detection dicts"""
+    detections = []
+    for box in result.boxes:
+        detections.append({
+            'class_id': int(box.cls),
+            'class_name': result.names[int(box.cls)],
+            'confidence': float(box.conf),
+            'bbox': box.xywhn.tolist()[0]  # Normalized xywh coordinates
+        })
+    return detections
+
+
+class TorchBackend:
+    """The ultralytics model on torch."""
+    name = 'torch'
+
+    def __init__(self, weights, image_size):
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.image_size = image_size
+
+    def detect(self, images):
+        results = self.model(images, imgsz=self.image_size, conf=YOLO_CONFIDENCE_THRESHOLD,
+                             iou=YOLO_IOU_THRESHOLD, max_det=YOLO_MAX_DETECTIONS, verbose=False)
+        # Ultralytics returns one result per input image, in order
+        return [result_to_detections(result) for result in results]
+
+
+def letterbox_shape(images, image_size, stride=32):
+    """The smallest (height, width), in multiples of the model stride, that fits
+    every image scaled to `image_size`. Non-square photos then don't pay for a
+    square input (a 4:3 photo runs at 640x480), while a batch shares one shape."""
+    height = width = stride
+    for image in images:
+        scale = min(image_size / image.width, image_size / image.height)
+        width = max(width, math.ceil(round(image.width * scale) / stride) * stride)
+        height = max(height, math.ceil(round(image.height * scale) / stride) * stride)
+    return height, width
+
+
+def letterbox(image, image_size, shape):
+    """Scale an RGB image to fit `image_size` and pad it, centred, to `shape` (height, width).
+
+    Returns the CHW float32 array in [0, 1], the scale and the (left, top) padding.
+    """
+    scale = min(image_size / image.width, image_size / image.height)
+    width, height = round(image.width * scale), round(image.height * scale)
+    if (width, height) != image.size:
+        image = image.resize((width, height), Image.BILINEAR)
+    left, top = round((shape[1] - width) / 2 - 0.1), round((shape[0] - height) / 2 - 0.1)
+    canvas = Image.new('RGB', (shape[1], shape[0]), LETTERBOX_FILL)
+    canvas.paste(image, (left, top))
+    array = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return array, scale, (left, top)
+
+
+def non_max_suppression(boxes, scores, iou_threshold):
+    """Indices of the xyxy `boxes` kept by greedy NMS, highest score first"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        height = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        overlap = width * height
+        iou = overlap / (areas[best] + areas[rest] - overlap + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class OnnxBackend:
+    """An exported YOLO detection model on onnxruntime.
+
+    The session's intra-op thread pool follows OMP_NUM_THREADS when it is set (as
+    detection_runner does per worker), so several workers don't oversubscribe the CPU.
+    """
+
+    def __init__(self, model_path, image_size, name='onnx', providers=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv('OMP_NUM_THREADS', 0))
+        options.inter_op_num_threads = 1
+        available = onnxruntime.get_available_providers()
+        providers = [provider for provider in providers or YOLO_ONNX_PROVIDERS if provider in available]
+        self.session = onnxruntime.InferenceSession(model_path, options,
+                                                    providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names'])  # Written by the ultralytics export
+        self.image_size = image_size
+        self.name = name
+
+    def detect(self, images):
+        shape = letterbox_shape(images, self.image_size)
+        prepared = [letterbox(image, self.image_size, shape) for image in images]
+        batch = np.stack([array for array, _, _ in prepared])
+        # (batch, 4 + classes, anchors): cx, cy, w, h in input pixels, then class scores
+        output = self.session.run(None, {self.input_name: batch})[0]
+        return [self._postprocess(prediction, image.size, scale, padding)
+                for prediction, image, (_, scale, padding) in zip(output, images, prepared)]
+
+    def _postprocess(self, prediction, image_size, scale, padding):
+        prediction = prediction.T
+        scores = prediction[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        candidates = confidences > YOLO_CONFIDENCE_THRESHOLD
+        if not candidates.any():
+            return []
+        xywh, class_ids, confidences = prediction[candidates, :4], class_ids[candidates], confidences[candidates]
+
+        boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+        # Offsetting each class keeps NMS from suppressing boxes of other classes
+        keep = non_max_suppression(boxes + class_ids[:, None] * MAX_BOX_SIZE, confidences,
+                                   YOLO_IOU_THRESHOLD)[:YOLO_MAX_DETECTIONS]
+
+        # Undo the letterbox, then normalize to the image size
+        width, height = image_size
+        left, top = padding
+        boxes = (boxes[keep] - [left, top, left, top]) / scale
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        detections = []
+        for (x1, y1, x2, y2), class_id, confidence in zip(boxes, class_ids[keep], confidences[keep]):
+            detections.append({
+                'class_id': int(class_id),
+                'class_name': self.names[int(class_id)],
+                'confidence': float(confidence),
+                'bbox': [float((x1 + x2) / 2 / width), float((y1 + y2) / 2 / height),
+                         float((x2 - x1) / width), float((y2 - y1) / height)],
+            })
+        return detections
+
+
+def export_path(weights, image_size, suffix):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    directory = YOLO_EXPORT_DIR or os.path.dirname(os.path.abspath(weights))
+    return os.path.join(directory, f'{stem}-{image_size}{suffix}')
+
+
+def _is_fresh(path, source):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)
+
+
+@contextmanager
+def _export_lock(path):
+    """Serializes building `path` across processes (e.g. detection workers starting together)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def resolve_weights(weights):
+    """Local path of `weights`. Like YOLO() does, known weights such as the default
+    yolov8n.pt are looked up in the ultralytics weights directory or downloaded."""
+    if os.path.exists(weights):
+        return weights
+    from ultralytics.utils.downloads import attempt_download_asset
+
+    path = attempt_download_asset(weights)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"YOLO weights not found: {weights}")
+    return path
+
+
+def export_onnx(weights, image_size):
+    """Path of the weights exported to ONNX (dynamic batch), exporting them if needed"""
+    weights = resolve_weights(weights)
+    path = export_path(weights, image_size, '.onnx')
+    with _export_lock(path):
+        if _is_fresh(path, weights):
+            return path
+        from ultralytics import YOLO
+
+        start = time.perf_counter()
+        # ultralytics writes the export next to the weights it loaded, so export a copy
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(path)) as tmp_dir:
+            tmp_weights = shutil.copy(weights, tmp_dir)
+            exported = YOLO(tmp_weights).export(format='onnx', imgsz=image_size, dynamic=True, simplify=False)
+            os.replace(exported, path)
+        logger.info(f"Exported {weights} to {path} in {time.perf_counter() - start:.1f}s")
+        return path
+
+
+def _quantizable_nodes_excluded(model):
+    """Detect-head nodes to keep in float32.
+
+    The head decodes boxes and concatenates them (in pixels) with the class scores
+    (0-1) into one output; quantized together, the scores lose all resolution.
+    Only the head's conv branches (cv2 boxes, cv3 classes) are quantized.
+    """
+    output_names = {output.name for output in model.graph.output}
+    head = next(node.name for node in model.graph.node if output_names & set(node.output))
+    prefix = head.rsplit('/', 1)[0] + '/'
+    return [node.name for node in model.graph.node
+            if node.name.startswith(prefix) and '/cv2.' not in node.name and '/cv3.' not in node.name]
+
+
+def quantize_int8(onnx_path, calibration_images, image_size, output_path):
+    """Static INT8 quantization (QDQ, per-channel weights) of an exported model.
+
+    Activation ranges are calibrated by running the float model over
+    `calibration_images`, an iterable of RGB images. The class names and other
+    export metadata are carried over.
+    """
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self.input_name = input_name
+            self.images = iter(calibration_images)
+            self.count = 0
+
+        def get_next(self):
+            image = next(self.images, None)
+            if image is None:
+                return None
+            self.count += 1
+            shape = letterbox_shape([image], image_size)
+            return {self.input_name: letterbox(image, image_size, shape)[0][None]}
+
+    start = time.perf_counter()
+    model = onnx.load(onnx_path)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output_path)) as tmp_dir:
+        prepared_path = os.path.join(tmp_dir, 'prepared.onnx')
+        quant_pre_process(onnx_path, prepared_path, skip_symbolic_shape=True)
+        reader = ImageReader(model.graph.input[0].name)
+        quantized_path = os.path.join(tmp_dir, 'quantized.onnx')
+        quantize_static(prepared_path, quantized_path, reader, quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True,
+                        nodes_to_exclude=_quantizable_nodes_excluded(model))
+        if not reader.count:
+            raise ValueError("No calibration images for INT8 quantization")
+
+        quantized = onnx.load(quantized_path)
+        del quantized.metadata_props[:]
+        quantized.metadata_props.extend(model.metadata_props)
+        onnx.save(quantized, quantized_path)
+        os.replace(quantized_path, output_path)
+    logger.info(f"Quantized {onnx_path} to {output_path} on {reader.count} images "
+                f"in {time.perf_counter() - start:.1f}s")
+    return output_path
+
+
+def model_file(backend, weights, image_size, calibration_images=None):
+    """The model file `backend` runs, exporting and quantizing it first if needed.
+
+    `calibration_images` is called (with no arguments) for the images to calibrate
+    INT8 quantization on, only when the quantized model has to be (re)built.
+    """
+    if backend == 'torch':
+        return weights
+    onnx_path = export_onnx(weights, image_size)
+    if backend == 'onnx':
+        return onnx_path
+    path = export_path(weights, image_size, '-int8.onnx')
+    with _export_lock(path):
+        if not _is_fresh(path, onnx_path):
+            if calibration_images is None:
+                raise ValueError("INT8 quantization needs calibration images")
+            quantize_int8(onnx_path, calibration_images(), image_size, path)
+    return path
+
+
+def load_backend(backend, weights, image_size, calibration_images=None):
+    """An inference backend by name (see BACKENDS)"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown YOLO backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    path = model_file(backend, weights, image_size, calibration_images)
+    if backend == 'torch':
+        return TorchBackend(path, image_size)
+    return OnnxBackend(path, image_size, name=backend)
@@ -0,0 +1,112 @@
+# detection_runner.py
+import os
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from scraping.media_cache import get_media_cache
+from scraping import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CPU_COUNT = os.cpu_count() or 1
+# Number of detector processes; each holds its own copy of the model
+DETECTION_WORKERS = int(os.getenv('DETECTION_WORKERS', CPU_COUNT))
+# Inference (torch or onnxruntime intra-op) threads per process. Defaults to an even
+# split of the cores so that N workers x M threads never oversubscribes the CPU.
+DETECTION_THREADS_PER_WORKER = int(os.getenv('DETECTION_THREADS_PER_WORKER', 0))
+# Images handed to a worker at a time
+DETECTION_SHARD_SIZE = int(os.getenv('DETECTION_SHARD_SIZE', 64))
+
+# Set in each worker process by _init_worker
+_processor = None
+
+
+def _init_worker(threads):
+    """Pins the thread pools of a worker and loads the model once for its lifetime."""
+    global _processor
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+
+    import image_processor
+    if image_processor.YOLO_BACKEND == 'torch':
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    # The onnxruntime backends size their thread pool from OMP_NUM_THREADS
+    image_processor.get_model()  # Load (and warm up) the model before the first shard arrives
+    _processor = image_processor
+
+
+def _detect_shard(shard):
+    # The worker only has `threads` cores, so one decode thread is enough to overlap I/O.
+    # Metrics recorded in a worker stay there, so the shard's time is returned to the parent.
+    start = time.perf_counter()
+    results = list(_processor.process_images_batched(shard, decode_workers=1))
+    return results, time.perf_counter() - start
+
+
+def detection_pool(workers, threads):
+    """A pool of `workers` detector processes with `threads` inference threads each.
+
+    Processes start as shards are submitted, and each loads the model once for
+    the pool's lifetime.
+    """
+    # 'spawn' gives every worker a clean interpreter: forking after torch has
+    # started its thread pools can deadlock.
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=_init_worker, initargs=(threads,))
+
+
+def detect_on_pool(pool, items, shard_size=DETECTION_SHARD_SIZE):
+    """Run detection over (message_id, image_path) pairs on a detection_pool.
+
+    Yields (message_id, image_path, detections) as shards complete, so results can
+    be written by a single consumer in the parent process.
+    """
+    items = list(items)
+    shards = [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+    futures = [pool.submit(_detect_shard, shard) for shard in shards]
+    for future in as_completed(futures):
+        try:
+            results, seconds = future.result()
+        except Exception as e:
+            logger.error(f"Detection shard failed: {str(e)}")
+            continue
+        metrics.DETECTION_BATCH_SECONDS.observe(seconds, stage='shard')
+        metrics.DETECTION_IMAGES.inc(len(results))
+        yield from results
+
+
+def main():
+    import image_processor
+
+    added = image_processor.enqueue_detection_jobs()
+    logger.info(f"Queued {added} new photos for detection")
+
+    threads = DETECTION_THREADS_PER_WORKER or max(1, CPU_COUNT // DETECTION_WORKERS)
+    logger.info(f"Draining detection jobs with {DETECTION_WORKERS} worker(s) x {threads} thread(s)")
+    media_cache = get_media_cache()
+    try:
+        # Claims are sized to give every worker a shard, deduplicated in the parent so each
+        # distinct image is sent to one worker once. Only the parent talks to the database:
+        # it claims the jobs and is the single writer of the results.
+        with detection_pool(DETECTION_WORKERS, threads) as pool:
+            stats = image_processor.drain_detection_jobs(
+                detect=lambda items: detect_on_pool(pool, items), media_cache=media_cache,
+                claim_size=DETECTION_SHARD_SIZE * DETECTION_WORKERS)
+        logger.info(f"Detection jobs: {stats}")
+    finally:
+        if media_cache:
+            logger.info(f"Detection cache hit rate: {media_cache.hit_rate('detection'):.1%}")
+            media_cache.close()
+        metrics.write_snapshot()
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,23 @@
 # image_processor.py
 import os
 import json
-from datetime import datetime
-from ultralytics import YOLO
+import hashlib
+import random
+import socket
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 import logging
 
+from scraping.media_cache import get_media_cache
+from scraping import metrics
+
 load_dotenv()
 
 # Configure logging
@@ -21,103 +31,600 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Load YOLO model
-model = YOLO('yolov8n.pt')  # Using nano version for efficiency
+# Model settings. The backend is imported and the weights loaded on the first
+# detection (get_model), so importing this module to query pending work is cheap.
+YOLO_MODEL_PATH = os.getenv('YOLO_MODEL_PATH', 'yolov8n.pt')  # Using nano version for efficiency
+YOLO_WARMUP = os.getenv('YOLO_WARMUP', 'true').lower() in ('1', 'true', 'yes')  # Dummy inference after loading
+# Inference backend: torch, onnx or onnx-int8 (see detection_backends.py)
+YOLO_BACKEND = os.getenv('YOLO_BACKEND', 'torch')
+# Photos INT8 quantization is calibrated on: a random sample of the lake's images
+YOLO_CALIBRATION_IMAGES_PATH = os.getenv('YOLO_CALIBRATION_IMAGES_PATH',
+                                         os.path.join(os.getenv('DATA_LAKE_PATH', '/app/data/raw'), 'telegram_images'))
+YOLO_CALIBRATION_SAMPLE_SIZE = int(os.getenv('YOLO_CALIBRATION_SAMPLE_SIZE', 200))
+
+# Batched inference settings
+YOLO_BATCH_SIZE = int(os.getenv('YOLO_BATCH_SIZE', 16))       # Images per model call
+YOLO_DECODE_WORKERS = int(os.getenv('YOLO_DECODE_WORKERS', 4)) # Threads decoding the next batch
+YOLO_IMAGE_SIZE = int(os.getenv('YOLO_IMAGE_SIZE', 640))       # Model input size
+
+# Database settings
+DB_POOL_MAX_CONNECTIONS = int(os.getenv('DB_POOL_MAX_CONNECTIONS', 4))
+DETECTION_FLUSH_SIZE = int(os.getenv('DETECTION_FLUSH_SIZE', 1000))                     # Buffered detections per write
+DETECTION_FLUSH_INTERVAL_SECONDS = float(os.getenv('DETECTION_FLUSH_INTERVAL_SECONDS', 10)) # Max age of a buffered detection
+
+# Work queue settings (raw.detection_jobs)
+DETECTION_CLAIM_SIZE = int(os.getenv('DETECTION_CLAIM_SIZE', 256))              # Jobs leased per claim
+DETECTION_LEASE_SECONDS = int(os.getenv('DETECTION_LEASE_SECONDS', 900))        # Until another worker may take them over
+DETECTION_MAX_ATTEMPTS = int(os.getenv('DETECTION_MAX_ATTEMPTS', 3))            # Claims before a job is marked failed
+
+DETECTIONS_DDL = """
+    CREATE SCHEMA IF NOT EXISTS raw;
+    CREATE TABLE IF NOT EXISTS raw.image_detections (
+        detection_id BIGSERIAL PRIMARY KEY,
+        message_id BIGINT NOT NULL,
+        channel TEXT,
+        class_id INTEGER,
+        class_name TEXT,
+        confidence REAL,
+        bbox JSONB,
+        detected_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    ALTER TABLE raw.image_detections ADD COLUMN IF NOT EXISTS channel TEXT;
+    CREATE INDEX IF NOT EXISTS image_detections_message_id_idx ON raw.image_detections (message_id);
+    CREATE INDEX IF NOT EXISTS image_detections_detected_at_idx ON raw.image_detections (detected_at);
+
+    -- Detections written before the channel column existed: message ids are only unique
+    -- per channel, so they are tagged with their message's channel where the id is unambiguous
+    DO $$
+    BEGIN
+        IF to_regclass('raw.telegram_messages') IS NOT NULL THEN
+            UPDATE raw.image_detections d
+            SET channel = m.channel
+            FROM (
+                SELECT id, MIN(channel) AS channel FROM raw.telegram_messages
+                GROUP BY id HAVING COUNT(*) = 1
+            ) m
+            WHERE d.channel IS NULL AND d.message_id = m.id;
+        END IF;
+    END $$;
+
+    -- One job per photo. A worker leases jobs (status 'leased', leased_by, lease_expires_at);
+    -- a lease that expires (the worker died) makes the job claimable again.
+    CREATE TABLE IF NOT EXISTS raw.detection_jobs (
+        channel TEXT NOT NULL,
+        message_id BIGINT NOT NULL,
+        media_path TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending'
+            CHECK (status IN ('pending', 'leased', 'detected', 'no_detections', 'failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        leased_by TEXT,
+        lease_expires_at TIMESTAMPTZ,
+        detection_count INTEGER,
+        last_error TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (channel, message_id)
+    );
+    CREATE INDEX IF NOT EXISTS detection_jobs_open_idx ON raw.detection_jobs (channel, message_id)
+        WHERE status IN ('pending', 'leased');
+"""
+
+# New jobs start as 'detected' when the photo already has detections (written before
+# the job table existed), so upgrading doesn't re-run the whole backlog
+JOB_INITIAL_STATUS_SQL = """
+    CASE WHEN EXISTS (SELECT 1 FROM raw.image_detections d
+                      WHERE d.message_id = {message_id} AND d.channel = {channel})
+         THEN 'detected' ELSE 'pending' END
+"""
+
+ENQUEUE_STAGED_JOBS_SQL = f"""
+    INSERT INTO raw.detection_jobs (channel, message_id, media_path, status)
+    SELECT m.channel_name, m.message_id, m.media_path,
+        {JOB_INITIAL_STATUS_SQL.format(message_id='m.message_id', channel='m.channel_name')}
+    FROM stg_telegram_messages m
+    WHERE m.has_media = TRUE
+    AND m.media_type = 'photo'
+    AND m.media_path IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM raw.detection_jobs j
+                    WHERE j.channel = m.channel_name AND j.message_id = m.message_id)
+    ON CONFLICT (channel, message_id) DO NOTHING
+"""
+
+ENQUEUE_JOBS_SQL = f"""
+    INSERT INTO raw.detection_jobs (channel, message_id, media_path, status)
+    SELECT v.channel, v.message_id, v.media_path,
+        {JOB_INITIAL_STATUS_SQL.format(message_id='v.message_id', channel='v.channel')}
+    FROM unnest(%(channels)s::TEXT[], %(message_ids)s::BIGINT[], %(media_paths)s::TEXT[])
+        AS v (channel, message_id, media_path)
+    ON CONFLICT (channel, message_id) DO NOTHING
+"""
+
+# Jobs whose lease expired on their last attempt won't be claimed again
+EXPIRE_JOBS_SQL = """
+    UPDATE raw.detection_jobs
+    SET status = 'failed', leased_by = NULL, lease_expires_at = NULL,
+        last_error = COALESCE(last_error, 'lease expired'), updated_at = now()
+    WHERE status = 'leased' AND lease_expires_at < now() AND attempts >= %(max_attempts)s
+"""
+
+# SKIP LOCKED: rows another worker is claiming right now are passed over rather
+# than waited for, so concurrent claims never return the same job
+CLAIM_JOBS_SQL = """
+    UPDATE raw.detection_jobs j
+    SET status = 'leased', leased_by = %(worker_id)s, attempts = j.attempts + 1,
+        lease_expires_at = now() + make_interval(secs => %(lease_seconds)s), updated_at = now()
+    FROM (
+        SELECT channel, message_id
+        FROM raw.detection_jobs
+        WHERE (status = 'pending' OR (status = 'leased' AND lease_expires_at < now()))
+        AND attempts < %(max_attempts)s
+        {job_filter}
+        ORDER BY channel, message_id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ) claimable
+    WHERE j.channel = claimable.channel AND j.message_id = claimable.message_id
+    RETURNING j.channel, j.message_id, j.media_path
+"""
+
+CLAIM_JOBS_FILTER_SQL = """
+        AND (channel, message_id) IN (
+            SELECT * FROM unnest(%(channels)s::TEXT[], %(message_ids)s::BIGINT[])
+        )
+"""
+
+# Only jobs still leased by the worker are completed: if its lease expired and another
+# worker took the job over, the late results are dropped instead of duplicated
+COMPLETE_JOBS_SQL = """
+    UPDATE raw.detection_jobs j
+    SET status = CASE WHEN v.detection_count > 0 THEN 'detected' ELSE 'no_detections' END,
+        detection_count = v.detection_count, leased_by = NULL, lease_expires_at = NULL,
+        last_error = NULL, updated_at = now()
+    FROM unnest(%(channels)s::TEXT[], %(message_ids)s::BIGINT[], %(detection_counts)s::INTEGER[])
+        AS v (channel, message_id, detection_count)
+    WHERE j.channel = v.channel AND j.message_id = v.message_id
+    AND j.status = 'leased' AND j.leased_by = %(worker_id)s
+    RETURNING j.channel, j.message_id
+"""
+
+RELEASE_JOBS_SQL = """
+    UPDATE raw.detection_jobs j
+    SET status = CASE WHEN v.retry AND j.attempts < %(max_attempts)s THEN 'pending' ELSE 'failed' END,
+        leased_by = NULL, lease_expires_at = NULL, last_error = v.error, updated_at = now()
+    FROM unnest(%(channels)s::TEXT[], %(message_ids)s::BIGINT[], %(errors)s::TEXT[], %(retries)s::BOOLEAN[])
+        AS v (channel, message_id, error, retry)
+    WHERE j.channel = v.channel AND j.message_id = v.message_id
+    AND j.status = 'leased' AND j.leased_by = %(worker_id)s
+    RETURNING j.status
+"""
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+_detections_table_ready = False
+_model = None
+_model_lock = threading.Lock()
+
+def get_model(warmup=YOLO_WARMUP):
+    """Return the process-wide inference backend (YOLO_BACKEND), loading it on first use.
+
+    With `warmup`, one inference on a blank image runs right after loading, so
+    the first real batch doesn't also pay for lazy initialisation in the runtime.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            from detection_backends import load_backend
+
+            start = time.perf_counter()
+            model = load_backend(YOLO_BACKEND, YOLO_MODEL_PATH, YOLO_IMAGE_SIZE,
+                                 calibration_images=sample_calibration_images)
+            if warmup:
+                model.detect([Image.new('RGB', (YOLO_IMAGE_SIZE, YOLO_IMAGE_SIZE))])
+            _model = model
+            logger.info(f"Loaded {YOLO_MODEL_PATH} ({YOLO_BACKEND}) in {time.perf_counter() - start:.2f}s "
+                        f"(warm-up: {warmup})")
+        return _model
+
+def model_fingerprint(backend=YOLO_BACKEND, weights=YOLO_MODEL_PATH, image_size=YOLO_IMAGE_SIZE):
+    """Identifies what produced a set of detections: the backend, the weights (path,
+    size and mtime) and the input size. Cached detections are keyed by it, so
+    changing any of them re-runs the images instead of reusing stale results."""
+    try:
+        stat = os.stat(weights)
+        weights_version = f"{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        weights_version = ''  # Not downloaded yet (ultralytics fetches known weights by name)
+    fingerprint = f"{backend}|{os.path.abspath(weights)}|{weights_version}|{image_size}"
+    return hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+
+def sample_calibration_images(images_path=YOLO_CALIBRATION_IMAGES_PATH, sample_size=YOLO_CALIBRATION_SAMPLE_SIZE):
+    """Decoded photos sampled from the lake, for INT8 calibration. The sample is
+    seeded, so re-quantizing the same lake picks the same photos."""
+    paths = sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(images_path)
+        for name in names if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))
+    )
+    sample = random.Random(0).sample(paths, min(sample_size, len(paths)))
+    logger.info(f"Calibrating on {len(sample)} of {len(paths)} images in {images_path}")
+    for image_path in sample:
+        try:
+            yield load_image(image_path)
+        except Exception as e:
+            logger.warning(f"Skipping calibration image {image_path}: {str(e)}")
 
 def get_db_connection():
     """Create and return a database connection"""
     return psycopg2.connect(os.getenv('DATABASE_URL'))
 
+def get_connection_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ThreadedConnectionPool(1, DB_POOL_MAX_CONNECTIONS, os.getenv('DATABASE_URL'))
+        return _connection_pool
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the pool for the duration of a `with` block"""
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+def ensure_detections_table(conn):
+    global _detections_table_ready
+    if _detections_table_ready:
+        return
+    with conn.cursor() as cur:
+        cur.execute(DETECTIONS_DDL)
+    conn.commit()
+    _detections_table_ready = True
+
 def process_image(image_path):
     """Process an image with YOLO and return detections"""
     try:
-        results = model(image_path)
-        detections = []
-        
-        for result in results:
-            for box in result.boxes:
-                detections.append({
-                    'class_id': int(box.cls),
-                    'class_name': model.names[int(box.cls)],
-                    'confidence': float(box.conf),
-                    'bbox': box.xywhn.tolist()[0]  # Normalized xywh coordinates
-                })
-        
-        return detections
+        return get_model().detect([load_image(image_path)])[0]
     
     except Exception as e:
         logger.error(f"Error processing image {image_path}: {str(e)}")
         return []
 
-def save_detections_to_db(message_id, detections):
-    """Save detection results to database"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
+def load_image(image_path, image_size=YOLO_IMAGE_SIZE):
+    """Decode an image and shrink it to the model input size.
+
+    YOLO letterboxes everything to `image_size` anyway, so decoding at full
+    resolution is wasted work. For JPEGs, `draft` lets libjpeg decode at a reduced
+    scale directly. Normalized bbox coordinates are unaffected by the resize.
+    """
+    image = Image.open(image_path)
+    # draft() only scales down while both sides stay >= the requested box, so ask for the
+    # letterboxed size; a square box would never reduce a non-square photo
+    scale = image_size / max(image.size)
+    if scale < 1:
+        image.draft('RGB', (round(image.width * scale), round(image.height * scale)))
+    image = image.convert('RGB')
+    image.thumbnail((image_size, image_size))
+    return image
+
+def _decode_batch(executor, batch):
+    return [executor.submit(load_image, image_path) for _, image_path in batch]
+
+def process_images_batched(items, batch_size=YOLO_BATCH_SIZE, decode_workers=YOLO_DECODE_WORKERS):
+    """Run YOLO over (message_id, image_path) pairs in batches.
+
+    Images of the next batch are decoded on a thread pool while the model runs on
+    the current one. Yields (message_id, image_path, detections) for every image
+    that could be decoded and processed, in input order.
+    """
+    items = list(items)
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    if not batches:
+        return
+
+    model = get_model()
+    with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+        next_images = _decode_batch(executor, batches[0])
+        for index, batch in enumerate(batches):
+            images = next_images
+            # Start decoding the following batch before running inference on this one
+            if index + 1 < len(batches):
+                next_images = _decode_batch(executor, batches[index + 1])
+
+            decoded = []
+            for (message_id, image_path), future in zip(batch, images):
+                try:
+                    decoded.append((message_id, image_path, future.result()))
+                except Exception as e:
+                    logger.error(f"Error decoding image {image_path}: {str(e)}")
+            if not decoded:
+                continue
+
+            try:
+                with metrics.DETECTION_BATCH_SECONDS.time(stage='batch'):
+                    results = model.detect([image for _, _, image in decoded])
+                metrics.DETECTION_IMAGES.inc(len(decoded))
+            except Exception as e:
+                logger.error(f"Error processing batch of {len(decoded)} images: {str(e)}")
+                continue
+
+            for (message_id, image_path, _), detections in zip(decoded, results):
+                yield message_id, image_path, detections
+
+def detect_with_cache(items, media_cache, detect=process_images_batched, model=None):
+    """Run `detect` once per distinct image, reusing cached detections.
+
+    Images are identified by content hash, so a photo reposted across messages
+    and channels costs one inference. Cached detections are only reused for the
+    same `model` (default: model_fingerprint() of the configured model). Yields
+    (message_id, image_path, detections) like `detect`; without a cache, it is
+    `detect(items)`.
+    """
+    if media_cache is None:
+        yield from detect(items)
+        return
+    model = model or model_fingerprint()
+
+    by_hash = {}
+    for message_id, image_path in items:
+        try:
+            content_hash = media_cache.hash_for_path(image_path)
+        except OSError as e:
+            logger.error(f"Error reading image {image_path}: {str(e)}")
+            continue
+        by_hash.setdefault(content_hash, []).append((message_id, image_path))
+
+    uncached = []
+    for content_hash, references in by_hash.items():
+        detections = media_cache.get_detections(content_hash, model)
+        if detections is None:
+            uncached.append((content_hash, references[0][1]))
+            continue
+        for message_id, image_path in references:
+            yield message_id, image_path, detections
+
+    reference_count = sum(len(references) for references in by_hash.values())
+    logger.info(f"{reference_count} image references, {len(by_hash)} distinct images, {len(uncached)} to run through the model")
+
+    for content_hash, _, detections in detect(uncached):
+        media_cache.put_detections(content_hash, detections, model)
+        for message_id, image_path in by_hash[content_hash]:
+            yield message_id, image_path, detections
+
+class DetectionWriter:
+    """Buffers detections across many images and writes them in batches.
+
+    A flush happens once DETECTION_FLUSH_SIZE detections (plus, with a worker_id,
+    images) are buffered or the oldest buffered one is older than
+    DETECTION_FLUSH_INTERVAL_SECONDS. Each flush is one multi-row INSERT
+    (execute_values) in one transaction on a pooled connection. Use as a context
+    manager so the tail is flushed.
+
+    With a `worker_id`, every added image is a job leased by that worker, identified
+    by (channel, message_id): the flush completes the jobs (as 'detected' or
+    'no_detections') in the same transaction, and drops the detections of jobs
+    whose lease was lost.
+    """
+
+    def __init__(self, flush_size=DETECTION_FLUSH_SIZE, flush_interval=DETECTION_FLUSH_INTERVAL_SECONDS,
+                 worker_id=None):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.worker_id = worker_id
+        self.saved_count = 0
+        self.completed_count = 0
+        self._rows = []
+        self._jobs = {}  # (channel, message_id) -> detection count, with a worker_id
+        self._oldest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, message_id, detections, channel=None):
         for detection in detections:
-            cur.execute("""
-                INSERT INTO image_detections 
-                (message_id, class_id, class_name, confidence, bbox)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    message_id,
-                    detection['class_id'],
-                    detection['class_name'],
-                    detection['confidence'],
-                    json.dumps(detection['bbox'])
-                )
-            )
-        
-        conn.commit()
-        logger.info(f"Saved {len(detections)} detections for message {message_id}")
-    
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error saving detections to DB: {str(e)}")
-    
-    finally:
-        cur.close()
-        conn.close()
+            self._rows.append((
+                channel,
+                message_id,
+                detection['class_id'],
+                detection['class_name'],
+                detection['confidence'],
+                json.dumps(detection['bbox'])
+            ))
+        if self.worker_id is not None:
+            key = (channel, message_id)
+            self._jobs[key] = self._jobs.get(key, 0) + len(detections)
+        if (self._rows or self._jobs) and self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._rows) + len(self._jobs) >= self.flush_size or (
+                self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval):
+            self.flush()
 
-def get_messages_with_images():
-    """Retrieve messages with images that haven't been processed yet"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            SELECT m.message_id, m.media_path
-            FROM stg_telegram_messages m
-            LEFT JOIN image_detections d ON m.message_id = d.message_id
-            WHERE m.has_media = TRUE 
-            AND m.media_type = 'photo'
-            AND d.message_id IS NULL
-            AND m.media_path IS NOT NULL
-            """)
-        
-        return cur.fetchall()
-    
-    except Exception as e:
-        logger.error(f"Error fetching messages with images: {str(e)}")
-        return []
-    
-    finally:
-        cur.close()
-        conn.close()
+    def flush(self):
+        if not self._rows and not self._jobs:
+            return
+        rows, jobs = self._rows, self._jobs
+        self._rows, self._jobs, self._oldest = [], {}, None
+        with pooled_connection() as conn:
+            try:
+                ensure_detections_table(conn)
+                with conn.cursor() as cur:
+                    if jobs:
+                        with metrics.DB_WRITE_SECONDS.time(operation='complete_detection_jobs'):
+                            cur.execute(COMPLETE_JOBS_SQL, {'channels': [channel for channel, _ in jobs],
+                                                            'message_ids': [message_id for _, message_id in jobs],
+                                                            'detection_counts': list(jobs.values()),
+                                                            'worker_id': self.worker_id})
+                            completed = {tuple(row) for row in cur.fetchall()}
+                        lost = len(jobs) - len(completed)
+                        if lost:
+                            logger.warning(f"Dropping results of {lost} job(s) whose lease expired")
+                            metrics.DETECTION_JOBS.inc(lost, outcome='lease_lost')
+                        rows = [row for row in rows if (row[0], row[1]) in completed]
+                    if rows:
+                        with metrics.DB_WRITE_SECONDS.time(operation='insert_detections'):
+                            execute_values(cur, """
+                                INSERT INTO raw.image_detections
+                                (channel, message_id, class_id, class_name, confidence, bbox)
+                                VALUES %s
+                                """, rows, page_size=1000)
+                conn.commit()
+                if jobs:
+                    detected = sum(1 for key in completed if jobs[key])
+                    metrics.DETECTION_JOBS.inc(detected, outcome='detected')
+                    metrics.DETECTION_JOBS.inc(len(completed) - detected, outcome='no_detections')
+                    self.completed_count += len(completed)
+                metrics.DB_ROWS_WRITTEN.inc(len(rows), operation='insert_detections')
+                self.saved_count += len(rows)
+                logger.info(f"Saved {len(rows)} detections" + (f" of {len(completed)} jobs" if jobs else ""))
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error saving detections to DB: {str(e)}")
+
+def save_detections_to_db(message_id, detections, channel=None):
+    """Save detection results of a single image to database"""
+    with DetectionWriter() as writer:
+        writer.add(message_id, detections, channel=channel)
+
+def detection_worker_id():
+    """Identifies this process's leases in raw.detection_jobs"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def enqueue_detection_jobs(items=None):
+    """Add photos to the detection work queue; returns the number of new jobs.
+
+    `items` are (channel, message_id, image_path) triples; without them, every photo message
+    in stg_telegram_messages that has no job yet is added. Photos already queued keep their job.
+    """
+    with pooled_connection() as conn:
+        try:
+            ensure_detections_table(conn)
+            with metrics.DB_WRITE_SECONDS.time(operation='enqueue_detection_jobs'):
+                with conn.cursor() as cur:
+                    if items is None:
+                        cur.execute(ENQUEUE_STAGED_JOBS_SQL)
+                    else:
+                        items = list(items)
+                        cur.execute(ENQUEUE_JOBS_SQL, {'channels': [channel for channel, _, _ in items],
+                                                       'message_ids': [message_id for _, message_id, _ in items],
+                                                       'media_paths': [path for _, _, path in items]})
+                    added = cur.rowcount
+                conn.commit()
+            metrics.DB_ROWS_WRITTEN.inc(added, operation='enqueue_detection_jobs')
+            return added
+        except Exception:
+            conn.rollback()
+            raise
+
+def claim_detection_jobs(worker_id, limit=DETECTION_CLAIM_SIZE, lease_seconds=DETECTION_LEASE_SECONDS,
+                         max_attempts=DETECTION_MAX_ATTEMPTS, jobs=None):
+    """Lease up to `limit` jobs to `worker_id`; returns their (channel, message_id, image_path) triples.
+
+    Pending jobs are claimable, and so are leased jobs whose lease expired with
+    attempts left. Restricted to `jobs`, (channel, message_id) pairs, if given.
+    Any number of workers, on any host, can claim at once without getting the same job.
+    """
+    params = {'worker_id': worker_id, 'limit': limit, 'lease_seconds': lease_seconds,
+              'max_attempts': max_attempts}
+    job_filter = ""
+    if jobs is not None:
+        jobs = list(jobs)
+        params.update(channels=[channel for channel, _ in jobs], message_ids=[message_id for _, message_id in jobs])
+        job_filter = CLAIM_JOBS_FILTER_SQL
+    with pooled_connection() as conn:
+        try:
+            ensure_detections_table(conn)
+            with metrics.DB_WRITE_SECONDS.time(operation='claim_detection_jobs'):
+                with conn.cursor() as cur:
+                    cur.execute(EXPIRE_JOBS_SQL, params)
+                    expired = cur.rowcount
+                    cur.execute(CLAIM_JOBS_SQL.format(job_filter=job_filter), params)
+                    claimed = cur.fetchall()
+                conn.commit()
+            metrics.DETECTION_JOBS.inc(expired, outcome='failed')
+            metrics.DETECTION_JOBS.inc(len(claimed), outcome='claimed')
+            return claimed
+        except Exception:
+            conn.rollback()
+            raise
+
+def release_detection_jobs(worker_id, errors, retry=True, max_attempts=DETECTION_MAX_ATTEMPTS):
+    """Give up leased jobs that couldn't be processed ({(channel, message_id): error}).
+
+    With `retry`, a job with attempts left goes back to 'pending'; otherwise it is 'failed'.
+    """
+    if not errors:
+        return
+    params = {'worker_id': worker_id, 'max_attempts': max_attempts,
+              'channels': [channel for channel, _ in errors], 'message_ids': [message_id for _, message_id in errors],
+              'errors': list(errors.values()), 'retries': [retry] * len(errors)}
+    with pooled_connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(RELEASE_JOBS_SQL, params)
+                statuses = [row[0] for row in cur.fetchall()]
+            conn.commit()
+            metrics.DETECTION_JOBS.inc(statuses.count('pending'), outcome='released')
+            metrics.DETECTION_JOBS.inc(statuses.count('failed'), outcome='failed')
+        except Exception as e:
+            # The leases expire on their own, so the jobs are retried either way
+            conn.rollback()
+            logger.error(f"Error releasing detection jobs: {str(e)}")
+
+def drain_detection_jobs(worker_id=None, detect=process_images_batched, media_cache=None,
+                         claim_size=DETECTION_CLAIM_SIZE, jobs=None):
+    """Claim and process jobs until none are claimable; returns counts.
+
+    Each claimed batch is detected (reusing cached detections) and its jobs
+    completed before the next claim. Photos missing on disk fail right away;
+    photos that couldn't be decoded or detected go back to the queue.
+    Restricted to `jobs`, (channel, message_id) pairs, if given.
+    """
+    worker_id = worker_id or detection_worker_id()
+    stats = {'claimed': 0, 'missing': 0, 'released': 0}
+    with DetectionWriter(worker_id=worker_id) as writer:
+        while True:
+            claimed = claim_detection_jobs(worker_id, claim_size, jobs=jobs)
+            if not claimed:
+                break
+            stats['claimed'] += len(claimed)
+            # Items are keyed by (channel, message_id): message ids are only unique per channel
+            present = [((channel, message_id), image_path) for channel, message_id, image_path in claimed
+                       if os.path.exists(image_path)]
+            missing = {(channel, message_id): f"Image path does not exist: {image_path}"
+                       for channel, message_id, image_path in claimed if not os.path.exists(image_path)}
+            release_detection_jobs(worker_id, missing, retry=False)
+            stats['missing'] += len(missing)
+
+            processed = set()
+            for (channel, message_id), _, detections in detect_with_cache(present, media_cache, detect=detect):
+                writer.add(message_id, detections, channel=channel)
+                processed.add((channel, message_id))
+            writer.flush()  # Complete this batch's jobs while their leases are fresh
+            failed = {key: "Detection failed" for key, _ in present if key not in processed}
+            release_detection_jobs(worker_id, failed)
+            stats['released'] += len(failed)
+            logger.info(f"Processed {len(processed)} of {len(claimed)} claimed jobs")
+    return dict(stats, completed=writer.completed_count, detections_saved=writer.saved_count)
 
 def main():
-    messages = get_messages_with_images()
-    logger.info(f"Found {len(messages)} messages with images to process")
-    
-    for message_id, image_path in messages:
-        if os.path.exists(image_path):
-            detections = process_image(image_path)
-            if detections:
-                save_detections_to_db(message_id, detections)
-        else:
-            logger.warning(f"Image path does not exist: {image_path}")
+    added = enqueue_detection_jobs()
+    logger.info(f"Queued {added} new photos for detection")
+
+    media_cache = get_media_cache()
+    try:
+        stats = drain_detection_jobs(media_cache=media_cache)
+        logger.info(f"Detection jobs: {stats}")
+    finally:
+        if media_cache:
+            logger.info(f"Detection cache hit rate: {media_cache.hit_rate('detection'):.1%}")
+            media_cache.close()
+        metrics.write_snapshot()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
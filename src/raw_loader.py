@@ -0,0 +1,432 @@
+# raw_loader.py
+import os
+import io
+import json
+import logging
+from datetime import datetime
+
+import psycopg2
+from dotenv import load_dotenv
+
+from scraping import metrics
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('raw_loader.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Data lake paths (same layout as the scraper writes)
+DATA_LAKE_BASE_PATH = os.getenv('DATA_LAKE_PATH', '/app/data/raw')
+RAW_MESSAGES_PATH = os.path.join(DATA_LAKE_BASE_PATH, 'telegram_messages')
+RAW_MEDIA_RESULTS_PATH = os.path.join(DATA_LAKE_BASE_PATH, 'telegram_media')
+
+# Completed lake files; `.inprogress` chunks are still being written and are skipped
+MESSAGE_FILE_EXTENSIONS = ('.ndjson', '.parquet', '.json')
+MEDIA_FILE_EXTENSIONS = ('.ndjson',)
+PARQUET_READ_BATCH_SIZE = int(os.getenv('LOADER_PARQUET_BATCH_SIZE', 10000))
+
+# Columns of raw.telegram_messages filled from each lake record (in COPY order)
+MESSAGE_COLUMNS = [
+    'channel', 'id', 'date', 'message', 'views', 'forwards', 'replies',
+    'media', 'media_type', 'media_path', 'media_status', 'sender_id', 'post_author',
+    'grouped_id', 'channel_id', 'channel_title', 'raw_message', 'source_file'
+]
+MEDIA_COLUMNS = ['channel', 'id', 'media_type', 'media_path', 'media_status', 'media_width', 'media_height',
+                 'source_file']
+
+DDL = """
+CREATE SCHEMA IF NOT EXISTS raw;
+
+CREATE TABLE IF NOT EXISTS raw.telegram_messages (
+    channel TEXT NOT NULL,
+    id BIGINT NOT NULL,
+    date TIMESTAMPTZ,
+    message TEXT,
+    views INTEGER,
+    forwards INTEGER,
+    replies INTEGER,
+    media BOOLEAN,
+    media_type TEXT,
+    media_path TEXT,
+    media_status TEXT,
+    sender_id BIGINT,
+    post_author TEXT,
+    grouped_id BIGINT,
+    channel_id BIGINT,
+    channel_title TEXT,
+    raw_message JSONB,
+    source_file TEXT,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (channel, id)
+);
+
+-- Media download outcomes arrive after (and independently of) the message text
+CREATE TABLE IF NOT EXISTS raw.telegram_media (
+    channel TEXT NOT NULL,
+    id BIGINT NOT NULL,
+    media_type TEXT,
+    media_path TEXT,
+    media_status TEXT,
+    media_width INTEGER,
+    media_height INTEGER,
+    source_file TEXT,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (channel, id)
+);
+-- Stored image dimensions (added with the reduced-size ingest modes)
+ALTER TABLE raw.telegram_media ADD COLUMN IF NOT EXISTS media_width INTEGER;
+ALTER TABLE raw.telegram_media ADD COLUMN IF NOT EXISTS media_height INTEGER;
+
+-- Manifest of lake files already merged, so reruns skip them
+CREATE TABLE IF NOT EXISTS raw.loaded_files (
+    file_path TEXT PRIMARY KEY,
+    file_kind TEXT NOT NULL,
+    file_size BIGINT,
+    row_count INTEGER,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+MERGE_MESSAGES_SQL = f"""
+    INSERT INTO raw.telegram_messages ({', '.join(MESSAGE_COLUMNS)})
+    SELECT DISTINCT ON (channel, id) {', '.join(MESSAGE_COLUMNS)}
+    FROM stage_telegram_messages
+    ORDER BY channel, id
+    ON CONFLICT (channel, id) DO UPDATE SET
+        date = EXCLUDED.date,
+        message = EXCLUDED.message,
+        views = EXCLUDED.views,
+        forwards = EXCLUDED.forwards,
+        replies = EXCLUDED.replies,
+        media = EXCLUDED.media,
+        -- A re-scrape writes media as 'pending' (its download outcome goes to raw.telegram_media);
+        -- keep what an earlier load recorded
+        media_type = COALESCE(EXCLUDED.media_type, raw.telegram_messages.media_type),
+        media_path = CASE WHEN EXCLUDED.media_status = 'pending'
+                          THEN COALESCE(raw.telegram_messages.media_path, EXCLUDED.media_path)
+                          ELSE COALESCE(EXCLUDED.media_path, raw.telegram_messages.media_path) END,
+        media_status = CASE WHEN EXCLUDED.media_status = 'pending'
+                            THEN COALESCE(raw.telegram_messages.media_status, EXCLUDED.media_status)
+                            ELSE COALESCE(EXCLUDED.media_status, raw.telegram_messages.media_status) END,
+        sender_id = EXCLUDED.sender_id,
+        post_author = EXCLUDED.post_author,
+        grouped_id = EXCLUDED.grouped_id,
+        channel_id = EXCLUDED.channel_id,
+        channel_title = EXCLUDED.channel_title,
+        raw_message = EXCLUDED.raw_message,
+        source_file = EXCLUDED.source_file,
+        loaded_at = now()
+"""
+
+MERGE_MEDIA_SQL = f"""
+    INSERT INTO raw.telegram_media ({', '.join(MEDIA_COLUMNS)})
+    SELECT DISTINCT ON (channel, id) {', '.join(MEDIA_COLUMNS)}
+    FROM stage_telegram_media
+    ORDER BY channel, id
+    ON CONFLICT (channel, id) DO UPDATE SET
+        media_type = EXCLUDED.media_type,
+        media_path = EXCLUDED.media_path,
+        media_status = EXCLUDED.media_status,
+        media_width = EXCLUDED.media_width,
+        media_height = EXCLUDED.media_height,
+        source_file = EXCLUDED.source_file,
+        loaded_at = now()
+"""
+
+
+def get_db_connection():
+    """Create and return a database connection"""
+    return psycopg2.connect(os.getenv('DATABASE_URL'))
+
+
+def _csv_field(value):
+    # COPY ... (FORMAT csv): an unquoted empty field is NULL, a quoted one is ''
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CSVRowStream(io.TextIOBase):
+    """Read-only text stream that renders rows as CSV on demand, for COPY FROM STDIN.
+
+    Rows are produced lazily from `rows`, so a file of any size is copied with
+    constant memory.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._pending = ''
+        self.row_count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        lines = [self._pending]
+        buffered = len(self._pending)
+        while size < 0 or buffered < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = ','.join(_csv_field(value) for value in row) + '\n'
+            lines.append(line)
+            buffered += len(line)
+            self.row_count += 1
+        data = ''.join(lines)
+        if size < 0:
+            size = len(data)
+        chunk, self._pending = data[:size], data[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def _clean_text(value):
+    # Postgres text can't hold NUL characters
+    return value.replace('\x00', '') if isinstance(value, str) else value
+
+
+def iter_lake_records(path):
+    """Yields the records of a lake file (NDJSON chunk, Parquet file or legacy JSON array)."""
+    if path.endswith('.ndjson'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq  # only needed when the lake holds Parquet files
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=PARQUET_READ_BATCH_SIZE):
+            yield from batch.to_pylist()
+    else:
+        # Files written before the scraper switched to NDJSON
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def channel_from_path(path):
+    """Channel directory of a lake file: `<date>/<channel>/file` or `channel=<channel>/date=<date>/file`."""
+    parts = os.path.normpath(path).split(os.sep)
+    for part in parts:
+        if part.startswith('channel='):
+            return part[len('channel='):]
+    return parts[-2]
+
+
+def message_rows(path, source_file):
+    """Turns lake message records into rows matching MESSAGE_COLUMNS."""
+    fallback_channel = channel_from_path(path)
+    for record in iter_lake_records(path):
+        raw_message = record.get('raw_message_json')
+        if raw_message is not None and not isinstance(raw_message, str):
+            raw_message = json.dumps(raw_message, ensure_ascii=False, default=str)
+        date = record.get('date')
+        yield [
+            record.get('channel_name') or fallback_channel,
+            record['message_id'],
+            date.isoformat() if isinstance(date, datetime) else date,
+            _clean_text(record.get('message_text')),
+            record.get('views'),
+            record.get('forwards'),
+            record.get('replies'),
+            record.get('media_present'),
+            record.get('media_type'),
+            record.get('media_file_path'),
+            record.get('media_status'),
+            record.get('sender_id'),
+            _clean_text(record.get('post_author')),
+            record.get('grouped_id'),
+            record.get('channel_id'),
+            _clean_text(record.get('channel_title')),
+            # JSONB can't hold \u0000 either
+            raw_message.replace('\\u0000', '') if raw_message else None,
+            source_file,
+        ]
+
+
+def media_rows(path, source_file):
+    """Turns media outcome records into rows matching MEDIA_COLUMNS."""
+    channel = channel_from_path(path)
+    for record in iter_lake_records(path):
+        yield [
+            channel,
+            record['message_id'],
+            record.get('media_type'),
+            record.get('media_file_path'),
+            record.get('media_status'),
+            record.get('media_width'),
+            record.get('media_height'),
+            source_file,
+        ]
+
+
+def discover_lake_files(messages_path=RAW_MESSAGES_PATH, media_path=RAW_MEDIA_RESULTS_PATH, changed_since=None):
+    """Lists completed lake files as (kind, path), messages before media, oldest partitions first.
+
+    With `changed_since` (a timestamp), only partition directories modified since
+    then are listed. Chunks are renamed into place when complete, which updates
+    their directory's mtime, so older partitions can't hold newly completed files.
+    """
+    files = []
+    for kind, base_path, extensions in (
+        ('messages', messages_path, MESSAGE_FILE_EXTENSIONS),
+        ('media', media_path, MEDIA_FILE_EXTENSIONS),
+    ):
+        found = []
+        if changed_since is None:
+            for root, _, names in os.walk(base_path):
+                found.extend(os.path.join(root, name) for name in names if name.endswith(extensions))
+        else:
+            for directory in changed_partition_directories(base_path, changed_since):
+                found.extend(entry.path for entry in os.scandir(directory)
+                             if entry.is_file() and entry.name.endswith(extensions))
+        files.extend((kind, path) for path in sorted(found))
+    return files
+
+
+def changed_partition_directories(base_path, changed_since):
+    """Partition directories (`<date>/<channel>/` or `channel=<channel>/date=<date>/`, both
+    two levels deep) under `base_path` whose mtime is at or after `changed_since`."""
+    if not os.path.isdir(base_path):
+        return
+    for outer in os.scandir(base_path):
+        if not outer.is_dir():
+            continue
+        for partition in os.scandir(outer.path):
+            try:
+                if partition.is_dir() and partition.stat().st_mtime >= changed_since:
+                    yield partition.path
+            except FileNotFoundError:
+                continue  # Removed since it was listed
+
+
+def discover_partition_files(channel_name, partition_date, messages_path=RAW_MESSAGES_PATH,
+                             media_path=RAW_MEDIA_RESULTS_PATH):
+    """Completed lake files of one channel and day (`partition_date` as YYYY-MM-DD), as (kind, path).
+
+    Looks in both lake layouts (`<date>/<channel>/` and `channel=<channel>/date=<date>/`).
+    """
+    files = []
+    for kind, base_path, extensions in (
+        ('messages', messages_path, MESSAGE_FILE_EXTENSIONS),
+        ('media', media_path, MEDIA_FILE_EXTENSIONS),
+    ):
+        for directory in (os.path.join(base_path, partition_date, channel_name),
+                          os.path.join(base_path, f'channel={channel_name}', f'date={partition_date}')):
+            if os.path.isdir(directory):
+                files.extend((kind, os.path.join(directory, name))
+                             for name in sorted(os.listdir(directory)) if name.endswith(extensions))
+    return files
+
+
+def ensure_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(DDL)
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS stage_telegram_messages
+            (LIKE raw.telegram_messages INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+            """)
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS stage_telegram_media
+            (LIKE raw.telegram_media INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+            """)
+    conn.commit()
+
+
+def get_loaded_files(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT file_path FROM raw.loaded_files")
+        return {row[0] for row in cur.fetchall()}
+
+
+def load_file(conn, kind, path):
+    """COPYs one lake file into its staging table and merges it, in a single transaction.
+
+    Returns the number of rows copied.
+    """
+    source_file = os.path.relpath(path, DATA_LAKE_BASE_PATH)
+    if kind == 'messages':
+        stage_table, columns, merge_sql = 'stage_telegram_messages', MESSAGE_COLUMNS, MERGE_MESSAGES_SQL
+        stream = CSVRowStream(message_rows(path, source_file))
+    else:
+        stage_table, columns, merge_sql = 'stage_telegram_media', MEDIA_COLUMNS, MERGE_MEDIA_SQL
+        stream = CSVRowStream(media_rows(path, source_file))
+
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY {stage_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                stream
+            )
+            cur.execute(merge_sql)
+            cur.execute("""
+                INSERT INTO raw.loaded_files (file_path, file_kind, file_size, row_count)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (file_path) DO NOTHING
+                """,
+                (source_file, kind, os.path.getsize(path), stream.row_count)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return stream.row_count
+
+
+def load_raw_to_postgres(conn=None, files=None):
+    """Loads every lake file that isn't in the manifest yet into raw.telegram_messages / raw.telegram_media.
+
+    `files` restricts the run to specific (kind, path) pairs. Returns load statistics.
+    """
+    own_connection = conn is None
+    if own_connection:
+        conn = get_db_connection()
+
+    stats = {'files_loaded': 0, 'files_skipped': 0, 'files_failed': 0, 'message_rows': 0, 'media_rows': 0}
+    try:
+        ensure_tables(conn)
+        loaded = get_loaded_files(conn)
+        for kind, path in (files if files is not None else discover_lake_files()):
+            if os.path.relpath(path, DATA_LAKE_BASE_PATH) in loaded:
+                stats['files_skipped'] += 1
+                continue
+            try:
+                with metrics.DB_WRITE_SECONDS.time(operation=f'load_{kind}'):
+                    row_count = load_file(conn, kind, path)
+            except Exception as e:
+                logger.error(f"Error loading {path}: {str(e)}")
+                stats['files_failed'] += 1
+                continue
+            stats['files_loaded'] += 1
+            metrics.DB_ROWS_WRITTEN.inc(row_count, operation=f'load_{kind}')
+            stats[f'{"message" if kind == "messages" else "media"}_rows'] += row_count
+            logger.info(f"Loaded {row_count} {kind} rows from {path}")
+    finally:
+        if own_connection:
+            conn.close()
+
+    logger.info(f"Raw load finished: {stats}")
+    return stats
+
+
+def main():
+    stats = load_raw_to_postgres()
+    metrics.write_snapshot()
+    if stats['files_failed']:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# src/scraping/checkpoint_store.py
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+
+# Which backend to use for the per-channel high-water marks: 'sqlite' or 'json'
+CHECKPOINT_BACKEND = os.getenv('SCRAPER_CHECKPOINT_BACKEND', 'sqlite')
+# Where checkpoint state lives. Keep it on a mounted volume next to the data lake
+# so a container restart doesn't throw away the scraping progress.
+SCRAPER_STATE_PATH = os.getenv(
+    'SCRAPER_STATE_PATH',
+    os.path.join(os.getenv('DATA_LAKE_PATH', '/app/data/raw'), '_state')
+)
+
+
+class CheckpointStore:
+    """Base class for stores that remember the highest scraped message ID per channel."""
+
+    def get(self, channel_key):
+        """Returns the last committed message ID for a channel (0 if never scraped)."""
+        raise NotImplementedError
+
+    def set(self, channel_key, message_id, **details):
+        """Records `message_id` as the new high-water mark for a channel.
+
+        The mark only ever moves forward, so replaying an older batch after a
+        crash can't rewind the checkpoint.
+        """
+        raise NotImplementedError
+
+    def all(self):
+        """Returns a dict of channel_key -> checkpoint record."""
+        raise NotImplementedError
+
+    def reset(self, channel_key):
+        """Forgets the checkpoint of a channel so the next run does a full scrape."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class JsonCheckpointStore(CheckpointStore):
+    """Small file-backed store. Writes are atomic (temp file + rename)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._state = json.load(f)
+
+    def get(self, channel_key):
+        with self._lock:
+            record = self._state.get(str(channel_key))
+            return record['last_message_id'] if record else 0
+
+    def set(self, channel_key, message_id, **details):
+        with self._lock:
+            key = str(channel_key)
+            current = self._state.get(key, {}).get('last_message_id', 0)
+            if message_id <= current:
+                return current
+            self._state[key] = {
+                'last_message_id': message_id,
+                'updated_at': datetime.now().isoformat(),
+                **details
+            }
+            self._write()
+            return message_id
+
+    def all(self):
+        with self._lock:
+            return {key: dict(record) for key, record in self._state.items()}
+
+    def reset(self, channel_key):
+        with self._lock:
+            if self._state.pop(str(channel_key), None) is not None:
+                self._write()
+
+    def _write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """SQLite-backed store, safe to share between processes on the same host."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS channel_checkpoints (
+                channel_key TEXT PRIMARY KEY,
+                last_message_id INTEGER NOT NULL,
+                details TEXT,
+                updated_at TEXT NOT NULL
+            )
+            """)
+        self._conn.commit()
+
+    def get(self, channel_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_message_id FROM channel_checkpoints WHERE channel_key = ?",
+                (str(channel_key),)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def set(self, channel_key, message_id, **details):
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO channel_checkpoints (channel_key, last_message_id, details, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (channel_key) DO UPDATE SET
+                    last_message_id = excluded.last_message_id,
+                    details = excluded.details,
+                    updated_at = excluded.updated_at
+                WHERE excluded.last_message_id > channel_checkpoints.last_message_id
+                """,
+                (str(channel_key), message_id, json.dumps(details, ensure_ascii=False), datetime.now().isoformat())
+            )
+            self._conn.commit()
+            row = self._conn.execute(
+                "SELECT last_message_id FROM channel_checkpoints WHERE channel_key = ?",
+                (str(channel_key),)
+            ).fetchone()
+            return row[0]
+
+    def all(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT channel_key, last_message_id, details, updated_at FROM channel_checkpoints"
+            ).fetchall()
+        return {
+            key: {'last_message_id': last_id, 'updated_at': updated_at, **json.loads(details or '{}')}
+            for key, last_id, details, updated_at in rows
+        }
+
+    def reset(self, channel_key):
+        with self._lock:
+            self._conn.execute("DELETE FROM channel_checkpoints WHERE channel_key = ?", (str(channel_key),))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_checkpoint_store(backend=None, state_path=None):
+    """Builds the checkpoint store configured through the environment."""
+    backend = (backend or CHECKPOINT_BACKEND).lower()
+    state_path = state_path or SCRAPER_STATE_PATH
+
+    if backend == 'sqlite':
+        return SQLiteCheckpointStore(os.path.join(state_path, 'checkpoints.sqlite'))
+    if backend == 'json':
+        return JsonCheckpointStore(os.path.join(state_path, 'checkpoints.json'))
+    raise ValueError(f"Unknown checkpoint backend '{backend}'. Use 'sqlite' or 'json'.")
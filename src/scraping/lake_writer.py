@@ -0,0 +1,341 @@
+# src/scraping/lake_writer.py
+
+import os
+import glob
+import json
+import logging
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Output format of the raw message lake: 'ndjson' (default) or 'parquet'
+LAKE_FORMAT = os.getenv('LAKE_FORMAT', 'ndjson')
+
+# --- Chunk rotation ---
+# A chunk is closed (and becomes visible to loaders) once it reaches either limit.
+LAKE_CHUNK_MAX_RECORDS = int(os.getenv('LAKE_CHUNK_MAX_RECORDS', 10000))
+LAKE_CHUNK_MAX_BYTES = int(os.getenv('LAKE_CHUNK_MAX_BYTES', 64 * 1024 * 1024))
+
+# --- Parquet options ---
+LAKE_PARQUET_ROW_GROUP_SIZE = int(os.getenv('LAKE_PARQUET_ROW_GROUP_SIZE', 5000))
+LAKE_PARQUET_COMPRESSION = os.getenv('LAKE_PARQUET_COMPRESSION', 'zstd')
+
+# Chunks are written under this suffix and renamed when complete, so anything
+# matching `*.ndjson` / `*.parquet` in the lake is safe to load while scraping is still running.
+IN_PROGRESS_SUFFIX = '.inprogress'
+
+
+class NDJSONChunkWriter:
+    """Appends records as compact newline-delimited JSON to rotating chunk files.
+
+    Files are named `<file_prefix>_<seq>.ndjson`. Only the current chunk is open;
+    `flush()` fsyncs it, and a chunk is renamed to its final name when it is
+    rotated or the writer is closed.
+    """
+
+    extension = '.ndjson'
+
+    @staticmethod
+    def partition_directory(base_path, channel_name, partition_date):
+        return os.path.join(base_path, partition_date, channel_name)
+
+    def __init__(self, directory, file_prefix, max_records=LAKE_CHUNK_MAX_RECORDS, max_bytes=LAKE_CHUNK_MAX_BYTES):
+        self.directory = directory
+        self.file_prefix = file_prefix
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.records_written = 0
+        self.completed_files = []
+        self._seq = 0
+        self._file = None
+        self._path = None
+        self._chunk_records = 0
+        self._chunk_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+        data = line.encode('utf-8')
+        if self._file is None:
+            self._open_chunk()
+        self._file.write(data)
+        self._chunk_records += 1
+        self._chunk_bytes += len(data)
+        self.records_written += 1
+        if self._chunk_records >= self.max_records or self._chunk_bytes >= self.max_bytes:
+            self._finish_chunk()
+
+    def flush(self):
+        """Makes everything written so far durable (flush + fsync)."""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._finish_chunk()
+
+    def _open_chunk(self):
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            self._seq += 1
+            final_path = os.path.join(self.directory, f"{self.file_prefix}_{self._seq:05d}{self.extension}")
+            if not os.path.exists(final_path) and not os.path.exists(final_path + IN_PROGRESS_SUFFIX):
+                break
+        self._path = final_path
+        self._file = open(final_path + IN_PROGRESS_SUFFIX, 'wb')
+        self._chunk_records = 0
+        self._chunk_bytes = 0
+
+    def _finish_chunk(self):
+        self.flush()
+        self._file.close()
+        self._file = None
+        os.replace(self._path + IN_PROGRESS_SUFFIX, self._path)
+        self.completed_files.append(self._path)
+        logger.info(f"Completed lake chunk {self._path} ({self._chunk_records} records)")
+
+
+def message_parquet_schema():
+    """Fixed schema of the Parquet message lake: the scalar message fields plus the raw JSON."""
+    return pa.schema([
+        ('message_id', pa.int64()),
+        ('sender_id', pa.int64()),
+        ('sender_type', pa.string()),
+        ('date', pa.timestamp('us', tz='UTC')),
+        ('message_text', pa.string()),
+        ('views', pa.int64()),
+        ('forwards', pa.int64()),
+        ('replies', pa.int64()),
+        ('media_present', pa.bool_()),
+        ('media_type', pa.string()),
+        ('media_file_path', pa.string()),
+        ('media_status', pa.string()),
+        ('post_author', pa.string()),
+        ('grouped_id', pa.int64()),
+        ('is_channel_post', pa.bool_()),
+        ('channel_id', pa.int64()),
+        ('channel_name', pa.string()),
+        ('channel_title', pa.string()),
+        ('channel_username', pa.string()),
+        # Compact JSON text; the column is compressed like the rest of the file
+        ('raw_message_json', pa.string()),
+    ])
+
+
+class ParquetChunkWriter:
+    """Writes message records to rotating Parquet files with batched row groups.
+
+    Rows are buffered and written LAKE_PARQUET_ROW_GROUP_SIZE at a time. A Parquet
+    file is only readable once its footer is written, so `flush()` completes the
+    current file: with this format, raise SCRAPER_CHECKPOINT_BATCH_SIZE to get
+    fewer, larger files.
+    """
+
+    extension = '.parquet'
+
+    @staticmethod
+    def partition_directory(base_path, channel_name, partition_date):
+        # Hive-style partitions, understood by pyarrow.dataset, DuckDB, Spark, ...
+        return os.path.join(base_path, f"channel={channel_name}", f"date={partition_date}")
+
+    def __init__(self, directory, file_prefix, max_records=LAKE_CHUNK_MAX_RECORDS, max_bytes=LAKE_CHUNK_MAX_BYTES,
+                 row_group_size=LAKE_PARQUET_ROW_GROUP_SIZE, compression=LAKE_PARQUET_COMPRESSION):
+        if pa is None:
+            raise ImportError("LAKE_FORMAT=parquet requires pyarrow. Install it with `pip install pyarrow`.")
+        self.directory = directory
+        self.file_prefix = file_prefix
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schema = message_parquet_schema()
+        self.records_written = 0
+        self.completed_files = []
+        self._seq = 0
+        self._writer = None
+        self._path = None
+        self._rows = []
+        self._chunk_records = 0
+        self._chunk_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record):
+        row = {name: record.get(name) for name in self.schema.names}
+        row['date'] = datetime.fromisoformat(record['date']) if isinstance(record['date'], str) else record['date']
+        raw = record.get('raw_message_json')
+        if raw is not None and not isinstance(raw, str):
+            row['raw_message_json'] = json.dumps(raw, ensure_ascii=False, separators=(',', ':'), default=str)
+        self._rows.append(row)
+        self._chunk_records += 1
+        self._chunk_bytes += len(row['raw_message_json'] or '') + len(row['message_text'] or '')
+        self.records_written += 1
+        if len(self._rows) >= self.row_group_size:
+            self._write_row_group()
+        if self._chunk_records >= self.max_records or self._chunk_bytes >= self.max_bytes:
+            self._finish_chunk()
+
+    def flush(self):
+        """Completes the current file so everything written so far is durable and readable."""
+        if self._rows or self._writer is not None:
+            self._finish_chunk()
+
+    def close(self):
+        self.flush()
+
+    def _open_chunk(self):
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            self._seq += 1
+            final_path = os.path.join(self.directory, f"{self.file_prefix}_{self._seq:05d}{self.extension}")
+            if not os.path.exists(final_path) and not os.path.exists(final_path + IN_PROGRESS_SUFFIX):
+                break
+        self._path = final_path
+        self._writer = pq.ParquetWriter(final_path + IN_PROGRESS_SUFFIX, self.schema, compression=self.compression)
+
+    def _write_row_group(self):
+        if not self._rows:
+            return
+        if self._writer is None:
+            self._open_chunk()
+        table = pa.Table.from_pylist(self._rows, schema=self.schema)
+        self._writer.write_table(table, row_group_size=len(self._rows))
+        self._rows = []
+
+    def _finish_chunk(self):
+        self._write_row_group()
+        self._writer.close()
+        self._writer = None
+        with open(self._path + IN_PROGRESS_SUFFIX, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(self._path + IN_PROGRESS_SUFFIX, self._path)
+        self.completed_files.append(self._path)
+        logger.info(f"Completed lake chunk {self._path} ({self._chunk_records} records)")
+        self._chunk_records = 0
+        self._chunk_bytes = 0
+
+
+def get_lake_writer_class(lake_format=None):
+    """Returns the chunk writer class for the configured lake format."""
+    lake_format = (lake_format or LAKE_FORMAT).lower()
+    if lake_format == 'ndjson':
+        return NDJSONChunkWriter
+    if lake_format == 'parquet':
+        if pa is None:
+            raise ImportError("LAKE_FORMAT=parquet requires pyarrow. Install it with `pip install pyarrow`.")
+        return ParquetChunkWriter
+    raise ValueError(f"Unknown lake format '{lake_format}'. Use 'ndjson' or 'parquet'.")
+
+
+class PartitionedLakeSink:
+    """Streams one channel's records into per-date chunks under `base_path`.
+
+    The partition date is taken from each record's ISO `date` field. Messages are
+    scraped oldest first, so only the writer for the current date is kept open.
+    """
+
+    def __init__(self, base_path, channel_name, run_id, writer_class=NDJSONChunkWriter, **writer_options):
+        self.base_path = base_path
+        self.channel_name = channel_name
+        self.run_id = run_id
+        self.writer_class = writer_class
+        self.writer_options = writer_options
+        self.records_written = 0
+        self._closed_files = []
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def completed_files(self):
+        open_files = [path for writer in self._writers.values() for path in writer.completed_files]
+        return self._closed_files + open_files
+
+    def write(self, record):
+        partition_date = str(record['date'])[:10]
+        writer = self._writers.get(partition_date)
+        if writer is None:
+            # A new date means the previous one is finished
+            self._close_writers()
+            directory = self.writer_class.partition_directory(self.base_path, self.channel_name, partition_date)
+            writer = self.writer_class(directory, f"{self.channel_name}_{partition_date}_{self.run_id}",
+                                       **self.writer_options)
+            self._writers[partition_date] = writer
+        writer.write(record)
+        self.records_written += 1
+
+    def flush(self):
+        for writer in self._writers.values():
+            writer.flush()
+
+    def close(self):
+        self._close_writers()
+
+    def _close_writers(self):
+        for writer in self._writers.values():
+            writer.close()
+            self._closed_files.extend(writer.completed_files)
+        self._writers = {}
+
+
+def finalize_incomplete_chunks(base_path, channel_name):
+    """Completes chunks a crashed run left behind for `channel_name`.
+
+    Everything up to the last full line was flushed before the checkpoint moved,
+    so a torn trailing line is dropped and the rest of the NDJSON chunk is
+    published. Unfinished Parquet files have no footer and never hold
+    checkpointed rows, so they are removed. Returns the paths of the recovered chunks.
+    """
+    recovered = []
+    patterns = [
+        NDJSONChunkWriter.partition_directory(base_path, channel_name, '*'),
+        ParquetChunkWriter.partition_directory(base_path, channel_name, '*'),
+    ]
+    in_progress = [path for pattern in patterns for path in glob.glob(os.path.join(pattern, f"*{IN_PROGRESS_SUFFIX}"))]
+    for path in in_progress:
+        final_path = path[:-len(IN_PROGRESS_SUFFIX)]
+        if final_path.endswith(ParquetChunkWriter.extension):
+            os.remove(path)
+            logger.warning(f"Removed unfinished Parquet chunk {path}")
+            continue
+        with open(path, 'rb+') as f:
+            data = f.read()
+            keep = data.rfind(b'\n') + 1
+            if keep < len(data):
+                f.truncate(keep)
+        if keep == 0:
+            os.remove(path)
+            continue
+        os.replace(path, final_path)
+        recovered.append(final_path)
+        logger.warning(f"Recovered incomplete lake chunk {final_path}")
+    return recovered
+
+
+def iter_ndjson(path):
+    """Yields the records of an NDJSON chunk one at a time."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
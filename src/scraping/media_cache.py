@@ -0,0 +1,252 @@
+# src/scraping/media_cache.py
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+MEDIA_CACHE_ENABLED = os.getenv('MEDIA_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+MEDIA_CACHE_PATH = os.getenv(
+    'MEDIA_CACHE_PATH',
+    os.path.join(
+        os.getenv('SCRAPER_STATE_PATH', os.path.join(os.getenv('DATA_LAKE_PATH', '/app/data/raw'), '_state')),
+        'media_cache.sqlite'
+    )
+)
+# Least recently used entries beyond this many are evicted (per table). Evicting a
+# file entry only forgets it: the file stays on disk for the messages using it.
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv('MEDIA_CACHE_MAX_ENTRIES', 200000))
+# How often (in inserts) to check the size limit
+EVICTION_CHECK_EVERY = 100
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detection_key(content_hash, model=None):
+    """Key of an image's detections in `detection_cache`: the content hash, qualified by
+    the fingerprint of the model that produced them."""
+    return content_hash if model is None else f"{content_hash}:{model}"
+
+
+class MediaCache:
+    """Content-addressed index of downloaded images and their detections.
+
+    * `media_files`: one physical file per content hash.
+    * `media_aliases`: Telegram media IDs (e.g. 'photo:5123...') -> content hash, so
+      a repost of a photo we already have is not downloaded again.
+    * `detection_cache`: content hash and model fingerprint -> YOLO detections, so
+      every message that references the same image reuses one inference, and a
+      different model (backend, weights, input size) doesn't reuse another's.
+
+    Hits and misses are counted per kind ('download', 'content', 'detection')
+    and persisted, see `stats()`.
+    """
+
+    def __init__(self, path=MEDIA_CACHE_PATH, max_entries=MEDIA_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS media_files (
+                content_hash TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                file_size INTEGER,
+                last_used_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS media_files_path_idx ON media_files (file_path);
+            CREATE TABLE IF NOT EXISTS media_aliases (
+                media_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS detection_cache (
+                content_hash TEXT PRIMARY KEY,
+                detections TEXT NOT NULL,
+                last_used_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                kind TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, outcome)
+            );
+            """)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Files ---
+
+    def lookup_media(self, media_key):
+        """Returns the stored path for a Telegram media ID, or None (a download is needed)."""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT f.content_hash, f.file_path
+                FROM media_aliases a JOIN media_files f ON f.content_hash = a.content_hash
+                WHERE a.media_key = ?
+                """, (media_key,)).fetchone()
+            if row and not os.path.exists(row[1]):
+                # The file was removed from the lake; forget it
+                self._conn.execute("DELETE FROM media_files WHERE content_hash = ?", (row[0],))
+                row = None
+            if row:
+                self._touch('media_files', row[0])
+            self._count('download', 'hit' if row else 'miss')
+            self._conn.commit()
+            return row[1] if row else None
+
+    def store_file(self, file_path, media_key=None):
+        """Registers a freshly downloaded file and returns the path to keep.
+
+        If the same content is already stored elsewhere, the new copy is deleted
+        and the existing path is returned.
+        """
+        content_hash = hash_file(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_path FROM media_files WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            duplicate = row is not None and row[0] != file_path and os.path.exists(row[0])
+            if duplicate:
+                os.remove(file_path)
+                file_path = row[0]
+                self._touch('media_files', content_hash)
+            else:
+                self._conn.execute("""
+                    INSERT INTO media_files (content_hash, file_path, file_size, last_used_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (content_hash) DO UPDATE SET
+                        file_path = excluded.file_path,
+                        file_size = excluded.file_size,
+                        last_used_at = excluded.last_used_at
+                    """, (content_hash, file_path, os.path.getsize(file_path), datetime.now().isoformat()))
+                self._after_insert('media_files')
+            if media_key:
+                self._conn.execute("""
+                    INSERT INTO media_aliases (media_key, content_hash) VALUES (?, ?)
+                    ON CONFLICT (media_key) DO UPDATE SET content_hash = excluded.content_hash
+                    """, (media_key, content_hash))
+            self._count('content', 'hit' if duplicate else 'miss')
+            self._conn.commit()
+        if duplicate:
+            logger.info(f"Duplicate image content, reusing {file_path}")
+        return file_path
+
+    def hash_for_path(self, file_path):
+        """Content hash of a lake image, from the index when known."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM media_files WHERE file_path = ?", (file_path,)
+            ).fetchone()
+        return row[0] if row else hash_file(file_path)
+
+    # --- Detections ---
+
+    def get_detections(self, content_hash, model=None):
+        """Cached detections for an image, or None if `model` hasn't processed it yet."""
+        key = detection_key(content_hash, model)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT detections FROM detection_cache WHERE content_hash = ?", (key,)
+            ).fetchone()
+            if row:
+                self._touch('detection_cache', key)
+            self._count('detection', 'hit' if row else 'miss')
+            self._conn.commit()
+        return json.loads(row[0]) if row else None
+
+    def put_detections(self, content_hash, detections, model=None):
+        key = detection_key(content_hash, model)
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO detection_cache (content_hash, detections, last_used_at) VALUES (?, ?, ?)
+                ON CONFLICT (content_hash) DO UPDATE SET
+                    detections = excluded.detections,
+                    last_used_at = excluded.last_used_at
+                """, (key, json.dumps(detections), datetime.now().isoformat()))
+            self._after_insert('detection_cache')
+            self._conn.commit()
+
+    # --- Stats ---
+
+    def stats(self):
+        """Returns {kind: {'hits', 'misses', 'hit_rate'}} since the cache was created."""
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, outcome, count FROM cache_stats").fetchall()
+        stats = {}
+        for kind, outcome, count in rows:
+            stats.setdefault(kind, {'hits': 0, 'misses': 0})['hits' if outcome == 'hit' else 'misses'] = count
+        for counters in stats.values():
+            total = counters['hits'] + counters['misses']
+            counters['hit_rate'] = counters['hits'] / total if total else 0.0
+        return stats
+
+    def hit_rate(self, kind):
+        return self.stats().get(kind, {}).get('hit_rate', 0.0)
+
+    # --- Internals (called with the lock held) ---
+
+    def _count(self, kind, outcome):
+        self._conn.execute("""
+            INSERT INTO cache_stats (kind, outcome, count) VALUES (?, ?, 1)
+            ON CONFLICT (kind, outcome) DO UPDATE SET count = count + 1
+            """, (kind, outcome))
+
+    def _touch(self, table, content_hash):
+        self._conn.execute(
+            f"UPDATE {table} SET last_used_at = ? WHERE content_hash = ?",
+            (datetime.now().isoformat(), content_hash)
+        )
+
+    def _after_insert(self, table):
+        self._inserts += 1
+        if self._inserts % EVICTION_CHECK_EVERY == 0:
+            self._evict(table)
+
+    def _evict(self, table):
+        excess = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(f"""
+            DELETE FROM {table} WHERE content_hash IN (
+                SELECT content_hash FROM {table} ORDER BY last_used_at LIMIT ?
+            )
+            """, (excess,))
+        if table == 'media_files':
+            self._conn.execute(
+                "DELETE FROM media_aliases WHERE content_hash NOT IN (SELECT content_hash FROM media_files)"
+            )
+        logger.info(f"Evicted {excess} least recently used entries from {table}")
+
+
+def get_media_cache():
+    """Returns the configured cache, or None when MEDIA_CACHE_ENABLED is off."""
+    return MediaCache() if MEDIA_CACHE_ENABLED else None
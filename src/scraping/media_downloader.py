@@ -0,0 +1,124 @@
+# src/scraping/media_downloader.py
+
+import os
+import random
+import asyncio
+import logging
+
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger(__name__)
+
+# --- Download pool parameters ---
+MEDIA_DOWNLOAD_WORKERS = int(os.getenv('MEDIA_DOWNLOAD_WORKERS', 4))
+# Bounded queue: once this many downloads are waiting, message iteration blocks (backpressure)
+MEDIA_DOWNLOAD_QUEUE_SIZE = int(os.getenv('MEDIA_DOWNLOAD_QUEUE_SIZE', 64))
+MEDIA_DOWNLOAD_MAX_ATTEMPTS = int(os.getenv('MEDIA_DOWNLOAD_MAX_ATTEMPTS', 3))
+MEDIA_DOWNLOAD_BACKOFF_SECONDS = float(os.getenv('MEDIA_DOWNLOAD_BACKOFF_SECONDS', 2.0))
+
+
+class MediaDownloadPool:
+    """Bounded pool of asyncio workers that download message media in the background.
+
+    `download` is a coroutine function `download(message, channel_dir)` returning
+    `(file_path, media_type, extra)`, with `file_path` None when the media should
+    not be kept; `extra` is a dict of extra record fields (e.g. the stored image's
+    dimensions).
+    It may raise; failed attempts are retried with exponential backoff. Flood waits
+    are handed to the shared rate limiter, which pauses all requests, and retried
+    without additional backoff.
+
+    When a job finishes, its message record is updated in place
+    (`media_file_path`, `media_type`, `media_status`) and the future returned by
+    `submit()` resolves to that record.
+    """
+
+    def __init__(self, download, workers=MEDIA_DOWNLOAD_WORKERS, queue_size=MEDIA_DOWNLOAD_QUEUE_SIZE,
+                 max_attempts=MEDIA_DOWNLOAD_MAX_ATTEMPTS, backoff_seconds=MEDIA_DOWNLOAD_BACKOFF_SECONDS,
+                 rate_limiter=None):
+        self.download = download
+        self.worker_count = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = rate_limiter
+        self._queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._workers = []
+        self.downloaded_count = 0
+        self.failed_count = 0
+        self.retry_count = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+
+    async def submit(self, message, channel_dir, message_info):
+        """Queues the media of `message`; blocks while the queue is full."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        message_info['media_status'] = 'pending'
+        await self._queue.put((message, channel_dir, message_info, future))
+        return future
+
+    async def close(self):
+        """Waits for every queued download to finish and stops the workers."""
+        if not self._workers:
+            return
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self, worker_id):
+        while True:
+            message, channel_dir, message_info, future = await self._queue.get()
+            try:
+                await self._run_job(message, channel_dir, message_info)
+            finally:
+                if not future.done():
+                    future.set_result(message_info)
+                self._queue.task_done()
+
+    async def _run_job(self, message, channel_dir, message_info):
+        for attempt in range(1, self.max_attempts + 1):
+            message_info['media_attempts'] = attempt
+            try:
+                media_path, media_type, extra = await self.download(message, channel_dir)
+            except FloodWaitError as e:
+                logger.warning(f"FloodWaitError downloading media for message {message.id}: Must wait {e.seconds} seconds.")
+                if self.rate_limiter:
+                    self.rate_limiter.on_flood_wait(e.seconds)
+                else:
+                    await asyncio.sleep(e.seconds)
+                error = e
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self.backoff_seconds * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+                logger.warning(f"Attempt {attempt}/{self.max_attempts} to download media for message {message.id} in {channel_dir} failed: {e}")
+                error = e
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(delay)
+            else:
+                message_info['media_file_path'] = media_path
+                message_info['media_type'] = media_type
+                message_info['media_status'] = 'downloaded' if media_path else 'skipped'
+                message_info.update(extra)
+                if media_path:
+                    self.downloaded_count += 1
+                return
+
+            if attempt < self.max_attempts:
+                self.retry_count += 1
+
+        logger.error(f"Giving up on media for message {message.id} in channel {channel_dir}: {error}")
+        message_info['media_status'] = 'failed'
+        message_info['media_error'] = str(error)
+        self.failed_count += 1
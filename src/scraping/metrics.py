@@ -0,0 +1,274 @@
+# src/scraping/metrics.py
+"""Process-wide counters, gauges and histograms for the pipeline hot paths.
+
+Metrics live in memory in the process that records them. The API serves them
+in the Prometheus text format (GET /metrics); the batch scripts write a JSON
+snapshot on exit (METRICS_SNAPSHOT_PATH) that the Dagster ops attach to their
+output as metadata.
+
+    DOWNLOAD_SECONDS = histogram('media_download_seconds', 'Time to download one media file')
+    with DOWNLOAD_SECONDS.time():
+        ...
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Where the batch scripts write their snapshot on exit; unset disables it
+METRICS_SNAPSHOT_PATH = os.getenv('METRICS_SNAPSHOT_PATH')
+
+# Latency buckets in seconds, from sub-millisecond DB calls to multi-second flood waits
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """A value that only goes up (events, bytes, seconds spent)."""
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """A value that is set to the latest measurement (a rate, a queue depth)."""
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    """Observations (usually durations in seconds) counted into cumulative buckets."""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of a `with` block, including when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def state(self, **labels):
+        """{'count', 'sum', 'counts'} for one label set (counts per bucket, not cumulative)."""
+        state = self._values.get(self._key(labels))
+        return dict(state, counts=list(state['counts'])) if state else {'count': 0, 'sum': 0.0,
+                                                                        'counts': [0] * len(self.buckets)}
+
+    def quantile(self, q, **labels):
+        """Estimated quantile: the upper bound of the bucket holding the q-th observation."""
+        state = self.state(**labels)
+        if not state['count']:
+            return None
+        rank, seen = q * state['count'], 0
+        for bound, count in zip(self.buckets, state['counts']):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float('inf') else self.buckets[-2]
+        return self.buckets[-2]
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, dict(state, counts=list(state['counts']))) for key, state in self._values.items()]
+        for key, state in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((f'{self.name}_sum', labels, state['sum']))
+            samples.append((f'{self.name}_count', labels, state['count']))
+        return samples
+
+
+class Registry:
+    """The set of metrics of one process. Registering a name twice returns the existing metric."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {metric.type_name}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """A flat {"name{labels}": value} summary: counter and gauge values, and for
+        histograms the count, sum, mean and estimated p50/p99."""
+        snapshot = {}
+        for metric in self.metrics():
+            if isinstance(metric, Histogram):
+                for key in list(metric._values):
+                    labels = metric._labels(key)
+                    state = metric.state(**labels)
+                    suffix = _format_labels(labels)
+                    snapshot[f'{metric.name}_count{suffix}'] = state['count']
+                    snapshot[f'{metric.name}_sum{suffix}'] = round(state['sum'], 6)
+                    snapshot[f'{metric.name}_mean{suffix}'] = round(state['sum'] / state['count'], 6)
+                    snapshot[f'{metric.name}_p50{suffix}'] = metric.quantile(0.5, **labels)
+                    snapshot[f'{metric.name}_p99{suffix}'] = metric.quantile(0.99, **labels)
+            else:
+                for name, labels, value in metric.samples():
+                    snapshot[f'{name}{_format_labels(labels)}'] = value
+        return snapshot
+
+    def write_snapshot(self, path=None):
+        """Writes snapshot() as JSON to `path` (default METRICS_SNAPSHOT_PATH). No-op without a path."""
+        path = path or METRICS_SNAPSHOT_PATH
+        if not path:
+            return None
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+        return path
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+render = REGISTRY.render
+snapshot = REGISTRY.snapshot
+write_snapshot = REGISTRY.write_snapshot
+
+
+def read_snapshot(path):
+    """Loads a snapshot written by write_snapshot; {} if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# --- Pipeline metrics, shared so every process reports the same names ---
+
+TELEGRAM_REQUEST_SECONDS = histogram(
+    'telegram_request_seconds', 'Latency of Telegram API requests', ['method'])
+TELEGRAM_FLOOD_WAITS = counter(
+    'telegram_flood_waits_total', 'FloodWaitErrors returned by Telegram', ['channel'])
+TELEGRAM_FLOOD_WAIT_SECONDS = counter(
+    'telegram_flood_wait_seconds_total', 'Seconds Telegram asked us to wait', ['channel'])
+SCRAPER_MESSAGES = counter(
+    'scraper_messages_total', 'Messages scraped', ['channel'])
+SCRAPER_MESSAGES_PER_SECOND = gauge(
+    'scraper_messages_per_second', 'Message rate of the last scrape of a channel', ['channel'])
+MEDIA_DOWNLOAD_SECONDS = histogram(
+    'media_download_seconds', 'Time to download one media file from Telegram')
+MEDIA_DOWNLOAD_BYTES = histogram(
+    'media_download_bytes', 'Size of downloaded media files', buckets=BYTES_BUCKETS)
+DETECTION_BATCH_SECONDS = histogram(
+    'detection_batch_seconds', 'YOLO inference time per batch (or per shard of batches)', ['stage'])
+DETECTION_IMAGES = counter(
+    'detection_images_total', 'Images run through the detector')
+DETECTION_JOBS = counter(
+    'detection_jobs_total', 'Detection jobs claimed and finished, by outcome', ['outcome'])
+DB_WRITE_SECONDS = histogram(
+    'db_write_seconds', 'Latency of pipeline database writes', ['operation'])
+DB_ROWS_WRITTEN = counter(
+    'db_rows_written_total', 'Rows written by the pipeline', ['operation'])
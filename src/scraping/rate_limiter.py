@@ -0,0 +1,94 @@
+# src/scraping/rate_limiter.py
+
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- Global Telegram request budget ---
+# Every API call made by the scraper (entity lookups, history pages, media downloads)
+# takes one token from a single shared bucket, however many channels run at once.
+TELEGRAM_REQUESTS_PER_SECOND = float(os.getenv('TELEGRAM_REQUESTS_PER_SECOND', 1.0))
+TELEGRAM_MIN_REQUESTS_PER_SECOND = float(os.getenv('TELEGRAM_MIN_REQUESTS_PER_SECOND', 0.05))
+TELEGRAM_REQUEST_BURST = int(os.getenv('TELEGRAM_REQUEST_BURST', 5))
+# After a FloodWaitError the rate is multiplied by this factor...
+FLOOD_WAIT_RATE_FACTOR = float(os.getenv('TELEGRAM_FLOOD_WAIT_RATE_FACTOR', 0.5))
+# ...and it only creeps back up (by RATE_RECOVERY_FACTOR) after this many quiet seconds.
+RATE_RECOVERY_INTERVAL_SECONDS = float(os.getenv('TELEGRAM_RATE_RECOVERY_INTERVAL_SECONDS', 60))
+RATE_RECOVERY_FACTOR = float(os.getenv('TELEGRAM_RATE_RECOVERY_FACTOR', 1.2))
+
+
+class TokenBucket:
+    """Asyncio token bucket that adapts its refill rate to Telegram flood waits.
+
+    Waiters are served in FIFO order. A flood wait pauses the whole bucket for the
+    number of seconds Telegram asked for and cuts the refill rate, which then
+    recovers gradually while no further flood waits are reported.
+    """
+
+    def __init__(self, rate=TELEGRAM_REQUESTS_PER_SECOND, capacity=TELEGRAM_REQUEST_BURST,
+                 min_rate=TELEGRAM_MIN_REQUESTS_PER_SECOND, flood_rate_factor=FLOOD_WAIT_RATE_FACTOR,
+                 recovery_interval=RATE_RECOVERY_INTERVAL_SECONDS, recovery_factor=RATE_RECOVERY_FACTOR,
+                 clock=time.monotonic):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min(min_rate, rate)
+        self.flood_rate_factor = flood_rate_factor
+        self.recovery_interval = recovery_interval
+        self.recovery_factor = recovery_factor
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._last_refill = clock()
+        self._last_rate_change = self._last_refill
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.flood_wait_count = 0
+        self.flood_wait_seconds = 0.0
+
+    def _refill(self, now):
+        if now - self._last_rate_change >= self.recovery_interval and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate * self.recovery_factor)
+            self._last_rate_change = now
+        if now <= self._last_refill:
+            return  # still inside a flood-wait pause, nothing accrues
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def delay_for(self, tokens=1):
+        """Returns how long a caller would currently wait for `tokens` (0 if available now)."""
+        now = self._clock()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= tokens:
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens=1):
+        """Waits until `tokens` requests may be sent and takes them from the bucket."""
+        async with self._lock:
+            while True:
+                delay = self.delay_for(tokens)
+                if delay <= 0:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep(delay)
+
+    def on_flood_wait(self, seconds):
+        """Pauses the bucket for `seconds` and lowers the refill rate."""
+        now = self._clock()
+        self._refill(now)
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._last_refill = max(self._last_refill, self._paused_until)
+        self.rate = max(self.min_rate, self.rate * self.flood_rate_factor)
+        self._last_rate_change = self._paused_until
+        self.flood_wait_count += 1
+        self.flood_wait_seconds += seconds
+        logger.warning(f"Flood wait of {seconds}s reported. Pausing all Telegram requests and lowering rate to {self.rate:.3f} req/s.")
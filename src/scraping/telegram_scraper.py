@@ -1,24 +1,48 @@
 # src/scraping/telegram_scraper.py
 
 import os
+import sys
 import asyncio
-import json
-from datetime import datetime
+import fcntl
+from datetime import datetime, timedelta
 import logging
 import re # For cleaning channel names
 import random # For introducing random delays
+import time
+from collections import deque
+from functools import partial
 
 from telethon.sync import TelegramClient
+from telethon.sessions import StringSession
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 from telethon.errors import SessionPasswordNeededError, FloodWaitError, PhoneNumberBannedError
 from dotenv import load_dotenv
 
+try:
+    from PIL import Image
+except ImportError:  # Optional: only needed to resize images and record their dimensions
+    Image = None
+
+from checkpoint_store import SCRAPER_STATE_PATH, get_checkpoint_store
+from rate_limiter import TokenBucket
+from media_downloader import MediaDownloadPool
+from lake_writer import PartitionedLakeSink, finalize_incomplete_chunks, get_lake_writer_class
+from media_cache import get_media_cache
+
+# Run as a script, only src/scraping is on sys.path. metrics is imported package-qualified,
+# like everywhere else, so a process has one registry whichever modules it loads.
+_SRC_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _SRC_PATH not in sys.path:
+    sys.path.append(_SRC_PATH)
+from scraping import metrics
+
 # --- Configuration and Setup ---
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure logging
+os.makedirs("logs", exist_ok=True)
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                     handlers=[
@@ -33,34 +57,52 @@ API_HASH = os.getenv('TELEGRAM_API_HASH')
 # Ensure SESSION_NAME is unique and ideally tied to the user/account
 # This ensures separate session files if you ever use multiple accounts
 SESSION_NAME = os.getenv('TELEGRAM_SESSION_NAME', 'telegram_session')
+# An exported StringSession. Unlike the SQLite session file, it can be used by several
+# processes at once (e.g. Dagster partitions of different channels scraping in parallel).
+SESSION_STRING = os.getenv('TELEGRAM_SESSION_STRING')
 
 # Data lake paths (inside the Docker container)
 DATA_LAKE_BASE_PATH = os.getenv('DATA_LAKE_PATH', '/app/data/raw')
 RAW_MESSAGES_PATH = os.path.join(DATA_LAKE_BASE_PATH, 'telegram_messages')
 RAW_IMAGES_PATH = os.path.join(DATA_LAKE_BASE_PATH, 'telegram_images')
+# Media download outcomes (path/status per message), written once a batch's downloads finish
+RAW_MEDIA_RESULTS_PATH = os.path.join(DATA_LAKE_BASE_PATH, 'telegram_media')
 
 # Ensure directories exist
 # These should ideally be mounted volumes in Docker for persistence
-os.makedirs("logs", exist_ok=True)
 os.makedirs(RAW_MESSAGES_PATH, exist_ok=True)
 os.makedirs(RAW_IMAGES_PATH, exist_ok=True)
-
-# List of public Telegram channels to scrape
-TELEGRAM_CHANNELS = [
-    'https://t.me/chemed_chem',
-    'https://t.me/lobelia4cosmetics',
-    'https://t.me/tikvahpharma',
-    # Add more channels from https://et.tgstat.com/medicine as needed
-]
+os.makedirs(RAW_MEDIA_RESULTS_PATH, exist_ok=True)
+
+# List of public Telegram channels to scrape (comma-separated handles; the Dagster
+# assets are partitioned by the same list)
+# Add more channels from https://et.tgstat.com/medicine as needed
+TELEGRAM_CHANNEL_HANDLES = os.getenv('TELEGRAM_CHANNELS', 'chemed_chem,lobelia4cosmetics,tikvahpharma').split(',')
+TELEGRAM_CHANNELS = [f'https://t.me/{handle.strip()}' for handle in TELEGRAM_CHANNEL_HANDLES]
+
+# --- Media ingest ---
+# How photos are stored:
+#   original  full resolution, as today
+#   thumb     the smallest size Telegram has of the photo that still covers MEDIA_TARGET_SIZE
+#             (other images are downloaded in full and resized)
+#   resize    full resolution, shrunk to MEDIA_TARGET_SIZE on a worker thread right after download
+# The detector works at 640 px (YOLO_IMAGE_SIZE), so larger pixels are wasted bandwidth, disk and decode time.
+MEDIA_INGEST_MODE = os.getenv('MEDIA_INGEST_MODE', 'original')
+MEDIA_TARGET_SIZE = int(os.getenv('MEDIA_TARGET_SIZE', 640))  # Longest side in pixels
+MEDIA_KEEP_ORIGINAL = os.getenv('MEDIA_KEEP_ORIGINAL', 'false').lower() in ('1', 'true', 'yes')  # As <name>.orig<ext>
+MEDIA_JPEG_QUALITY = int(os.getenv('MEDIA_JPEG_QUALITY', 85))
 
 # --- Policy-Friendly Parameters ---
 # These values are crucial for avoiding bans. Adjust based on observation.
-MIN_CHANNEL_DELAY_SECONDS = 10  # Minimum delay between scraping different channels
-MAX_CHANNEL_DELAY_SECONDS = 30  # Maximum delay between scraping different channels
-MESSAGE_BATCH_SIZE = 100        # How many messages to fetch in one iteration
-MIN_MESSAGE_DELAY_SECONDS = 0.5 # Minimum delay after processing a message batch
-MAX_MESSAGE_DELAY_SECONDS = 2   # Maximum delay after processing a message batch
-DOWNLOAD_MEDIA_DELAY_SECONDS = 0.5 # Delay after each media download
+# Pacing is done by one shared token bucket (see rate_limiter.py) instead of fixed
+# per-message/per-channel sleeps: every Telegram request costs one token, so the
+# total request rate stays the same no matter how many channels run concurrently.
+SCRAPER_CONCURRENCY = int(os.getenv('SCRAPER_CONCURRENCY', 3))  # Channels scraped at the same time
+MAX_CHANNEL_ATTEMPTS = int(os.getenv('SCRAPER_MAX_CHANNEL_ATTEMPTS', 3))  # Retries of a channel after a flood wait
+MESSAGE_BATCH_SIZE = 100        # Messages per history request (Telethon's page size)
+# How many messages are written between fsyncs of the lake chunks. The per-channel
+# checkpoint only advances after a flush, so this is also the most work a crash can lose.
+CHECKPOINT_BATCH_SIZE = int(os.getenv('SCRAPER_CHECKPOINT_BATCH_SIZE', 500))
 
 # --- Helper Functions ---
 
@@ -70,10 +112,30 @@ def clean_channel_name(channel_entity_title):
     cleaned_name = re.sub(r'[^\w\s-]', '', channel_entity_title).replace(' ', '_').lower()
     return cleaned_name if cleaned_name else "unknown_channel"
 
-async def download_media(client, message, channel_dir):
-    """Downloads media (photos, documents) from a message."""
+def telegram_media_key(media):
+    """Stable Telegram ID of a message's photo or document, e.g. 'photo:5123...'."""
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        return f"photo:{media.photo.id}"
+    if isinstance(media, MessageMediaDocument) and media.document:
+        return f"document:{media.document.id}"
+    return None
+
+async def download_media(client, message, channel_dir, rate_limiter=None, media_cache=None):
+    """Downloads media (photos, documents) from a message.
+
+    Returns `(path, media_type, extra)`, with `(None, None, {})` for media we don't
+    keep. Download errors are raised so the caller (the media download pool) can retry them.
+
+    With a `media_cache`, media already seen under the same Telegram ID is not
+    downloaded again, and a download whose content matches a stored file is
+    replaced by that file, so each distinct image is kept once.
+
+    MEDIA_INGEST_MODE picks a reduced photo size or resizes after download.
+    `extra` holds the stored image's dimensions,
+    `{'media_width': ..., 'media_height': ...}`, or is empty when nothing was stored.
+    """
     if not message.media:
-        return None, None
+        return None, None, {}
 
     media_type = None
     if isinstance(message.media, MessageMediaPhoto):
@@ -81,7 +143,7 @@ async def download_media(client, message, channel_dir):
     elif isinstance(message.media, MessageMediaDocument) and message.media.document.mime_type and message.media.document.mime_type.startswith('image/'):
         media_type = 'document_image'
     else:
-        return None, None # Not an image we want to download
+        return None, None, {} # Not an image we want to download
 
     file_extension = ''
     if media_type == 'photo':
@@ -100,65 +162,260 @@ async def download_media(client, message, channel_dir):
     if not file_extension: # Ensure there's always an extension
         file_extension = '.bin' # Fallback for unknown image types
 
-    try:
-        # Ensure the image directory exists
-        image_dir_path = os.path.join(RAW_IMAGES_PATH, channel_dir)
-        os.makedirs(image_dir_path, exist_ok=True)
+    media_key = telegram_media_key(message.media)
+    if media_key and MEDIA_INGEST_MODE != 'original':
+        # A reduced variant is a different file than the original of the same media
+        media_key = f"{media_key}@{MEDIA_INGEST_MODE}{MEDIA_TARGET_SIZE}"
+    if media_cache and media_key:
+        cached_path = media_cache.lookup_media(media_key)
+        if cached_path:
+            logger.info(f"Media {message.id} already downloaded as {cached_path}")
+            width, height = await asyncio.to_thread(image_dimensions, cached_path)
+            return cached_path, media_type, {'media_width': width, 'media_height': height}
+
+    thumb = None
+    if MEDIA_INGEST_MODE == 'thumb' and media_type == 'photo':
+        thumb = select_photo_size(message.media.photo)
+
+    # Ensure the image directory exists
+    image_dir_path = os.path.join(RAW_IMAGES_PATH, channel_dir)
+    os.makedirs(image_dir_path, exist_ok=True)
+
+    # Construct unique file path
+    # Use message ID and date for uniqueness. Avoid too long names.
+    file_name = f"{message.id}_{message.date.strftime('%Y%m%d%H%M%S')}{file_extension}"
+    file_path = os.path.join(image_dir_path, file_name)
+
+    # Download the media
+    if rate_limiter:
+        await rate_limiter.acquire()
+    logger.info(f"Downloading media {message.id} to {file_path}")
+    with metrics.MEDIA_DOWNLOAD_SECONDS.time():
+        downloaded_path = await client.download_media(message, file=file_path, thumb=thumb)
+    logger.info(f"Downloaded media to: {downloaded_path}")
+    if not downloaded_path:
+        return None, media_type, {}
+    metrics.MEDIA_DOWNLOAD_BYTES.observe(os.path.getsize(downloaded_path))
+
+    # Resize before caching, so the deduplicated copy is the stored variant
+    if MEDIA_INGEST_MODE == 'resize' or (MEDIA_INGEST_MODE == 'thumb' and thumb is None):
+        width, height = await asyncio.to_thread(normalize_image, downloaded_path)
+    else:
+        width, height = await asyncio.to_thread(image_dimensions, downloaded_path)
 
-        # Construct unique file path
-        # Use message ID and date for uniqueness. Avoid too long names.
-        file_name = f"{message.id}_{message.date.strftime('%Y%m%d%H%M%S')}{file_extension}"
-        file_path = os.path.join(image_dir_path, file_name)
+    if media_cache:
+        downloaded_path = await asyncio.to_thread(media_cache.store_file, downloaded_path, media_key)
 
-        # Download the media
-        logger.info(f"Downloading media {message.id} to {file_path}")
-        downloaded_path = await client.download_media(message, file=file_path)
-        logger.info(f"Downloaded media to: {downloaded_path}")
+    return downloaded_path, media_type, {'media_width': width, 'media_height': height}
 
-        # Introduce a small delay after each media download
-        await asyncio.sleep(DOWNLOAD_MEDIA_DELAY_SECONDS)
+def select_photo_size(photo, target_size=MEDIA_TARGET_SIZE):
+    """The smallest of a photo's sizes whose longest side covers `target_size` (else the largest).
 
-        return downloaded_path, media_type
-    except FloodWaitError as e:
-        logger.warning(f"FloodWaitError during media download for message {message.id}: Must wait {e.seconds} seconds. Waiting...")
-        await asyncio.sleep(e.seconds + random.uniform(2, 5)) # Add buffer to wait
-        return None, None # Don't retry this specific download, let next run handle it
-    except Exception as e:
-        logger.error(f"Error downloading media for message {message.id} in channel {channel_dir}: {e}", exc_info=True)
+    Returns None when the photo lists no sizes with dimensions (e.g. only a stripped preview).
+    """
+    sizes = [size for size in getattr(photo, 'sizes', None) or []
+             if getattr(size, 'w', None) and getattr(size, 'h', None)]
+    if not sizes:
+        return None
+    sizes.sort(key=lambda size: max(size.w, size.h))
+    return next((size for size in sizes if max(size.w, size.h) >= target_size), sizes[-1])
+
+def image_dimensions(path):
+    """(width, height) from the image header, or (None, None) if it can't be read."""
+    if Image is None:
+        return None, None
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
         return None, None
 
-async def scrape_channel(client, channel_url):
-    """Scrapes messages and media from a single Telegram channel."""
+def normalize_image(path, target_size=MEDIA_TARGET_SIZE, keep_original=MEDIA_KEEP_ORIGINAL):
+    """Shrinks the image at `path` in place so its longest side is at most `target_size`.
+
+    JPEG, PNG and WebP are re-encoded in their own format; anything else (e.g.
+    animated GIFs) and images that are already small enough are left as they are.
+    Returns the stored (width, height). Blocking: run it on a worker thread.
+    """
+    if Image is None:
+        return None, None
+    with Image.open(path) as original:
+        image_format = original.format
+        if max(original.size) <= target_size or image_format not in ('JPEG', 'PNG', 'WEBP'):
+            return original.size
+        if image_format == 'JPEG':
+            # Let libjpeg decode at a reduced scale instead of the full resolution. draft() only
+            # scales down while both sides stay >= the requested box, so ask for the fitted size.
+            scale = target_size / max(original.size)
+            original.draft('RGB', (round(original.width * scale), round(original.height * scale)))
+            image = original.convert('RGB')
+        else:
+            image = original.convert('RGBA') if original.mode == 'P' else original.copy()
+    image.thumbnail((target_size, target_size))
+
+    if keep_original:
+        root, ext = os.path.splitext(path)
+        os.replace(path, f"{root}.orig{ext}")
+    tmp_path = f"{path}.tmp"
+    save_options = {'quality': MEDIA_JPEG_QUALITY} if image_format in ('JPEG', 'WEBP') else {}
+    image.save(tmp_path, image_format, **save_options)
+    os.replace(tmp_path, path)
+    return image.size
+
+def build_media_record(message_info):
+    """Small record that tracks one message's media download; also written to RAW_MEDIA_RESULTS_PATH."""
+    return {
+        'message_id': message_info['message_id'],
+        'channel_id': message_info['channel_id'],
+        'date': message_info['date'],
+        'media_type': None,
+        'media_file_path': None,
+        'media_status': None,
+        'media_width': None,
+        'media_height': None,
+    }
+
+async def acquire_channel_lock(channel_name, lock_path=os.path.join(SCRAPER_STATE_PATH, 'locks')):
+    """Takes the exclusive lock on a channel's lake files; close the returned file to release it.
+
+    A run writes the channel's chunks and recovers every incomplete chunk of the
+    channel, so two runs of one channel (e.g. yesterday's and today's partitions
+    started together) must not overlap: one would publish the other's open chunks.
+    """
+    os.makedirs(lock_path, exist_ok=True)
+    lock_file = open(os.path.join(lock_path, f"{channel_name}.lock"), 'w')
     try:
-        entity = await client.get_entity(channel_url)
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        logger.info(f"Another run is scraping '{channel_name}', waiting for it to finish")
+        try:
+            await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        except BaseException:
+            lock_file.close()
+            raise
+    return lock_file
+
+async def scrape_channel(client, channel_url, checkpoint_store=None, rate_limiter=None, media_pool=None,
+                         media_cache=None, date_range=None):
+    """Scrapes new messages and media from a single Telegram channel.
+
+    When a `checkpoint_store` is given, only messages newer than the stored
+    high-water mark are fetched and the mark is advanced after each saved batch.
+    All Telegram requests are paced by `rate_limiter`, which should be shared by
+    every channel scraped with the same account.
+
+    Messages are streamed to NDJSON (or, with LAKE_FORMAT=parquet, Parquet)
+    chunks under RAW_MESSAGES_PATH as they are read, so memory use doesn't grow
+    with the size of the channel. Media is downloaded in the background by
+    `media_pool`; the outcome of each batch's downloads is written to
+    RAW_MEDIA_RESULTS_PATH once they finish, and only then does the checkpoint
+    move past that batch. Pass a `media_cache` to skip duplicate images.
+
+    `date_range` = (start, end) limits the scrape to messages posted in
+    [start, end) (timezone-aware datetimes), e.g. one day for a partitioned
+    backfill. A windowed scrape keeps its own high-water mark per window (the
+    channel's mark only makes sense for a scrape that reaches the newest message),
+    so running the same window again only fetches what was posted since.
+    """
+    if rate_limiter is None:
+        rate_limiter = TokenBucket()
+    owns_media_pool = media_pool is None
+    if owns_media_pool:
+        media_pool = MediaDownloadPool(partial(download_media, client, rate_limiter=rate_limiter,
+                                               media_cache=media_cache),
+                                       rate_limiter=rate_limiter)
+
+    channel_lock = None
+    try:
+        await rate_limiter.acquire()
+        with metrics.TELEGRAM_REQUEST_SECONDS.time(method='get_entity'):
+            entity = await client.get_entity(channel_url)
         channel_name = clean_channel_name(entity.title)
         logger.info(f"Scraping channel: {entity.title} (ID: {entity.id})")
+        channel_lock = await acquire_channel_lock(channel_name)
+
+        # Publish whatever a crashed run of this channel had already flushed
+        finalize_incomplete_chunks(RAW_MESSAGES_PATH, channel_name)
+        finalize_incomplete_chunks(RAW_MEDIA_RESULTS_PATH, channel_name)
+
+        window_start, window_end = date_range if date_range else (None, None)
+        channel_key = str(entity.id) if window_start is None else f"{entity.id}:{window_start.isoformat()}"
+        run_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        # Messages use the configured LAKE_FORMAT; the small media outcome records are always NDJSON
+        message_sink = PartitionedLakeSink(RAW_MESSAGES_PATH, channel_name, run_id,
+                                           writer_class=get_lake_writer_class())
+        media_sink = PartitionedLakeSink(RAW_MEDIA_RESULTS_PATH, channel_name, run_id)
+        media_records = []
+        media_futures = []
+        # Flushed batches whose media is still downloading, oldest first:
+        # (last_message_id, media_records, media_futures)
+        pending_batches = deque()
+        batch_message_count = 0
+        last_message_id = None
+        images_downloaded_count = 0
+
+        def commit_finished_batches(wait_for_all=False):
+            # Batches are committed strictly in order so the checkpoint never
+            # skips over a batch whose images are still in flight.
+            nonlocal images_downloaded_count
+            while pending_batches:
+                batch_last_id, records, futures = pending_batches[0]
+                if not wait_for_all and not all(future.done() for future in futures):
+                    return
+                pending_batches.popleft()
+                for record in records:
+                    media_sink.write(record)
+                    if record['media_status'] == 'downloaded':
+                        images_downloaded_count += 1
+                media_sink.flush()
+                if checkpoint_store:
+                    checkpoint_store.set(channel_key, batch_last_id, channel_url=channel_url, channel_title=entity.title)
+
+        def flush_batch():
+            nonlocal media_records, media_futures, batch_message_count
+            message_sink.flush()
+            pending_batches.append((last_message_id, media_records, media_futures))
+            media_records, media_futures, batch_message_count = [], [], 0
+            commit_finished_batches()
+
+        # Incremental scraping: resume right after the last message ID that was
+        # durably saved for this channel. Messages are iterated oldest -> newest
+        # (`reverse=True`) so the high-water mark can advance after every flushed
+        # batch and a crashed run picks up mid-channel instead of starting over.
+        last_scraped_message_id = checkpoint_store.get(channel_key) if checkpoint_store else 0
+        if last_scraped_message_id:
+            logger.info(f"Resuming '{entity.title}' after message ID {last_scraped_message_id}.")
+        # With reverse=True, offset_date skips everything posted before it. It is exclusive,
+        # so start a second early and drop what falls before the window. When resuming,
+        # min_id (a message inside the window) already skips everything before it.
+        offset_date = window_start - timedelta(seconds=1) if window_start and not last_scraped_message_id else None
 
-        messages_data = []
-        downloaded_images = []
-        
-        # Implement incremental scraping by storing the last scraped message ID
-        # This prevents re-scraping old messages unnecessarily and reduces API calls
-        # For simplicity, we'll use a placeholder. In a real scenario, you might
-        # load this from a small database or a file.
-        last_scraped_message_id = 0 # Placeholder for initial run.
-
-        # Fetch messages in batches to avoid large single requests
-        # and allow for delays between batches.
-        # This will fetch messages newer than last_scraped_message_id
-        # Set `limit` to MESSAGE_BATCH_SIZE
-        # You might want to iterate until `offset_id` is 0 or no more messages are returned
-        # For a full scrape, remove `offset_id` and iterate. For incremental, use `min_id`.
-        
-        # For a more robust incremental scrape, you would store `message.id`
-        # and pass it as `min_id` in subsequent runs.
-        # Example: messages = client.iter_messages(entity, min_id=last_scraped_message_id, limit=MESSAGE_BATCH_SIZE)
-
-        # Iterating without a 'limit' (or with limit=None) fetches all.
-        # For initial full scrape, this is fine. For subsequent, use min_id.
         messages_fetched_count = 0
-        
-        async for message in client.iter_messages(entity, min_id=last_scraped_message_id):
+        messages_seen = 0  # Every message Telegram returned, including skipped ones
+        scrape_started = time.perf_counter()
+
+        # Telethon requests history pages lazily while we iterate, so taking a
+        # token before the first page and after every MESSAGE_BATCH_SIZE messages
+        # paces each GetHistoryRequest. wait_time=0 turns off Telethon's own sleeps.
+        # Pages are counted by messages seen, not kept: pre-window messages that
+        # are skipped still cost a request.
+        await rate_limiter.acquire()
+        page_requested = time.perf_counter()
+        async for message in client.iter_messages(entity, min_id=last_scraped_message_id, reverse=True,
+                                                  offset_date=offset_date, wait_time=0):
+            if messages_seen % MESSAGE_BATCH_SIZE == 0:
+                # First message of a page: the wait for it was the GetHistoryRequest
+                metrics.TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - page_requested, method='get_history')
+            messages_seen += 1
+            # The next message starts a new history page: wait for the request budget
+            page_done = messages_seen % MESSAGE_BATCH_SIZE == 0
+            if window_start is not None and message.date < window_start:
+                if page_done:
+                    await rate_limiter.acquire()
+                    page_requested = time.perf_counter()
+                continue
+            if window_end is not None and message.date >= window_end:
+                break
             message_info = {
                 'message_id': message.id,
                 'sender_id': message.sender_id,
@@ -171,72 +428,84 @@ async def scrape_channel(client, channel_url):
                 'media_present': bool(message.media),
                 'media_type': None,
                 'media_file_path': None,
+                'media_status': None,
                 'post_author': message.post_author,
                 'grouped_id': message.grouped_id,
                 'is_channel_post': message.post,
                 'channel_id': entity.id,
+                'channel_name': channel_name,
                 'channel_title': entity.title,
                 'channel_username': entity.username,
                 'raw_message_json': message.to_dict() # Store the full raw message for schema flexibility
             }
 
             if message.media:
-                media_path, media_type = await download_media(client, message, channel_name)
-                message_info['media_file_path'] = media_path
-                message_info['media_type'] = media_type
-                if media_path:
-                    downloaded_images.append({
-                        'message_id': message.id,
-                        'channel_id': entity.id,
-                        'file_path': media_path,
-                        'media_type': media_type
-                    })
-            
-            messages_data.append(message_info)
+                # Queue the download and keep iterating; blocks only when the pool's queue is full.
+                # The pool fills in the small media record, not the full message.
+                media_record = build_media_record(message_info)
+                media_futures.append(await media_pool.submit(message, channel_name, media_record))
+                media_records.append(media_record)
+                message_info.update({key: media_record[key] for key in ('media_type', 'media_file_path', 'media_status')})
+
+            # Stream the record straight to the lake; nothing is kept in memory
+            message_sink.write(message_info)
+            last_message_id = message.id
             messages_fetched_count += 1
-
-            # Introduce small, random delay after processing each message
-            # This helps simulate human-like behavior
-            await asyncio.sleep(random.uniform(0.1, 0.5))
-
-            # Introduce delay after a batch of messages
-            if messages_fetched_count % MESSAGE_BATCH_SIZE == 0:
-                delay = random.uniform(MIN_MESSAGE_DELAY_SECONDS, MAX_MESSAGE_DELAY_SECONDS)
-                logger.info(f"Processed {messages_fetched_count} messages. Waiting for {delay:.2f} seconds before next batch.")
-                await asyncio.sleep(delay)
-
-        # Save messages to data lake
-        if messages_data:
-            today_str = datetime.now().strftime('%Y-%m-%d')
-            channel_messages_dir = os.path.join(RAW_MESSAGES_PATH, today_str, channel_name)
-            os.makedirs(channel_messages_dir, exist_ok=True)
-
-            output_file = os.path.join(channel_messages_dir, f"{channel_name}_{today_str}_{datetime.now().strftime('%H%M%S')}.json")
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(messages_data, f, ensure_ascii=False, indent=4)
-            logger.info(f"Saved {len(messages_data)} messages from '{entity.title}' to {output_file}")
+            batch_message_count += 1
+
+            # Make the batch durable and move the checkpoint forward
+            if batch_message_count >= CHECKPOINT_BATCH_SIZE:
+                flush_batch()
+
+            if page_done:
+                logger.info(f"Processed {messages_fetched_count} messages from '{entity.title}'.")
+                await rate_limiter.acquire()
+                page_requested = time.perf_counter()
+
+        if batch_message_count:
+            flush_batch()
+        # Completes the message chunks: the channel's text is loadable from here on
+        message_sink.close()
+        metrics.SCRAPER_MESSAGES.inc(messages_fetched_count, channel=channel_name)
+        scrape_seconds = time.perf_counter() - scrape_started
+        if messages_fetched_count and scrape_seconds > 0:
+            metrics.SCRAPER_MESSAGES_PER_SECOND.set(messages_fetched_count / scrape_seconds, channel=channel_name)
+
+        if messages_fetched_count:
+            logger.info(f"Saved {messages_fetched_count} messages from '{entity.title}' to {len(message_sink.completed_files)} lake chunk(s). Waiting for media downloads...")
         else:
             logger.info(f"No new messages found or scraped for '{entity.title}'.")
 
+        # Wait for the outstanding downloads and commit their batches
+        outstanding_futures = [future for batch in pending_batches for future in batch[2]]
+        if outstanding_futures:
+            await asyncio.gather(*outstanding_futures)
+        commit_finished_batches(wait_for_all=True)
+        media_sink.close()
+
         return {
             'channel_url': channel_url,
             'channel_id': entity.id,
             'channel_title': entity.title,
-            'messages_count': len(messages_data),
-            'images_downloaded_count': len(downloaded_images),
+            'channel_name': channel_name,
+            'messages_count': messages_fetched_count,
+            'images_downloaded_count': images_downloaded_count,
             'status': 'success'
         }
 
     except FloodWaitError as e:
-        # Increase the wait time slightly beyond Telegram's request
-        wait_time = e.seconds + random.uniform(5, 15) # Add a random buffer
-        logger.warning(f"FloodWaitError for {channel_url}: Must wait {e.seconds} seconds. Actual wait: {wait_time:.2f} seconds. Skipping for now.")
-        await asyncio.sleep(wait_time) # Ensure the client waits here
+        # Don't sleep here: the shared limiter pauses every channel for the requested
+        # time and lowers the request rate. The caller may retry the channel, which
+        # resumes from the last checkpoint.
+        logger.warning(f"FloodWaitError for {channel_url}: Must wait {e.seconds} seconds.")
+        metrics.TELEGRAM_FLOOD_WAITS.inc(channel=channel_url)
+        metrics.TELEGRAM_FLOOD_WAIT_SECONDS.inc(e.seconds, channel=channel_url)
+        rate_limiter.on_flood_wait(e.seconds)
         return {
             'channel_url': channel_url,
             'status': 'flood_wait',
             'error': str(e),
-            'wait_seconds': wait_time
+            'wait_seconds': e.seconds
         }
     except SessionPasswordNeededError:
         logger.error("Session password needed. Please ensure you are logged in correctly if this is a private channel.")
@@ -256,6 +525,71 @@ async def scrape_channel(client, channel_url):
             'status': 'error',
             'error': str(e)
         }
+    finally:
+        if owns_media_pool:
+            await media_pool.close()
+        if channel_lock is not None:
+            channel_lock.close()
+
+async def scrape_channels(client, channel_urls, checkpoint_store=None, rate_limiter=None,
+                          concurrency=SCRAPER_CONCURRENCY, media_cache=None):
+    """Scrapes several channels concurrently, sharing one request budget.
+
+    At most `concurrency` channels are in flight at once. A channel that hits a
+    flood wait is retried (up to MAX_CHANNEL_ATTEMPTS times) once the limiter
+    lets requests through again. Results are returned in `channel_urls` order.
+    """
+    if rate_limiter is None:
+        rate_limiter = TokenBucket()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_channel(channel_url, media_pool):
+        async with semaphore:
+            for attempt in range(1, MAX_CHANNEL_ATTEMPTS + 1):
+                logger.info(f"Starting scrape for {channel_url} (attempt {attempt})...")
+                result = await scrape_channel(client, channel_url, checkpoint_store=checkpoint_store,
+                                              rate_limiter=rate_limiter, media_pool=media_pool)
+                if result['status'] != 'flood_wait':
+                    break
+            logger.info(f"Finished scraping {channel_url} with status '{result['status']}'.")
+            return result
+
+    # One download pool for all channels keeps the number of parallel downloads bounded
+    download = partial(download_media, client, rate_limiter=rate_limiter, media_cache=media_cache)
+    async with MediaDownloadPool(download, rate_limiter=rate_limiter) as media_pool:
+        return await asyncio.gather(*(run_channel(channel_url, media_pool) for channel_url in channel_urls))
+
+def create_client():
+    """A TelegramClient on TELEGRAM_SESSION_STRING if set, otherwise on the session file."""
+    if SESSION_STRING:
+        session = StringSession(SESSION_STRING)
+    else:
+        # The session file will be created/accessed in the working directory
+        session = os.path.join(os.getcwd(), SESSION_NAME)
+    client = TelegramClient(session, API_ID, API_HASH)
+    # Surface every flood wait to our limiter instead of letting Telethon sleep on it silently
+    client.flood_sleep_threshold = 0
+    return client
+
+async def scrape_channel_range(channel_url, start, end, checkpoint_store=None, rate_limiter=None, media_cache=None):
+    """Connects, scrapes `channel_url` for messages posted in [start, end) and disconnects.
+
+    Non-interactive: the session must already be authorized (run `main` once to log in).
+    Used by the Dagster assets, one channel and day per call. With a `checkpoint_store`,
+    the scrape resumes after the last message saved for that window.
+    """
+    if not API_ID or not API_HASH:
+        raise RuntimeError("TELEGRAM_API_ID and TELEGRAM_API_HASH must be set")
+    client = create_client()
+    # connect() rather than `async with`/start(), which would prompt for a login
+    await client.connect()
+    try:
+        if not await client.is_user_authorized():
+            raise RuntimeError("Telegram session is not authorized; log in with telegram_scraper.py first")
+        return await scrape_channel(client, channel_url, checkpoint_store=checkpoint_store,
+                                    rate_limiter=rate_limiter, media_cache=media_cache, date_range=(start, end))
+    finally:
+        await client.disconnect()
 
 async def main():
     """Main function to run the scraping process for all channels."""
@@ -263,13 +597,12 @@ async def main():
         logger.error("TELEGRAM_API_ID or TELEGRAM_API_HASH environment variables are not set. Please check your .env file.")
         return
 
-    # Use os.path.join for the session file path, relative to where the script runs,
-    # or better, mount a volume for it in Docker.
-    # The session file will be created/accessed in the root of your project
-    # if you run this from (venv) D:\Project\telegram_data_pipeline>
-    session_file_path = os.path.join(os.getcwd(), SESSION_NAME) # This will create .session in D:\Project\telegram_data_pipeline\
-
-    client = TelegramClient(session_file_path, API_ID, API_HASH)
+    # The session file is relative to where the script runs; better, mount a volume
+    # for it in Docker (or use TELEGRAM_SESSION_STRING).
+    client = create_client()
+    checkpoint_store = get_checkpoint_store()
+    rate_limiter = TokenBucket()
+    media_cache = get_media_cache()
 
     try:
         logger.info("Connecting to Telegram...")
@@ -296,20 +629,16 @@ async def main():
 
             logger.info("Successfully authorized.")
 
-            results = []
-            for channel_url in TELEGRAM_CHANNELS:
-                logger.info(f"Starting scrape for {channel_url}...")
-                result = await scrape_channel(client, channel_url)
-                results.append(result)
-                
-                # Introduce a significant, random delay between processing different channels
-                delay_between_channels = random.uniform(MIN_CHANNEL_DELAY_SECONDS, MAX_CHANNEL_DELAY_SECONDS)
-                logger.info(f"Finished scraping {channel_url}. Waiting for {delay_between_channels:.2f} seconds before next channel.")
-                await asyncio.sleep(delay_between_channels) 
+            results = await scrape_channels(client, TELEGRAM_CHANNELS, checkpoint_store=checkpoint_store,
+                                            rate_limiter=rate_limiter, media_cache=media_cache)
 
             logger.info("\n--- Scraping Summary ---")
             for res in results:
                 logger.info(f"Channel: {res.get('channel_title', res.get('channel_url'))} - Status: {res['status']} - Messages: {res.get('messages_count', 0)} - Images: {res.get('images_downloaded_count', 0)}")
+            logger.info(f"Flood waits: {rate_limiter.flood_wait_count} ({rate_limiter.flood_wait_seconds:.0f}s total). Final request rate: {rate_limiter.rate:.3f} req/s")
+            if media_cache:
+                for kind, counters in media_cache.stats().items():
+                    logger.info(f"Media cache '{kind}': {counters['hits']} hits / {counters['misses']} misses ({counters['hit_rate']:.1%})")
 
     except PhoneNumberBannedError:
         # This will catch the re-raised error from scrape_channel and prevent the finally block
@@ -320,6 +649,10 @@ async def main():
     finally:
         # The `async with client:` block handles disconnection automatically.
         # This `finally` block is mostly for logging remaining cleanup if needed.
+        checkpoint_store.close()
+        if media_cache:
+            media_cache.close()
+        metrics.write_snapshot()
         logger.info("Scraping process concluded.")
 
 
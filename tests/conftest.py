@@ -0,0 +1,13 @@
+import os
+import sys
+
+# The pipeline scripts are run from their own directories and import their
+# siblings by module name, so mirror that layout on sys.path for the tests.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (
+    os.path.join(ROOT_DIR, 'src'),
+    os.path.join(ROOT_DIR, 'src', 'scraping'),
+    os.path.join(ROOT_DIR, 'src', 'app'),
+):
+    if path not in sys.path:
+        sys.path.insert(0, path)
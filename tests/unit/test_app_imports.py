@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('fastapi')
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'src', 'app')
+
+
+def test_api_imports_from_its_own_directory():
+    # As `uvicorn main2:app` run from src/app: nothing but the app's directory on sys.path
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+    env['DATABASE_URL'] = 'postgresql+psycopg2://api@localhost/api'
+    result = subprocess.run([sys.executable, '-c', 'import main2'], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
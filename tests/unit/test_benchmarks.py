@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('fastapi')
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_api_benchmark_runs_without_postgres(tmp_path):
+    env = {key: value for key, value in os.environ.items() if key not in ('BENCH_DATABASE_URL', 'DATABASE_URL')}
+    output = tmp_path / 'results.json'
+    result = subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'benchmarks', 'run_benchmarks.py'),
+                             '--smoke', 'api', '--output', str(output)],
+                            cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    api = json.loads(output.read_text())['results']['api']
+    assert api['database'] == 'sqlite'
+    assert api['search_fts']['queries_per_second'] > 0
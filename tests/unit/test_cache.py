@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip('fastapi')
+
+from cache import LocalCache, ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LocalCache(clock=clock)
+    cache.set('key', 'value', ex=10)
+    clock.now = 9.9
+    assert cache.get('key') == 'value'
+    clock.now = 10
+    assert cache.get('key') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LocalCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_invalidate_bumps_generation():
+    cache = ResponseCache(backend=LocalCache())
+    assert cache.generation() == 0
+    assert cache.invalidate() == 1
+    assert cache.generation() == 1
+
+
+def test_generation_survives_eviction():
+    cache = ResponseCache(backend=LocalCache(max_entries=1))
+    cache.invalidate()
+    cache.backend.set('a', 1)
+    cache.backend.set('b', 2)
+    assert cache.generation() == 1
@@ -0,0 +1,42 @@
+import pytest
+
+from checkpoint_store import JsonCheckpointStore, SQLiteCheckpointStore, get_checkpoint_store
+
+
+@pytest.fixture(params=['sqlite', 'json'])
+def store(request, tmp_path):
+    store = get_checkpoint_store(backend=request.param, state_path=str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_unknown_channel_starts_from_zero(store):
+    assert store.get('12345') == 0
+
+
+def test_checkpoint_only_moves_forward(store):
+    store.set('12345', 100, channel_title='Chemed')
+    store.set('12345', 40)
+    assert store.get('12345') == 100
+    store.set('12345', 250)
+    assert store.get('12345') == 250
+    assert store.all()['12345']['last_message_id'] == 250
+
+
+def test_reset_forgets_channel(store):
+    store.set('12345', 100)
+    store.reset('12345')
+    assert store.get('12345') == 0
+
+
+@pytest.mark.parametrize('store_class, file_name', [
+    (SQLiteCheckpointStore, 'checkpoints.sqlite'),
+    (JsonCheckpointStore, 'checkpoints.json'),
+])
+def test_checkpoint_survives_reopen(tmp_path, store_class, file_name):
+    path = str(tmp_path / file_name)
+    with store_class(path) as store:
+        store.set('12345', 77, channel_url='https://t.me/chemed_chem')
+    with store_class(path) as reopened:
+        assert reopened.get('12345') == 77
+        assert reopened.all()['12345']['channel_url'] == 'https://t.me/chemed_chem'
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'src', 'app')
+
+
+def test_sqlite_url_for_local_development():
+    # database.py builds its engine at import, so import it in a fresh interpreter
+    env = dict(os.environ, DATABASE_URL='sqlite://', DB_ASYNC='false')
+    code = 'import database; from sqlalchemy import text; print(database.SessionLocal().execute(text("SELECT 1")).scalar())'
+    result = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '1'
+
+
+def test_postgres_engines_get_pool_and_statement_timeout(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite://')  # For the module-level engine, if not imported yet
+    from database import engine_options
+
+    options = engine_options('postgresql+psycopg2://api@localhost/api')
+    assert options['connect_args']['options'].startswith('-c statement_timeout=')
+    assert 'pool_size' in options
+    assert 'server_settings' in engine_options('postgresql+asyncpg://api@localhost/api', is_async=True)['connect_args']
+    assert engine_options('sqlite:///dev.db') == {}
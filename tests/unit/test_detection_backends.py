@@ -0,0 +1,42 @@
+import numpy as np
+from PIL import Image
+
+from detection_backends import OnnxBackend, letterbox, letterbox_shape, non_max_suppression
+
+
+def test_non_max_suppression_keeps_the_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30]], dtype=np.float32)
+    scores = np.array([0.6, 0.9, 0.5], dtype=np.float32)
+    assert non_max_suppression(boxes, scores, iou_threshold=0.5).tolist() == [1, 2]
+    assert non_max_suppression(boxes, scores, iou_threshold=0.9).tolist() == [1, 0, 2]
+
+
+def test_letterbox_pads_a_batch_to_one_stride_aligned_shape():
+    landscape, portrait = Image.new('RGB', (1280, 960)), Image.new('RGB', (300, 400))
+    assert letterbox_shape([landscape], 640) == (480, 640)
+    shape = letterbox_shape([landscape, portrait], 640)
+    assert shape == (640, 640)
+    array, scale, padding = letterbox(landscape, 640, shape)
+    assert array.shape == (3, 640, 640)
+    assert scale == 0.5
+    assert padding == (0, 80)
+
+
+def test_postprocess_maps_boxes_back_to_normalized_image_coordinates():
+    backend = OnnxBackend.__new__(OnnxBackend)
+    backend.names = {0: 'pill', 1: 'box'}
+    # One anchor per column: cx, cy, w, h in letterboxed pixels, then class scores
+    prediction = np.array([
+        [320, 321, 100],
+        [320, 320, 100],
+        [64, 64, 20],
+        [48, 48, 20],
+        [0.9, 0.8, 0.1],
+        [0.1, 0.1, 0.2],
+    ], dtype=np.float32)
+    # A 1280x960 image at scale 0.5 in a 640x640 input, padded 80px top and bottom
+    detections = backend._postprocess(prediction, (1280, 960), 0.5, (0, 80))
+    assert len(detections) == 1  # The overlapping pill is suppressed, the third anchor is below threshold
+    assert detections[0]['class_name'] == 'pill'
+    assert detections[0]['confidence'] == np.float32(0.9)
+    assert np.allclose(detections[0]['bbox'], [0.5, 0.5, 0.1, 0.1])
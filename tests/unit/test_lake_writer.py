@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from lake_writer import (
+    IN_PROGRESS_SUFFIX,
+    NDJSONChunkWriter,
+    PartitionedLakeSink,
+    finalize_incomplete_chunks,
+    iter_ndjson,
+)
+
+
+def make_message(message_id, date='2024-05-01T10:00:00+00:00'):
+    return {'message_id': message_id, 'date': date, 'message_text': 'ፓራሲታሞል paracetamol'}
+
+
+def test_chunks_rotate_by_record_count(tmp_path):
+    with NDJSONChunkWriter(str(tmp_path), 'chemed', max_records=2) as writer:
+        for message_id in range(5):
+            writer.write(make_message(message_id))
+
+    assert [os.path.basename(path) for path in writer.completed_files] == [
+        'chemed_00001.ndjson', 'chemed_00002.ndjson', 'chemed_00003.ndjson'
+    ]
+    records = [record for path in writer.completed_files for record in iter_ndjson(path)]
+    assert [record['message_id'] for record in records] == list(range(5))
+    assert records[0]['message_text'] == 'ፓራሲታሞል paracetamol'
+
+
+def test_open_chunk_is_hidden_until_complete(tmp_path):
+    writer = NDJSONChunkWriter(str(tmp_path), 'chemed', max_bytes=10 ** 6)
+    writer.write(make_message(1))
+    writer.flush()
+    assert os.listdir(tmp_path) == [f'chemed_00001.ndjson{IN_PROGRESS_SUFFIX}']
+    writer.close()
+    assert os.listdir(tmp_path) == ['chemed_00001.ndjson']
+
+
+def test_sink_partitions_by_message_date(tmp_path):
+    with PartitionedLakeSink(str(tmp_path), 'chemed', 'run1') as sink:
+        sink.write(make_message(1, '2024-05-01T23:59:00+00:00'))
+        sink.write(make_message(2, '2024-05-02T00:01:00+00:00'))
+
+    assert sorted(os.path.relpath(path, tmp_path) for path in sink.completed_files) == [
+        os.path.join('2024-05-01', 'chemed', 'chemed_2024-05-01_run1_00001.ndjson'),
+        os.path.join('2024-05-02', 'chemed', 'chemed_2024-05-02_run1_00001.ndjson'),
+    ]
+
+
+def test_finalize_drops_torn_trailing_line(tmp_path):
+    writer = NDJSONChunkWriter(str(tmp_path / '2024-05-01' / 'chemed'), 'chemed_2024-05-01_run1')
+    writer.write(make_message(1))
+    writer.write(make_message(2))
+    writer.flush()
+    # Simulate a crash in the middle of writing a line
+    with open(writer._path + IN_PROGRESS_SUFFIX, 'ab') as f:
+        f.write(b'{"message_id": 3, "da')
+
+    recovered = finalize_incomplete_chunks(str(tmp_path), 'chemed')
+
+    assert recovered == [writer._path]
+    assert [record['message_id'] for record in iter_ndjson(writer._path)] == [1, 2]
+
+
+def test_parquet_sink_uses_hive_partitions(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from lake_writer import ParquetChunkWriter
+
+    with PartitionedLakeSink(str(tmp_path), 'chemed', 'run1', writer_class=ParquetChunkWriter,
+                             row_group_size=2) as sink:
+        for message_id in range(5):
+            record = make_message(message_id)
+            record['raw_message_json'] = {'id': message_id, '_': 'Message'}
+            sink.write(record)
+
+    [path] = sink.completed_files
+    assert os.path.relpath(path, tmp_path).startswith(os.path.join('channel=chemed', 'date=2024-05-01'))
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == 3
+    table = parquet_file.read(columns=['message_id', 'raw_message_json'])
+    assert table.column('message_id').to_pylist() == list(range(5))
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from media_cache import MediaCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MediaCache(path=str(tmp_path / 'media_cache.sqlite'))
+    yield cache
+    cache.close()
+
+
+def write_image(path, content=b'\xff\xd8fake jpeg'):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_duplicate_content_keeps_one_copy(cache, tmp_path):
+    first = write_image(tmp_path / 'a.jpg')
+    second = write_image(tmp_path / 'b.jpg')
+
+    assert cache.store_file(first, 'photo:1') == first
+    assert cache.store_file(second, 'photo:2') == first
+    assert not os.path.exists(second)
+    assert cache.lookup_media('photo:2') == first
+    assert cache.lookup_media('photo:3') is None
+
+
+def test_lookup_forgets_deleted_files(cache, tmp_path):
+    path = write_image(tmp_path / 'a.jpg')
+    cache.store_file(path, 'photo:1')
+    os.remove(path)
+    assert cache.lookup_media('photo:1') is None
+
+
+def test_detections_are_reused_and_counted(cache, tmp_path):
+    content_hash = cache.hash_for_path(write_image(tmp_path / 'a.jpg'))
+    assert cache.get_detections(content_hash) is None
+    cache.put_detections(content_hash, [{'class_name': 'bottle', 'confidence': 0.9}])
+    assert cache.get_detections(content_hash) == [{'class_name': 'bottle', 'confidence': 0.9}]
+    assert cache.stats()['detection'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+
+def test_detections_are_not_shared_across_models(cache, tmp_path):
+    content_hash = cache.hash_for_path(write_image(tmp_path / 'a.jpg'))
+    cache.put_detections(content_hash, [{'class_name': 'bottle'}], model='torch-640')
+    assert cache.get_detections(content_hash, model='onnx-int8-640') is None
+    assert cache.get_detections(content_hash, model='torch-640') == [{'class_name': 'bottle'}]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr('media_cache.EVICTION_CHECK_EVERY', 1)
+    with MediaCache(path=str(tmp_path / 'media_cache.sqlite'), max_entries=2) as cache:
+        for content_hash in ('a', 'b', 'c'):
+            cache.put_detections(content_hash, [])
+        assert cache.get_detections('a') is None
+        assert cache.get_detections('c') == []
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from scraping.metrics import Registry
+
+
+def test_counter_tracks_each_label_set():
+    registry = Registry()
+    messages = registry.counter('messages_total', 'Messages', ['channel'])
+    messages.inc(channel='a')
+    messages.inc(5, channel='a')
+    messages.inc(channel='b')
+    assert messages.value(channel='a') == 6
+    assert messages.value(channel='b') == 1
+    with pytest.raises(ValueError):
+        messages.inc(-1, channel='a')
+    with pytest.raises(ValueError):
+        messages.inc(route='a')
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = Registry()
+    assert registry.counter('x_total', 'X') is registry.counter('x_total', 'X')
+    with pytest.raises(ValueError):
+        registry.histogram('x_total', 'X')
+
+
+def test_histogram_buckets_and_quantiles():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1, 10))
+    for value in (0.05, 0.05, 0.5, 5, 50):
+        latency.observe(value)
+    state = latency.state()
+    assert state['count'] == 5
+    assert state['sum'] == pytest.approx(55.6)
+    assert state['counts'] == [2, 1, 1, 1]
+    assert latency.quantile(0.4) == 0.1
+    assert latency.quantile(0.6) == 1
+    assert latency.quantile(1.0) == 10  # Observations past the last bucket report its bound
+
+
+def test_render_uses_prometheus_text_format():
+    registry = Registry()
+    registry.counter('requests_total', 'Requests', ['route']).inc(route='/api/"x"')
+    registry.histogram('latency_seconds', 'Latency', buckets=(1,)).observe(0.5)
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/api/\\"x\\""} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in text
+    assert 'latency_seconds_count 1' in text
+
+
+def test_snapshot_round_trips_through_json(tmp_path):
+    registry = Registry()
+    registry.gauge('rate', 'Rate', ['channel']).set(12.5, channel='a')
+    with registry.histogram('batch_seconds', 'Batch', buckets=(1, 2)).time():
+        pass
+    path = registry.write_snapshot(str(tmp_path / 'metrics.json'))
+    with open(path) as f:
+        snapshot = json.load(f)
+    assert snapshot['rate{channel="a"}'] == 12.5
+    assert snapshot['batch_seconds_count'] == 1
+    assert snapshot['batch_seconds_p50'] == 1
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from rate_limiter import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock)
+    for _ in range(3):
+        assert bucket.delay_for() == 0
+        bucket._tokens -= 1
+    assert bucket.delay_for() == pytest.approx(0.5)
+    clock.now = 0.5
+    assert bucket.delay_for() == 0
+
+
+def test_flood_wait_pauses_and_lowers_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=5, min_rate=0.1, flood_rate_factor=0.5,
+                         recovery_interval=60, recovery_factor=2.0, clock=clock)
+    bucket.on_flood_wait(30)
+
+    assert bucket.rate == pytest.approx(0.5)
+    assert bucket.delay_for() == pytest.approx(30)
+    # No tokens accrue during the pause, so the first request after it waits one refill period
+    clock.now = 30
+    assert bucket.delay_for() == pytest.approx(2.0)
+    assert bucket.flood_wait_count == 1
+
+
+def test_rate_recovers_after_quiet_period_but_not_above_max():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=1, min_rate=0.1, flood_rate_factor=0.25,
+                         recovery_interval=10, recovery_factor=2.0, clock=clock)
+    bucket.on_flood_wait(5)
+    assert bucket.rate == pytest.approx(0.25)
+
+    clock.now = 15
+    bucket.delay_for()
+    assert bucket.rate == pytest.approx(0.5)
+    clock.now = 100
+    bucket.delay_for()
+    clock.now = 200
+    bucket.delay_for()
+    assert bucket.rate == pytest.approx(1.0)
+
+
+def test_rate_never_drops_below_minimum():
+    bucket = TokenBucket(rate=1.0, capacity=1, min_rate=0.2, flood_rate_factor=0.1, clock=FakeClock())
+    bucket.on_flood_wait(1)
+    bucket.on_flood_wait(1)
+    assert bucket.rate == pytest.approx(0.2)
+
+
+def test_acquire_waits_for_tokens():
+    async def run():
+        bucket = TokenBucket(rate=50.0, capacity=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(3):
+            await bucket.acquire()
+        return loop.time() - start
+
+    assert asyncio.run(run()) >= 0.035
@@ -0,0 +1,57 @@
+import json
+import os
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+import raw_loader
+
+# The loader merges into the fixed raw.* schema, so these tests only run against a
+# disposable database: TEST_DATABASE_URL=postgresql://... pytest tests/unit
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason='TEST_DATABASE_URL is not set')
+
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    raw_loader.ensure_tables(conn)
+    yield conn
+    conn.rollback()
+    conn.close()
+
+
+@pytest.fixture
+def channel(conn):
+    channel = f'test_{uuid.uuid4().hex[:12]}'
+    yield channel
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM raw.telegram_messages WHERE channel = %s", (channel,))
+        cur.execute("DELETE FROM raw.loaded_files WHERE file_path LIKE %s", (f'%{channel}%',))
+    conn.commit()
+
+
+def write_chunk(directory, name, **media):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    record = {'message_id': 1, 'date': '2024-05-01T10:00:00+00:00', 'message_text': 'paracetamol',
+              'media_present': True, 'media_type': 'photo', **media}
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+    return path
+
+
+def test_rescrape_keeps_downloaded_media(conn, channel, tmp_path):
+    directory = str(tmp_path / '2024-05-01' / channel)
+    downloaded = write_chunk(directory, 'first.ndjson', media_status='downloaded',
+                             media_file_path='/lake/images/1.jpg')
+    rescraped = write_chunk(directory, 'second.ndjson', media_status='pending', media_file_path=None)
+
+    raw_loader.load_file(conn, 'messages', downloaded)
+    raw_loader.load_file(conn, 'messages', rescraped)
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT media_status, media_path FROM raw.telegram_messages WHERE channel = %s", (channel,))
+        assert cur.fetchone() == ('downloaded', '/lake/images/1.jpg')
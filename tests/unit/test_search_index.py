@@ -0,0 +1,23 @@
+from search_index import InvertedIndex
+
+
+def build_index():
+    index = InvertedIndex()
+    index.add('a', 'Paracetamol 500mg tablets in stock', 'a')
+    index.add('b', 'Amoxicillin and paracetamol, paracetamol syrup', 'b')
+    index.add('c', 'Insulin pens available', 'c')
+    return index
+
+
+def test_all_terms_must_match():
+    index = build_index()
+    assert [key for _, key, _ in index.search('paracetamol syrup')] == ['b']
+    assert index.search('paracetamol aspirin') == []
+
+
+def test_results_are_ranked_and_paged():
+    index = build_index()
+    first = index.search('PARACETAMOL', limit=1)
+    assert [key for _, key, _ in first] == ['b']
+    rank, key, _ = first[0]
+    assert [key for _, key, _ in index.search('paracetamol', limit=1, after=(rank, key))] == ['a']